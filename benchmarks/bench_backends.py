@@ -0,0 +1,57 @@
+# benchmarks/bench_backends.py
+#
+# Compares inference backends: startup time, single-request latency and
+# throughput under concurrent load through the batching scheduler. The "tiny"
+# backend runs fully offline; "cpu-int8" needs a merged snapshot (or any local
+# model directory passed with --model) and "peft" needs a GPU.
+
+import argparse
+import time
+
+from benchmarks.bench_generation import DETAILS, EVENTS, _run
+from src.generation_scheduler import GenerationScheduler
+from src.inference_backends import BACKENDS, CpuInt8Backend, get_backend
+from src.llm import format_instruction
+
+
+def _bench_backend(backend, prompts: list[str], concurrency: int, max_new_tokens: int) -> dict:
+    timings = {}
+    start = time.perf_counter()
+    model, tokenizer = backend.load(timings)
+    load_s = time.perf_counter() - start
+    # A fixed token count keeps backends comparable; decoding otherwise follows the backend.
+    generate_kwargs = dict(backend.generate_kwargs, max_new_tokens=max_new_tokens, min_new_tokens=max_new_tokens)
+
+    results = {"load_s": load_s}
+    for label, batch_size, workers in (("single", 1, 1), ("concurrent", None, concurrency)):
+        scheduler = GenerationScheduler(model, tokenizer, max_batch_size=batch_size, generate_kwargs=generate_kwargs)
+        results[label] = _run(scheduler, prompts, workers)
+        scheduler.close()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark latency and throughput of each inference backend.")
+    parser.add_argument("--backends", default="tiny", help=f"Comma-separated, from: {', '.join(BACKENDS)}.")
+    parser.add_argument("--model", default=None, help="Model directory for cpu-int8 (default: the merged snapshot).")
+    parser.add_argument("--threads", type=int, default=None, help="Torch threads for cpu-int8.")
+    parser.add_argument("--requests", type=int, default=16)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--max-new-tokens", type=int, default=64)
+    args = parser.parse_args()
+
+    prompts = [
+        format_instruction(DETAILS[i % len(DETAILS)], EVENTS[i % len(EVENTS)]) for i in range(args.requests)
+    ]
+
+    print(f"{'backend':>9} {'load s':>7} {'p50 ms':>9} {'p95 ms':>9} {'req/s':>8} {'tok/s':>9} {'c-p95 ms':>9}")
+    for name in args.backends.split(","):
+        backend = CpuInt8Backend(args.model, args.threads) if name == CpuInt8Backend.name else get_backend(name)
+        result = _bench_backend(backend, prompts, args.concurrency, args.max_new_tokens)
+        single, concurrent = result["single"], result["concurrent"]
+        print(f"{name:>9} {result['load_s']:>7.1f} {single['p50_ms']:>9.1f} {single['p95_ms']:>9.1f} "
+              f"{concurrent['throughput_rps']:>8.2f} {concurrent['tokens_per_s']:>9.1f} {concurrent['p95_ms']:>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,334 @@
+# benchmarks/bench_end_to_end.py
+#
+# End-to-end latency benchmark. Drives the real handlers registered by
+# run_bot() through a fake Telegram transport, with local stand-ins for
+# everything outside this process:
+#   - a local HTTP server serving synthetic product images,
+#   - the offline "identity" translation backend,
+#   - an inference backend (default: the tiny offline LM),
+#   - a small generated catalog built through build_database().
+# Concurrent virtual users replay search and outfit conversations; the script
+# reports p50/p95/p99 and throughput per stage and per request, and writes them
+# to a JSON file so runs can be compared across commits.
+#
+# The sentence embedder is the real one (config.EMBEDDING_MODEL_NAME); pass
+# --embedding-model with a local directory to run without network access.
+# The tiny LM writes the same five outfits for every prompt, so outfit
+# selection runs too; use a real model (e.g. --llm-backend cpu-int8) for
+# realistic generation lengths.
+
+import argparse
+import io
+import json
+import os
+import random
+import subprocess
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+
+import numpy as np
+import pandas as pd
+from PIL import Image
+
+from src import config
+
+COLORS = ["white", "black", "navy", "beige", "grey", "olive", "burgundy", "camel"]
+MATERIALS = ["linen", "cotton", "silk", "wool", "denim", "leather"]
+GARMENTS = ["shirt", "blouse", "t-shirt", "sweater", "blazer", "jeans", "trousers", "skirt",
+            "chinos", "sneakers", "loafers", "boots", "dress", "coat", "scarf", "bag"]
+DETAILS = [
+    "pear-shaped body, 165cm, minimal style, neutral colors",
+    "athletic build, 180cm, sporty and casual, dark colors",
+    "petite, 155cm, romantic style, pastel colors",
+    "broad shoulders, 175cm, classic style, earth tones",
+]
+
+# Texts the bot sends at the end of each step (see src/bot.py)
+BUSY = "سرور در حال حاضر بسیار شلوغ"
+SEARCH_DONE = ("چه کار دیگری", BUSY)
+OUTFITS_DONE = ("چند پیشنهاد برای شما آماده شد", "متاسفانه", BUSY)
+SELECTION_DONE = "امیدوارم مفید بوده باشد"
+
+
+# --- Stage timing ---
+class StageRecorder:
+    """Collects wall-clock durations per named stage from any thread."""
+
+    def __init__(self):
+        self.samples = {}
+        self._lock = threading.Lock()
+
+    def record(self, name: str, seconds: float):
+        with self._lock:
+            self.samples.setdefault(name, []).append(seconds)
+
+    def wrap(self, name: str, fn):
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                self.record(name, time.perf_counter() - start)
+        return timed
+
+    def summary(self, wall_time: float) -> dict:
+        result = {}
+        for name, samples in sorted(self.samples.items()):
+            ms = np.asarray(samples) * 1000
+            result[name] = {
+                "count": len(samples),
+                "p50_ms": float(np.percentile(ms, 50)),
+                "p95_ms": float(np.percentile(ms, 95)),
+                "p99_ms": float(np.percentile(ms, 99)),
+                "mean_ms": float(ms.mean()),
+                "throughput_per_s": len(samples) / wall_time,
+            }
+        return result
+
+
+# --- Local stand-ins ---
+def _synthetic_jpeg(name: str, size: int = 400) -> bytes:
+    rng = np.random.default_rng(abs(hash(name)) % 2**32)
+    gradient = np.linspace(0, 1, size, dtype=np.float32)[:, None, None]
+    pixels = (rng.integers(0, 256, 3) * gradient + rng.normal(0, 12, (size, size, 3))).clip(0, 255)
+    buffer = io.BytesIO()
+    Image.fromarray(pixels.astype(np.uint8)).save(buffer, "JPEG", quality=85)
+    return buffer.getvalue()
+
+
+def start_image_server(delay: float = 0.0) -> ThreadingHTTPServer:
+    """Serves a deterministic synthetic JPEG for every /img/<name>.jpg path."""
+    images = {}
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if delay:
+                time.sleep(delay)
+            body = images.get(self.path)
+            if body is None:
+                body = images.setdefault(self.path, _synthetic_jpeg(self.path))
+            self.send_response(200)
+            self.send_header("Content-Type", "image/jpeg")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def write_catalog(path: str, num_products: int, image_base: str, seed: int = 0):
+    """Writes a CSV catalog in the same shape as the real product data."""
+    rng = random.Random(seed)
+    rows = []
+    for i in range(num_products):
+        color, material, garment = rng.choice(COLORS), rng.choice(MATERIALS), rng.choice(GARMENTS)
+        gender = "Women" if i % 2 == 0 else "Men"
+        rows.append({
+            config.CATALOG_ID_COLUMN: f"p{i}",
+            "name": f"{color} {material} {garment}",
+            "description": f"A {color} {garment} made of {material} for {gender.lower()}.",
+            "gender": gender,
+            "price": rng.randint(10, 300),
+            "images": "~".join(f"{image_base}/img/{i}_{j}.jpg" for j in range(config.IMAGES_PER_PRODUCT)),
+        })
+    pd.DataFrame(rows).to_csv(path, index=False)
+
+
+def configure(workdir: str, args):
+    """Points every data path at `workdir` and selects the offline stand-ins."""
+    config.DATA_PATH = os.path.join(workdir, "catalog.csv")
+    config.DB_PERSIST_DIRECTORY = os.path.join(workdir, "db")
+    config.NUMPY_INDEX_DIR = os.path.join(workdir, "numpy_index")
+    config.THUMBNAIL_CACHE_DIR = os.path.join(workdir, "thumbnails")
+    config.SPRITE_STORE_DIR = os.path.join(workdir, "sprites")
+    config.TRANSLATION_CACHE_PATH = os.path.join(workdir, "translations.sqlite")
+    config.OUTFIT_CACHE_PATH = os.path.join(workdir, "outfit_cache.json")
+    config.STATE_DB_PATH = os.path.join(workdir, "chat_states.sqlite")
+    config.TRANSLATION_BACKEND = "identity"
+    config.RETRIEVAL_BACKEND = args.retrieval_backend
+    config.STATE_BACKEND = "memory"
+    # Never compete with a bot running on the same host for the metrics port.
+    config.METRICS_PORT = 0
+    if args.embedding_model:
+        config.EMBEDDING_MODEL_NAME = args.embedding_model
+    # Without caches every request exercises every stage.
+    config.SEARCH_CACHE_ENABLED = args.caches
+    config.THUMBNAIL_CACHE_ENABLED = args.caches
+    config.OUTFIT_CACHE_ENABLED = args.caches
+
+
+def instrument(recorder: StageRecorder, db, model):
+    """Wraps the functions behind each pipeline stage with timers."""
+    import src.bot as bot_module
+    import src.llm as llm
+    import src.retriever as retriever
+
+    translator = bot_module.translator
+    translator.translate_many = recorder.wrap("translation", translator.translate_many)
+    embeddings = retriever.get_embeddings()
+    embeddings.embed_query = recorder.wrap("embedding", embeddings.embed_query)
+    if hasattr(db, "search_rows"):
+        db.search_rows = recorder.wrap("vector_search", db.search_rows)
+        if hasattr(db, "_lexical_rows"):
+            db._lexical_rows = recorder.wrap("lexical_search", db._lexical_rows)
+    else:
+        db._Chroma__query_collection = recorder.wrap("vector_search", db._Chroma__query_collection)
+    retriever.fetch_image_rows = recorder.wrap("image_fetch", retriever.fetch_image_rows)
+    retriever.compose_grid = recorder.wrap("composition", retriever.compose_grid)
+    bot_module.encode_image = recorder.wrap("encoding", bot_module.encode_image)
+    model.generate = recorder.wrap("generation", model.generate)
+    llm._finalize_outfits = recorder.wrap("parsing", llm._finalize_outfits)
+
+
+# --- Workload ---
+def search_flow(bot, recorder: StageRecorder, chat_id: int, rng: random.Random):
+    bot.feed(chat_id, "🔍 جستجوی محصولات")
+    bot.expect(chat_id, "جنسیت")
+    bot.feed(chat_id, rng.choice(["زن", "مرد"]))
+    bot.expect(chat_id, "توضیحاتی")
+    query = f"{rng.choice(COLORS)} {rng.choice(MATERIALS)} {rng.choice(GARMENTS)}"
+    start = time.perf_counter()
+    bot.feed(chat_id, query)
+    done = bot.expect(chat_id, SEARCH_DONE)
+    recorder.record("rejected" if BUSY in done.text else "request_search", time.perf_counter() - start)
+
+
+def outfit_flow(bot, recorder: StageRecorder, chat_id: int, rng: random.Random):
+    bot.feed(chat_id, "👕 پیشنهاد لباس")
+    bot.expect(chat_id, "جنسیت")
+    bot.feed(chat_id, rng.choice(["زن", "مرد"]))
+    bot.expect(chat_id, "مشخصات خود")
+    bot.feed(chat_id, rng.choice(DETAILS))
+    bot.expect(chat_id, "نوع رویداد")
+    start = time.perf_counter()
+    bot.feed(chat_id, rng.choice(config.OUTFIT_EVENTS))
+    done = bot.expect(chat_id, OUTFITS_DONE)
+    if BUSY in done.text:
+        recorder.record("rejected", time.perf_counter() - start)
+        return
+    recorder.record("request_outfits", time.perf_counter() - start)
+    if done.text.startswith("چند پیشنهاد"):
+        start = time.perf_counter()
+        bot.feed(chat_id, "گزینه 1: ...")
+        bot.expect(chat_id, SELECTION_DONE)
+        recorder.record("request_outfit_selection", time.perf_counter() - start)
+
+
+def _git_commit() -> str | None:
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="End-to-end bot latency benchmark with local stand-ins.")
+    parser.add_argument("--products", type=int, default=200, help="Size of the generated catalog.")
+    parser.add_argument("--searches", type=int, default=40, help="Search conversations to replay.")
+    parser.add_argument("--outfits", type=int, default=8, help="Outfit conversations to replay.")
+    parser.add_argument("--concurrency", type=int, default=8, help="Virtual users running at the same time.")
+    parser.add_argument("--image-delay", type=float, default=0.0, help="Seconds the image server waits per image.")
+    parser.add_argument("--llm-backend", default="tiny", help="Inference backend for outfit generation.")
+    parser.add_argument("--retrieval-backend", choices=["chroma", "numpy", "hybrid"], default="chroma")
+    parser.add_argument("--embedding-model", default=None, help="Sentence embedder name or local directory.")
+    parser.add_argument("--caches", action="store_true", help="Keep the search, thumbnail and outfit caches on.")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="benchmarks/results/end_to_end.json")
+    args = parser.parse_args()
+
+    workdir = tempfile.TemporaryDirectory()
+    configure(workdir.name, args)
+    server = start_image_server(args.image_delay)
+    write_catalog(config.DATA_PATH, args.products, f"http://127.0.0.1:{server.server_port}", args.seed)
+
+    # Imported after configure(): these modules read paths and backends at import time.
+    from build_database import build_database
+    import src.bot as bot_module
+    from benchmarks.fake_telegram import FakeTeleBot
+    from src.llm import load_llm_and_tokenizer
+    from src.retriever import load_database
+
+    startup = {}
+    start = time.perf_counter()
+    build_database(rebuild=True, numpy_index=args.retrieval_backend == "numpy",
+                   hybrid_index=args.retrieval_backend == "hybrid")
+    startup["build_database_s"] = time.perf_counter() - start
+    start = time.perf_counter()
+    db = load_database()
+    startup["load_retriever_s"] = time.perf_counter() - start
+    start = time.perf_counter()
+    model, tokenizer = load_llm_and_tokenizer(args.llm_backend)
+    startup["load_llm_s"] = time.perf_counter() - start
+
+    recorder = StageRecorder()
+    instrument(recorder, db, model)
+    llm_future = ThreadPoolExecutor(max_workers=1).submit(lambda: (model, tokenizer))
+    bots = []
+
+    def make_bot(*args, **kwargs):
+        bots.append(FakeTeleBot(*args, **kwargs))
+        return bots[-1]
+
+    bot_module.telebot = SimpleNamespace(TeleBot=make_bot)
+    bot_thread = threading.Thread(target=bot_module.run_bot, args=(llm_future, db), daemon=True)
+    bot_thread.start()
+    while not bots or not bots[0].polling.wait(0.05):
+        if not bot_thread.is_alive():
+            raise RuntimeError("run_bot() exited before polling started; see its output above.")
+    bot = bots[0]
+
+    flows = [search_flow] * args.searches + [outfit_flow] * args.outfits
+    random.Random(args.seed).shuffle(flows)
+    errors = []
+
+    def run(i):
+        try:
+            flows[i](bot, recorder, 100000 + i, random.Random(args.seed * 7919 + i))
+        except Exception as e:
+            errors.append(repr(e))
+
+    print(f"Replaying {args.searches} searches and {args.outfits} outfit requests "
+          f"with {args.concurrency} concurrent users...")
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        list(pool.map(run, range(len(flows))))
+    wall_time = time.perf_counter() - start
+    bot.stop_polling()
+    server.shutdown()
+
+    results = {
+        "commit": _git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "settings": vars(args),
+        "startup": startup,
+        "wall_time_s": wall_time,
+        "uploads": {"count": len(bot.uploads), "mean_bytes": float(np.mean(bot.uploads)) if bot.uploads else 0.0},
+        "errors": errors,
+        "stages": recorder.summary(wall_time),
+    }
+    os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+    workdir.cleanup()
+
+    print(f"\n{'stage':<26} {'count':>6} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'per s':>8}")
+    for name, stats in results["stages"].items():
+        print(f"{name:<26} {stats['count']:>6} {stats['p50_ms']:>9.1f} {stats['p95_ms']:>9.1f} "
+              f"{stats['p99_ms']:>9.1f} {stats['throughput_per_s']:>8.2f}")
+    if errors:
+        print(f"{len(errors)} conversations failed, e.g. {errors[0]}")
+    print(f"Results written to {args.output}.")
+
+
+if __name__ == "__main__":
+    main()
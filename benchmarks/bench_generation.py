@@ -0,0 +1,76 @@
+# benchmarks/bench_generation.py
+#
+# Measures outfit-generation throughput and latency with and without the
+# batching scheduler. Uses an offline tiny random GPT-2 by default, or any
+# local model directory passed with --model.
+
+import argparse
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from src.generation_scheduler import GenerationScheduler
+from src.llm import format_instruction
+from src.tiny_lm import load_local_lm
+
+DETAILS = [
+    "pear-shaped body, 165cm, minimal style, neutral colors",
+    "athletic build, 180cm, sporty and casual, dark colors",
+    "petite, 155cm, romantic style, pastel colors",
+    "broad shoulders, 175cm, classic style, earth tones",
+]
+EVENTS = ["work", "friends party", "everyday use", "formal date"]
+
+
+def _run(scheduler: GenerationScheduler, prompts: list[str], concurrency: int) -> dict:
+    latencies = []
+
+    def one(prompt):
+        start = time.perf_counter()
+        scheduler.generate(prompt)
+        latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(one, prompts))
+    elapsed = time.perf_counter() - start
+    ms = np.asarray(latencies) * 1000
+    return {
+        "throughput_rps": len(prompts) / elapsed,
+        "tokens_per_s": scheduler.stats["generated_tokens"] / elapsed,
+        "p50_ms": float(np.percentile(ms, 50)),
+        "p95_ms": float(np.percentile(ms, 95)),
+        "avg_batch": scheduler.stats["requests"] / max(1, scheduler.stats["batches"]),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark batched vs. single-request generation.")
+    parser.add_argument("--model", default=None, help="Local model directory (default: offline tiny GPT-2).")
+    parser.add_argument("--requests", type=int, default=32)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--batch-sizes", default="1,4,8")
+    parser.add_argument("--max-wait", type=float, default=0.05)
+    parser.add_argument("--max-new-tokens", type=int, default=64)
+    args = parser.parse_args()
+
+    model, tokenizer = load_local_lm(args.model)
+    prompts = [
+        format_instruction(DETAILS[i % len(DETAILS)], EVENTS[i % len(EVENTS)]) for i in range(args.requests)
+    ]
+    generate_kwargs = dict(max_new_tokens=args.max_new_tokens, min_new_tokens=args.max_new_tokens, do_sample=False)
+
+    print(f"{'batch':>5} {'req/s':>8} {'tok/s':>9} {'p50 ms':>9} {'p95 ms':>9} {'avg batch':>9}")
+    for batch_size in (int(b) for b in args.batch_sizes.split(",")):
+        scheduler = GenerationScheduler(
+            model, tokenizer, max_batch_size=batch_size, max_wait=args.max_wait, generate_kwargs=generate_kwargs
+        )
+        result = _run(scheduler, prompts, args.concurrency)
+        scheduler.close()
+        print(f"{batch_size:>5} {result['throughput_rps']:>8.2f} {result['tokens_per_s']:>9.1f} "
+              f"{result['p50_ms']:>9.1f} {result['p95_ms']:>9.1f} {result['avg_batch']:>9.2f}")
+
+
+if __name__ == "__main__":
+    main()
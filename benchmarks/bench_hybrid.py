@@ -0,0 +1,106 @@
+# benchmarks/bench_hybrid.py
+#
+# Compares the hybrid (vector + BM25) index with the dense-only paths, Chroma's
+# similarity_search and exact NumPy search, on relevance and latency. The query
+# set is fixed (seeded) and derived from the catalog itself:
+#   - name:  a product's full name; the product itself should be found,
+#   - brand: the first and last word of a name (e.g. "roadster jeans"); every
+#            result should contain both words,
+#   - code:  a product id; the product itself should be found,
+#   - price: a product's name with a +-20% price range around it.
+# Query embeddings are computed once up front, so the timings cover retrieval
+# only. Run from the repository root after 'python build_database.py --hybrid-index'.
+
+import argparse
+import random
+import time
+
+import numpy as np
+
+from src import config
+from src.hybrid_index import load_hybrid_index, tokenize
+from src.retriever import get_embeddings, search_filter
+from langchain_community.vectorstores import Chroma
+
+
+def _query_set(index, count: int, seed: int) -> list[dict]:
+    rng = random.Random(seed)
+    rows = [rng.randrange(len(index)) for _ in range(count)]
+    c = index.columns
+    queries = []
+    for row in rows:
+        name, gender, price = str(c["name"][row]), str(c["gender"][row]), float(c["price"][row])
+        words = tokenize(name)
+        target = int(c["index_in_db"][row])
+        queries.append({"kind": "name", "text": name, "gender": gender, "target": target})
+        queries.append({"kind": "code", "text": str(c["ids"][row]), "gender": gender, "target": target})
+        queries.append({"kind": "price", "text": name, "gender": gender, "target": target,
+                        "price_range": (price * 0.8, price * 1.2)})
+        if len(words) > 1:
+            queries.append({"kind": "brand", "text": f"{words[0]} {words[-1]}", "gender": gender,
+                            "required": {words[0], words[-1]}})
+    return queries
+
+
+def _relevance(query: dict, found: list[int], names: dict, k: int) -> tuple[float, float]:
+    """(hit or precision @k, reciprocal rank) of one result list of product ids."""
+    if "target" in query:
+        rank = found.index(query["target"]) + 1 if query["target"] in found else 0
+        return float(0 < rank <= k), 1.0 / rank if rank else 0.0
+    relevant = [query["required"] <= set(tokenize(names[product])) for product in found[:k]]
+    first = relevant.index(True) + 1 if True in relevant else 0
+    return sum(relevant) / k, 1.0 / first if first else 0.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark hybrid retrieval against dense-only search.")
+    parser.add_argument("--products", type=int, default=100, help="Catalog products to derive queries from.")
+    parser.add_argument("--k", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--no-chroma", action="store_true", help="Skip the Chroma baseline.")
+    args = parser.parse_args()
+
+    embeddings = get_embeddings()
+    index = load_hybrid_index(embeddings)
+    names = dict(zip(index.columns["index_in_db"].tolist(), index.columns["name"].tolist()))
+    queries = _query_set(index, args.products, args.seed)
+    vectors = embeddings.embed_documents([q["text"] for q in queries])
+
+    def to_products(rows):
+        return [int(index.columns["index_in_db"][row]) for row in rows]
+
+    backends = {
+        "numpy (dense)": lambda q, v, where: to_products(index.search_rows(v, k=args.k, filter=where)),
+        "hybrid": lambda q, v, where: to_products(index.search_rows_hybrid(q["text"], v, k=args.k, filter=where)),
+    }
+    if not args.no_chroma:
+        chroma = Chroma(persist_directory=config.DB_PERSIST_DIRECTORY, embedding_function=embeddings)
+        backends = {
+            "chroma (dense)": lambda q, v, where: [
+                int(d.metadata["index_in_db"])
+                for d in chroma.similarity_search_by_vector(v, k=args.k, filter=where)
+            ],
+            **backends,
+        }
+
+    kinds = sorted({q["kind"] for q in queries})
+    print(f"Products: {len(index)}  terms: {len(index.vocab)}  queries: {len(queries)}  k: {args.k}")
+    print(f"{'backend':<15} {'kind':<6} {'hit/prec@k':>10} {'MRR':>6} {'p50 ms':>7} {'p95 ms':>7}")
+    for backend, search in backends.items():
+        by_kind = {kind: {"score": [], "rr": [], "seconds": []} for kind in kinds}
+        for query, vector in zip(queries, vectors):
+            where = search_filter(query["gender"], query.get("price_range"))
+            start = time.perf_counter()
+            found = search(query, vector, where)
+            by_kind[query["kind"]]["seconds"].append(time.perf_counter() - start)
+            score, rr = _relevance(query, found, names, args.k)
+            by_kind[query["kind"]]["score"].append(score)
+            by_kind[query["kind"]]["rr"].append(rr)
+        for kind, stats in by_kind.items():
+            ms = np.asarray(stats["seconds"]) * 1000
+            print(f"{backend:<15} {kind:<6} {np.mean(stats['score']):>10.3f} {np.mean(stats['rr']):>6.3f} "
+                  f"{np.percentile(ms, 50):>7.2f} {np.percentile(ms, 95):>7.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+# benchmarks/bench_numpy_index.py
+#
+# Compares the exact NumPy backend with Chroma's similarity_search(k=3, filter=...)
+# on latency and recall. Run from the repository root after
+# 'python build_database.py --numpy-index'.
+
+import argparse
+import random
+import time
+
+import numpy as np
+
+from src import config
+from src.numpy_index import load_numpy_index
+from langchain_community.vectorstores import Chroma
+from langchain_community.embeddings import HuggingFaceEmbeddings
+
+
+def _percentiles(samples: list[float]) -> str:
+    ms = np.asarray(samples) * 1000
+    return f"p50={np.percentile(ms, 50):.2f}ms p95={np.percentile(ms, 95):.2f}ms mean={ms.mean():.2f}ms"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the NumPy index against Chroma.")
+    parser.add_argument("--queries", type=int, default=200, help="Number of queries to run.")
+    parser.add_argument("--k", type=int, default=3)
+    parser.add_argument("--text", action="store_true",
+                        help="Embed product names as text queries instead of reusing stored vectors.")
+    args = parser.parse_args()
+
+    embedding_function = HuggingFaceEmbeddings(model_name=config.EMBEDDING_MODEL_NAME)
+    chroma = Chroma(persist_directory=config.DB_PERSIST_DIRECTORY, embedding_function=embedding_function)
+    index = load_numpy_index(embedding_function)
+
+    # Queries are either stored product vectors (isolates the vector lookup) or
+    # embedded product names (matches what the bot does).
+    rng = random.Random(0)
+    rows = [rng.randrange(len(index)) for _ in range(args.queries)]
+    genders = [str(index.columns["gender"][r]) for r in rows]
+    if args.text:
+        queries = embedding_function.embed_documents([str(index.columns["name"][r]) for r in rows])
+    else:
+        queries = [np.asarray(index.embeddings[r], dtype=np.float32).tolist() for r in rows]
+
+    chroma_times, numpy_times, hits = [], [], 0
+    for query, gender in zip(queries, genders):
+        search_filter = {"gender": gender}
+
+        start = time.perf_counter()
+        expected = chroma.similarity_search_by_vector(query, k=args.k, filter=search_filter)
+        chroma_times.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        found = index.similarity_search_by_vector(query, k=args.k, filter=search_filter)
+        numpy_times.append(time.perf_counter() - start)
+
+        expected_ids = {d.metadata.get("index_in_db") for d in expected}
+        hits += len(expected_ids & {d.metadata.get("index_in_db") for d in found})
+
+    print(f"Products: {len(index)}  dtype: {index.embeddings.dtype}  queries: {args.queries}  k: {args.k}")
+    print(f"Chroma : {_percentiles(chroma_times)}")
+    print(f"NumPy  : {_percentiles(numpy_times)}")
+    print(f"Recall@{args.k} of NumPy vs Chroma: {hits / (args.k * args.queries):.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+# benchmarks/bench_outfit_linking.py
+#
+# Compares linking generated outfits to catalog products with one
+# find_products() call per outfit field against one batched
+# link_outfit_products() call, and against a single product search. Run from
+# the repository root after 'python build_database.py'.
+
+import argparse
+import random
+import time
+
+import numpy as np
+
+from src import config
+
+FIELDS = {
+    "Top": ["white linen shirt", "black silk blouse", "navy wool sweater", "beige cotton t-shirt", "grey blazer"],
+    "Bottom": ["dark blue jeans", "beige chinos", "black tailored trousers", "pleated midi skirt", "olive cargo pants"],
+    "Shoes": ["white leather sneakers", "brown suede loafers", "black ankle boots", "nude heels", "canvas sandals"],
+    "Accessories": ["leather watch", "woven belt", "silk scarf", "canvas tote bag", "gold necklace"],
+}
+
+
+def _outfits(rng: random.Random, count: int) -> list[dict]:
+    return [{field: rng.choice(values) for field, values in FIELDS.items()} for _ in range(count)]
+
+
+def _ms(samples: list[float]) -> str:
+    ms = np.asarray(samples) * 1000
+    return f"p50={np.percentile(ms, 50):.1f}ms p95={np.percentile(ms, 95):.1f}ms"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark batched outfit-to-product linking.")
+    parser.add_argument("--rounds", type=int, default=20)
+    parser.add_argument("--outfits", type=int, default=5, help="Outfits linked per round.")
+    parser.add_argument("--gender", default="Women")
+    args = parser.parse_args()
+
+    # Every round must reach the embedder and the vector store.
+    config.SEARCH_CACHE_ENABLED = False
+    from src.retriever import find_products, link_outfit_products, load_database
+    db = load_database()
+    rng = random.Random(0)
+    link_outfit_products(_outfits(rng, 1), args.gender, db)  # Warm-up
+
+    single, sequential, batched = [], [], []
+    for _ in range(args.rounds):
+        outfits = _outfits(rng, args.outfits)
+
+        start = time.perf_counter()
+        find_products(outfits[0]["Top"], args.gender, db)
+        single.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        for outfit in outfits:
+            for value in outfit.values():
+                find_products(value, args.gender, db)
+        sequential.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        link_outfit_products(outfits, args.gender, db)
+        batched.append(time.perf_counter() - start)
+
+    queries = args.outfits * len(FIELDS)
+    print(f"\nSingle search:             {_ms(single)}")
+    print(f"{queries} sequential searches:   {_ms(sequential)}")
+    print(f"Batched linking ({queries} items): {_ms(batched)}")
+
+
+if __name__ == "__main__":
+    main()
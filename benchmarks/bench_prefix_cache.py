@@ -0,0 +1,59 @@
+# benchmarks/bench_prefix_cache.py
+#
+# Compares time-to-first-token with and without the cached stylist-instruction
+# prefix. Uses an offline tiny random GPT-2 by default, or any local model
+# directory passed with --model.
+
+import argparse
+import time
+
+import numpy as np
+import torch
+
+from src.llm import STYLIST_INSTRUCTION, format_instruction
+from src.prefix_cache import PrefixCache
+from src.tiny_lm import load_local_lm
+from benchmarks.bench_generation import DETAILS, EVENTS
+
+
+def _time_first_token(model, tokenizer, make_inputs, prompts: list[str], repeats: int) -> np.ndarray:
+    samples = []
+    for _ in range(repeats):
+        for prompt in prompts:
+            start = time.perf_counter()
+            inputs = make_inputs(prompt)
+            with torch.inference_mode():
+                model.generate(**inputs, max_new_tokens=1, do_sample=False, pad_token_id=tokenizer.pad_token_id)
+            samples.append(time.perf_counter() - start)
+    return np.asarray(samples) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark time-to-first-token with the prefix KV cache.")
+    parser.add_argument("--model", default=None, help="Local model directory (default: offline tiny GPT-2).")
+    parser.add_argument("--repeats", type=int, default=10)
+    args = parser.parse_args()
+
+    model, tokenizer = load_local_lm(args.model)
+    if tokenizer.pad_token_id is None:
+        tokenizer.pad_token = tokenizer.eos_token
+    prompts = [format_instruction(d, e) for d, e in zip(DETAILS, EVENTS)]
+
+    start = time.perf_counter()
+    prefix_cache = PrefixCache(model, tokenizer, STYLIST_INSTRUCTION)
+    build_ms = (time.perf_counter() - start) * 1000
+
+    plain = _time_first_token(
+        model, tokenizer, lambda p: tokenizer(p, return_tensors="pt").to(model.device), prompts, args.repeats
+    )
+    cached = _time_first_token(
+        model, tokenizer, lambda p: prefix_cache.prepare_inputs([p]), prompts, args.repeats
+    )
+
+    print(f"Prefix tokens cached: {prefix_cache.prefix_length} (built once in {build_ms:.1f} ms)")
+    for name, ms in (("without cache", plain), ("with cache", cached)):
+        print(f"TTFT {name:>13}: p50={np.percentile(ms, 50):.2f}ms p95={np.percentile(ms, 95):.2f}ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+# benchmarks/bench_state_store.py
+#
+# Long-running load test of the conversation-state store. Waves of synthetic
+# chats walk through the outfit flow; most abandon it halfway, leaving parsed
+# outfits behind. Memory (and the SQLite file size) should level off once the
+# store reaches its max-entries bound instead of growing with every new chat.
+
+import argparse
+import os
+import random
+import tempfile
+import time
+import tracemalloc
+
+from src.state_store import MemoryStateStore, SQLiteStateStore
+
+OUTFIT = {
+    "Top": "white linen shirt with rolled sleeves",
+    "Bottom": "beige tailored chinos",
+    "Shoes": "brown suede loafers",
+    "Accessories": "leather watch and a woven belt",
+}
+
+
+def _chat_flow(store, chat_id: int, rng: random.Random):
+    store.set(chat_id, {"step": "awaiting_outfit_gender"})
+    store.update(chat_id, gender="زن", step="awaiting_outfit_details")
+    store.update(chat_id, details="petite, 155cm, romantic style, pastel colors", step="awaiting_outfit_event")
+    store.update(chat_id, step="generating_outfits")
+    store.set_if_step(chat_id, "generating_outfits", {"outfits": [OUTFIT] * 5, "step": "awaiting_outfit_selection"})
+    if rng.random() < 0.2:
+        # Only a few users pick an option; the rest abandon the chat here.
+        store.step(chat_id)
+        store.get(chat_id)
+        store.clear(chat_id)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load-test the conversation-state store.")
+    parser.add_argument("--backend", choices=["memory", "sqlite"], default="memory")
+    parser.add_argument("--rounds", type=int, default=10)
+    parser.add_argument("--chats-per-round", type=int, default=5000)
+    parser.add_argument("--max-entries", type=int, default=10000)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    tmp = tempfile.TemporaryDirectory()
+    db_path = os.path.join(tmp.name, "states.sqlite")
+    if args.backend == "sqlite":
+        store = SQLiteStateStore(db_path, max_entries=args.max_entries)
+    else:
+        store = MemoryStateStore(max_entries=args.max_entries)
+
+    tracemalloc.start()
+    print(f"{'round':>5} {'chats':>8} {'entries':>8} {'heap KiB':>9} {'db KiB':>8} {'ops/s':>9}")
+    next_chat = 0
+    for round_number in range(1, args.rounds + 1):
+        start = time.perf_counter()
+        for _ in range(args.chats_per_round):
+            _chat_flow(store, next_chat, rng)
+            next_chat += 1
+        ops_per_s = args.chats_per_round * 6 / (time.perf_counter() - start)
+        heap_kib = tracemalloc.get_traced_memory()[0] / 1024
+        db_kib = os.path.getsize(db_path) / 1024 if os.path.exists(db_path) else 0
+        print(f"{round_number:>5} {next_chat:>8} {len(store):>8} {heap_kib:>9.0f} {db_kib:>8.0f} {ops_per_s:>9.0f}")
+    tmp.cleanup()
+
+
+if __name__ == "__main__":
+    main()
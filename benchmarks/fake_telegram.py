@@ -0,0 +1,101 @@
+# benchmarks/fake_telegram.py
+#
+# In-process stand-in for telebot.TeleBot. Handlers registered by run_bot are
+# matched and run exactly like with threaded=False polling (one update at a
+# time, first matching handler wins); outgoing messages are queued per chat so
+# a benchmark driver can wait for the replies it expects.
+
+import itertools
+import queue
+import threading
+import time
+from collections import defaultdict
+from types import SimpleNamespace
+
+
+class FakeTeleBot:
+    """Implements the subset of the TeleBot API that src/bot.py uses."""
+
+    def __init__(self, token=None, parse_mode=None, threaded=True):
+        self.handlers = []  # (commands, func, handler)
+        self._updates = queue.Queue()
+        self._outboxes = defaultdict(queue.Queue)
+        self._outbox_lock = threading.Lock()
+        self._file_ids = itertools.count(1)
+        self.uploads = []  # Sizes in bytes of uploaded photos
+        self.polling = threading.Event()
+
+    # --- Registration (same decorator signature as TeleBot) ---
+    def message_handler(self, commands=None, func=None, **kwargs):
+        def register(handler):
+            self.handlers.append((commands, func, handler))
+            return handler
+        return register
+
+    # --- Outgoing ---
+    def _outbox(self, chat_id) -> queue.Queue:
+        with self._outbox_lock:
+            return self._outboxes[chat_id]
+
+    def send_message(self, chat_id, text, reply_markup=None, **kwargs):
+        message = SimpleNamespace(kind="text", text=text, reply_markup=reply_markup, sent_at=time.perf_counter())
+        self._outbox(chat_id).put(message)
+        return message
+
+    def send_photo(self, chat_id, photo, caption=None, **kwargs):
+        if isinstance(photo, str):
+            file_id = photo
+        else:
+            self.uploads.append(len(photo.getvalue()))
+            file_id = f"file-{next(self._file_ids)}"
+        message = SimpleNamespace(
+            kind="photo", text=caption or "", photo=[SimpleNamespace(file_id=file_id)], sent_at=time.perf_counter()
+        )
+        self._outbox(chat_id).put(message)
+        return message
+
+    # --- Incoming ---
+    def feed(self, chat_id: int, text: str):
+        """Queues a user message, as if it arrived from Telegram."""
+        self._updates.put(SimpleNamespace(chat=SimpleNamespace(id=chat_id), text=text))
+
+    def _matches(self, commands, func, message) -> bool:
+        if commands is not None:
+            if not message.text.startswith("/") or message.text[1:].split()[0] not in commands:
+                return False
+        return func is None or func(message)
+
+    def infinity_polling(self, **kwargs):
+        """Runs handlers for fed messages until stop_polling() is called."""
+        self.polling.set()
+        while True:
+            message = self._updates.get()
+            if message is None:
+                return
+            for commands, func, handler in self.handlers:
+                if self._matches(commands, func, message):
+                    try:
+                        handler(message)
+                    except Exception as e:
+                        print(f"Handler {handler.__name__} failed: {e}")
+                    break
+
+    def stop_polling(self):
+        self._updates.put(None)
+
+    # --- Driver helpers ---
+    def expect(self, chat_id: int, markers, timeout: float = 120.0):
+        """Waits for the next message to `chat_id` containing one of `markers`, skipping others."""
+        markers = (markers,) if isinstance(markers, str) else tuple(markers)
+        outbox = self._outbox(chat_id)
+        deadline = time.monotonic() + timeout
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise TimeoutError(f"Chat {chat_id} got no message containing {markers} within {timeout}s.")
+            try:
+                message = outbox.get(timeout=remaining)
+            except queue.Empty:
+                continue
+            if any(marker in message.text for marker in markers):
+                return message
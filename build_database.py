@@ -1,59 +1,197 @@
 # build_database.py
 
 import os
+import json
 import shutil
-import pandas as pd
+import argparse
 from src import config
+from src.ingest import iter_catalog_batches
+from src.chroma_utils import update_metadatas
 from langchain_community.vectorstores import Chroma
 from langchain_community.embeddings import HuggingFaceEmbeddings
 
-def build_database():
+CHECKPOINT_FILE = os.path.join(config.DB_PERSIST_DIRECTORY, "ingest_checkpoint.json")
+
+
+def _source_signature(path: str) -> dict:
+    st = os.stat(path)
+    return {"path": path, "size": st.st_size, "mtime": st.st_mtime}
+
+
+def _read_checkpoint() -> dict:
+    try:
+        with open(CHECKPOINT_FILE, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _write_checkpoint(checkpoint: dict):
+    os.makedirs(config.DB_PERSIST_DIRECTORY, exist_ok=True)
+    tmp_path = f"{CHECKPOINT_FILE}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(checkpoint, f, indent=2)
+    os.replace(tmp_path, CHECKPOINT_FILE)
+
+
+def _full_build(embedding_function, checkpoint: dict) -> tuple[list[str], list[str]]:
     """
-    Reads the source CSV, creates vector embeddings, and persists them to ChromaDB.
+    Deletes any existing database and embeds every row from scratch. Returns the
+    product ids and `images` fields of all rows.
     """
-    # 1. Clean up old database if it exists
     if os.path.exists(config.DB_PERSIST_DIRECTORY):
         print("Found old database. Deleting it to rebuild...")
         shutil.rmtree(config.DB_PERSIST_DIRECTORY)
 
-    # 2. Load the source data
+    print("Creating embeddings and building the database. This may take a few minutes...")
+    db = Chroma(persist_directory=config.DB_PERSIST_DIRECTORY, embedding_function=embedding_function)
+    _write_checkpoint(checkpoint)
+    ids, images = [], []
+    for batch in iter_catalog_batches(config.DATA_PATH):
+        db.add_texts(texts=batch.docs, metadatas=batch.metadatas, ids=batch.ids)
+        ids.extend(batch.ids)
+        images.extend(m["images"] for m in batch.metadatas)
+        print(f"Embedded {len(images)} rows...")
+    return ids, images
+
+
+def _incremental_build(embedding_function, checkpoint: dict) -> tuple[list[str], list[str]]:
+    """
+    Diffs the catalog against the persisted collection by row hash, then embeds
+    only new or changed rows, updates moved rows' metadata in place and deletes
+    rows that disappeared. Every batch is persisted as soon as it is written.
+    Resuming is hash-based: re-running after an interruption finds the rows that
+    were already saved unchanged and only embeds the rest.
+    """
+    db = Chroma(persist_directory=config.DB_PERSIST_DIRECTORY, embedding_function=embedding_function)
+    existing = db.get(include=["metadatas"])
+    stored = {
+        doc_id: (meta or {})
+        for doc_id, meta in zip(existing["ids"], existing["metadatas"])
+    }
+
+    seen = set()
+    ids, images = [], []
+    counts = {"embedded": 0, "moved": 0, "unchanged": 0}
+    # Marks the build as started (not completed) until it finishes.
+    _write_checkpoint(checkpoint)
+    for batch in iter_catalog_batches(config.DATA_PATH):
+        to_embed, to_relocate = [], []
+        for i, doc_id in enumerate(batch.ids):
+            seen.add(doc_id)
+            old = stored.get(doc_id)
+            if old is None or old.get("row_hash") != batch.metadatas[i]["row_hash"]:
+                to_embed.append(i)
+            elif (old.get("index_in_db") != batch.metadatas[i]["index_in_db"]
+                  or old.get("product_id") != batch.metadatas[i]["product_id"]):
+                # Same content at a new position (or stored before product ids
+                # were kept in the metadata): only the metadata has to change.
+                to_relocate.append(i)
+        ids.extend(batch.ids)
+        images.extend(m["images"] for m in batch.metadatas)
+
+        if to_relocate:
+            update_metadatas(
+                db,
+                ids=[batch.ids[i] for i in to_relocate],
+                metadatas=[batch.metadatas[i] for i in to_relocate],
+            )
+        if to_embed:
+            batch_ids = [batch.ids[i] for i in to_embed]
+            # Drop stale versions first; add_texts does not overwrite existing ids.
+            stale = [doc_id for doc_id in batch_ids if doc_id in stored]
+            if stale:
+                db.delete(ids=stale)
+            db.add_texts(
+                texts=[batch.docs[i] for i in to_embed],
+                metadatas=[batch.metadatas[i] for i in to_embed],
+                ids=batch_ids,
+            )
+        counts["embedded"] += len(to_embed)
+        counts["moved"] += len(to_relocate)
+        counts["unchanged"] += len(batch.ids) - len(to_embed) - len(to_relocate)
+        print(f"Processed {len(images)} rows ({counts['embedded']} embedded)...")
+
+    to_delete = [doc_id for doc_id in stored if doc_id not in seen]
+    for start in range(0, len(to_delete), config.EMBED_BATCH_SIZE):
+        db.delete(ids=to_delete[start:start + config.EMBED_BATCH_SIZE])
+
+    print(f"Incremental build: {counts['embedded']} new or changed, {counts['moved']} moved, "
+          f"{len(to_delete)} removed, {counts['unchanged']} unchanged.")
+    return ids, images
+
+
+def build_database(build_sprites: bool = False, rebuild: bool = False, numpy_index: bool = False,
+                   hybrid_index: bool = False):
+    """
+    Streams the source catalog, creates vector embeddings, and persists them to ChromaDB.
+    By default only rows that changed since the last build are re-embedded; with
+    `rebuild` the database is deleted and built from scratch. With
+    `build_sprites`, also precomputes the thumbnail sprite store; with
+    `numpy_index`, also exports the embeddings for the NumPy retrieval backend;
+    `hybrid_index` does that and also builds the BM25 index for the hybrid backend.
+    """
+    numpy_index = numpy_index or hybrid_index
+    # 1. Check the source data
     print(f"Loading data from {config.DATA_PATH}...")
     if not os.path.exists(config.DATA_PATH):
         print(f"❌ ERROR: Data file not found at {config.DATA_PATH}.")
         return
-    df = pd.read_csv(config.DATA_PATH)
-
-    # 3. Prepare documents and metadata
-    print(f"Processing {len(df)} rows...")
-    docs, metadatas = [], []
-    for index, row in df.iterrows():
-        document_text = (
-            f"Product Name: {row.get('name', '')}. "
-            f"Description: {row.get('description', '')}. "
-            f"Gender: {row.get('gender', '')}."
-        )
-        docs.append(document_text)
-        metadatas.append({
-            "index_in_db": index,
-            "images": str(row.get('images', '')),
-            "price": float(row['price']),
-            "name": str(row['name']),
-            "gender": str(row['gender']),
-
-        })
-
-    # 4. Create embeddings and persist the database
-    print("Creating embeddings and building the database. This may take a few minutes...")
+    signature = _source_signature(config.DATA_PATH)
+    previous = _read_checkpoint()
+    incremental = not rebuild and os.path.exists(config.DB_PERSIST_DIRECTORY)
+    if (incremental and previous.get("source") == signature and previous.get("completed")
+            and not build_sprites and not numpy_index):
+        print("✅ Database is already up to date with the source data.")
+        return
+    if incremental and previous and not previous.get("completed"):
+        print("Resuming an interrupted build...")
+
+    # 2. Embed and persist the catalog batch by batch
     embedding_function = HuggingFaceEmbeddings(model_name=config.EMBEDDING_MODEL_NAME)
-    
-    db = Chroma.from_texts(
-        texts=docs,
-        metadatas=metadatas,
-        embedding=embedding_function,
-        persist_directory=config.DB_PERSIST_DIRECTORY,
-    )
-    
+    checkpoint = {"source": signature, "completed": False}
+    if incremental:
+        ids, images = _incremental_build(embedding_function, checkpoint)
+    else:
+        ids, images = _full_build(embedding_function, checkpoint)
+    checkpoint["completed"] = True
+    _write_checkpoint(checkpoint)
+
     print("✅ Database built and saved successfully!")
 
+    # 3. Optionally precompute product thumbnails for network-free search
+    if build_sprites:
+        from src.sprite_store import build_sprite_store
+        print("Precomputing product thumbnails into the sprite store...")
+        build_sprite_store(ids, images)
+        print("✅ Sprite store built successfully!")
+
+    # 4. Optionally export the embeddings for exact NumPy search
+    if numpy_index:
+        from src.numpy_index import export_numpy_index
+        print("Exporting embeddings to the NumPy index...")
+        db = Chroma(persist_directory=config.DB_PERSIST_DIRECTORY, embedding_function=embedding_function)
+        export_numpy_index(db)
+        print("✅ NumPy index exported successfully!")
+
+    # 5. Optionally build the BM25 keyword index for hybrid search. Its postings
+    # point at NumPy index rows, so an existing one is rebuilt with every export.
+    from src.hybrid_index import BM25_FILE, build_bm25_index
+    if hybrid_index or (numpy_index and os.path.exists(os.path.join(config.NUMPY_INDEX_DIR, BM25_FILE))):
+        print("Building the BM25 index...")
+        build_bm25_index()
+        print("✅ BM25 index built successfully!")
+
 if __name__ == "__main__":
-    build_database()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Build the product vector database.")
+    parser.add_argument("--rebuild", action="store_true",
+                        help="Delete the existing database and re-embed every row instead of updating incrementally.")
+    parser.add_argument("--sprites", action="store_true",
+                        help="Also fetch and pack product thumbnails into the memory-mapped sprite store.")
+    parser.add_argument("--numpy-index", action="store_true",
+                        help="Also export the embeddings to a memory-mapped matrix for the NumPy retrieval backend.")
+    parser.add_argument("--hybrid-index", action="store_true",
+                        help="Also export the NumPy index and build a BM25 keyword index for the hybrid retrieval backend.")
+    args = parser.parse_args()
+    build_database(build_sprites=args.sprites, rebuild=args.rebuild, numpy_index=args.numpy_index,
+                   hybrid_index=args.hybrid_index)
@@ -0,0 +1,13 @@
+# export_model.py
+
+import argparse
+from src import config
+from src.inference_backends import export_merged_snapshot
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Merge the LoRA adapter into the base model and save a local snapshot.")
+    parser.add_argument("--output", default=config.LLM_SNAPSHOT_DIR,
+                        help=f"Directory for the merged snapshot (default: {config.LLM_SNAPSHOT_DIR}).")
+    args = parser.parse_args()
+    export_merged_snapshot(args.output)
+    print("✅ Snapshot exported. The bot will now load it at startup without logging in.")
@@ -1,24 +1,58 @@
 # In main.py
 import os
+import time
 os.environ["ANONYMIZED_TELEMETRY"] = "False"
 
-from src.config import TELEGRAM_API_TOKEN, HUGGING_FACE_TOKEN
-from src.llm import load_llm_and_tokenizer
-from src.retriever import load_database 
-from src.bot import run_bot
+from concurrent.futures import ThreadPoolExecutor
+from src.config import TELEGRAM_API_TOKEN
+
+
+def _load_llm():
+    # Heavy imports (torch, transformers, peft) happen on this background thread.
+    from src.llm import load_llm_and_tokenizer
+    start = time.monotonic()
+    model, tokenizer = load_llm_and_tokenizer()
+    print(f"✅ LLM ready after {time.monotonic() - start:.1f}s.")
+    return model, tokenizer
+
+
+def _report_llm_failure(future):
+    """Logs a failed LLM load as soon as it happens instead of on the first outfit request."""
+    error = future.exception()
+    if error is not None:
+        print(f"❌ ERROR: The LLM failed to load: {type(error).__name__}: {error}")
+        print("Outfit recommendations will fail until the bot is restarted; product search keeps working.")
+
+
+def _load_retriever():
+    from src.retriever import load_database
+    start = time.monotonic()
+    db = load_database()
+    print(f"✅ Retriever ready after {time.monotonic() - start:.1f}s.")
+    return db
+
 
 if __name__ == "__main__":
+    started_at = time.monotonic()
     print("🚀 Starting the AI Personal Stylist Bot...")
-    if not TELEGRAM_API_TOKEN or not HUGGING_FACE_TOKEN:
-        print("❌ ERROR: API tokens not set.")
+    # The Hugging Face token is only needed (and checked) when the LLM has to be
+    # downloaded from the Hub instead of loaded from a local snapshot.
+    if not TELEGRAM_API_TOKEN:
+        print("❌ ERROR: TELEGRAM_API_TOKEN is not set.")
         exit()
-    print("✅ API tokens found.")
+    print("✅ Telegram token found.")
     
-    llm_model, tokenizer = load_llm_and_tokenizer()
-    db = load_database()
+    # Load the LLM and the retriever at the same time. Polling starts as soon as
+    # the retriever is ready; outfit requests wait on the LLM future.
+    loader = ThreadPoolExecutor(max_workers=2, thread_name_prefix="startup")
+    llm_future = loader.submit(_load_llm)
+    llm_future.add_done_callback(_report_llm_failure)
+    db = loader.submit(_load_retriever).result()
     
     # We can remove the inspection call now
     # print("Inspecting the first entry in the database...")
     # inspect_database_entry(db, index=0)
     
-    run_bot(llm_model, tokenizer, db)
\ No newline at end of file
+    from src.bot import run_bot
+    print(f"⏱️ Search available {time.monotonic() - started_at:.1f}s after startup.")
+    run_bot(llm_future, db, started_at=started_at)
@@ -0,0 +1,56 @@
+# prewarm_outfit_cache.py
+
+import argparse
+import os
+from src import config
+from src.llm import get_outfit_recommendation, load_llm_and_tokenizer
+from src.outfit_cache import SemanticOutfitCache
+from src.retriever import get_embeddings
+
+# Common self-descriptions, in English like the details the bot translates for the cache and the prompt
+POPULAR_DETAILS = [
+    "pear-shaped body, 165cm, minimal and simple style, neutral colors",
+    "slightly overweight, 180cm, sporty and comfortable style, dark colors",
+    "petite, 155cm, romantic style, pastel colors",
+    "athletic build, 175cm, casual style, bright colors",
+    "tall and slim, 185cm, classic style, earth tones",
+    "curvy body, 168cm, elegant style, black and white",
+]
+
+
+def prewarm(details_list: list[str], genders: list[str], events: list[str], output: str):
+    """Generates outfits for every combination and saves them for the bot to load at startup."""
+    cache = SemanticOutfitCache(get_embeddings())
+    if os.path.exists(output):
+        print(f"Extending existing cache file {output}...")
+        cache.load(output)
+    model, tokenizer = load_llm_and_tokenizer()
+
+    combinations = [(g, d, e) for g in genders for e in events for d in details_list]
+    for i, (gender, details, event) in enumerate(combinations, start=1):
+        if cache.get(gender, details, event) is not None:
+            print(f"[{i}/{len(combinations)}] Already cached: {gender} / {event} / {details}")
+            continue
+        print(f"[{i}/{len(combinations)}] Generating: {gender} / {event} / {details}")
+        outfits = get_outfit_recommendation(details, event, model, tokenizer)
+        if outfits:
+            cache.put(gender, details, event, outfits)
+
+    cache.save(output)
+    print(f"✅ Saved {len(cache)} outfit recommendations to {output}.")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Pre-generate outfit recommendations for popular requests.")
+    parser.add_argument("--details-file", default=None,
+                        help="Text file with one self-description per line (default: a built-in list).")
+    parser.add_argument("--genders", default="زن,مرد", help="Comma-separated gender buttons to cover.")
+    parser.add_argument("--output", default=config.OUTFIT_CACHE_PATH,
+                        help=f"Cache file to write (default: {config.OUTFIT_CACHE_PATH}).")
+    args = parser.parse_args()
+
+    details_list = POPULAR_DETAILS
+    if args.details_file:
+        with open(args.details_file, encoding="utf-8") as f:
+            details_list = [line.strip() for line in f if line.strip()]
+    prewarm(details_list, args.genders.split(","), config.OUTFIT_EVENTS, args.output)
@@ -1,17 +1,38 @@
 import telebot
 import re
+import time
 from telebot import types
-from googletrans import Translator
 from io import BytesIO
 
 # Import our project modules
 from src import config
-from src.llm import get_outfit_recommendation, format_instruction 
-from src.retriever import search_for_products
+from src.retriever import build_composite, composite_key, encode_image, find_products, format_results, link_outfit_products
+from src.search_cache import LRUCache
+from src.translation import get_translation_service
+from src.dispatcher import Dispatcher
+from src import metrics
+from src import search_cache
+from src import outfit_cache
+from src.outfit_cache import get_outfit_cache
+from src.state_store import get_state_store
 
 # --- Globals and Initializations ---
-translator = Translator()
-user_states = {}
+translator = get_translation_service()
+user_states = get_state_store()
+# Telegram file_id of each sent product grid, keyed by the ordered product ids
+photo_file_ids = LRUCache(config.PHOTO_FILE_ID_CACHE_SIZE, config.PHOTO_FILE_ID_TTL)
+
+_jobs = metrics.counter("bot_jobs", "Slow bot jobs by kind and dispatch result.")
+
+
+def _cache_stats() -> dict:
+    """Flattened counters of every cache the bot uses, for the metrics endpoint."""
+    stats = {f"translation_{k}": v for k, v in translator.stats.items()}
+    for cache_name, cache in search_cache.cache_stats().items():
+        stats.update({f"{cache_name}_{k}": v for k, v in cache.items()})
+    stats.update({f"photo_file_ids_{k}": v for k, v in photo_file_ids.stats().items()})
+    stats.update({f"outfits_{k}": v for k, v in outfit_cache.cache_stats().items()})
+    return stats
 
 # --- UI Helper Functions (Keyboards/Menus) ---
 def generate_main_menu():
@@ -25,15 +46,66 @@ def generate_gender_menu():
     return markup
 
 # --- Main Bot Logic ---
-def run_bot(llm_model, tokenizer, db):
-    bot = telebot.TeleBot(config.TELEGRAM_API_TOKEN, parse_mode='Markdown')
+def run_bot(llm_future, db, started_at: float | None = None):
+    """
+    Runs the bot. `llm_future` resolves to `(model, tokenizer)` once the LLM has
+    loaded, so product search is served while the model is still warming up.
+    `started_at` is the process start time (time.monotonic()) for startup metrics.
+    """
+    # Handlers run one at a time on the polling thread; the dispatcher moves slow
+    # work to its own pools while keeping every chat's jobs in order. Menu and
+    # status replies do not depend on a job's result, so handlers send them
+    # directly instead of queueing them behind the chat's running job.
+    bot = telebot.TeleBot(config.TELEGRAM_API_TOKEN, parse_mode='Markdown', threaded=False)
+    dispatcher = Dispatcher({
+        "search": (config.SEARCH_WORKERS, config.SEARCH_MAX_PENDING),
+        "llm": (config.LLM_WORKERS, config.LLM_MAX_PENDING),
+    })
+    metrics.gauge_callback("dispatcher_pending_jobs", "Submitted but unfinished jobs per dispatcher pool.",
+                           dispatcher.queue_depths, label="pool")
+    metrics.gauge_callback("cache_stats", "Hit, miss and eviction counts of the bot's caches.", _cache_stats)
+    metrics.start_metrics_server()
     print("🤖 Telegram bot is running...")
 
+    startup_seconds = {}  # milestone -> seconds after process start
+    if started_at is not None:
+        startup_seconds["search_available"] = time.monotonic() - started_at
+    metrics.gauge_callback("startup_seconds", "Seconds from process start to each startup milestone.",
+                           lambda: dict(startup_seconds), label="milestone")
+
+    def report_first_search():
+        """Logs and records the time from process start to the first answered search (once)."""
+        if started_at is not None and "first_search" not in startup_seconds:
+            seconds = time.monotonic() - started_at
+            # Several search workers may get here at once; only the first one counts.
+            if startup_seconds.setdefault("first_search", seconds) == seconds:
+                print(f"⏱️ Time to first search response: {seconds:.1f}s after startup.")
+
+    def wait_for_llm(chat_id):
+        """Returns (model, tokenizer), telling the user if the model is still loading."""
+        if not llm_future.done():
+            bot.send_message(chat_id, "مدل هوش مصنوعی هنوز در حال آماده شدن است. درخواست شما پس از آماده شدن پردازش می‌شود ⏳")
+        return llm_future.result()
+
+    def run_heavy(chat_id, job, pool, kind):
+        """Queues a slow job and tells the user if they have to wait for it."""
+        def traced():
+            with metrics.trace(kind, chat_id):
+                job()
+
+        position = dispatcher.submit(chat_id, traced, pool=pool)
+        _jobs.inc(kind=kind, result="rejected" if position is None else "queued" if position else "started")
+        if position is None:
+            user_states.clear(chat_id)
+            bot.send_message(chat_id, "سرور در حال حاضر بسیار شلوغ است. لطفاً چند دقیقه دیگر دوباره تلاش کنید.", reply_markup=generate_main_menu())
+        elif position > 0:
+            bot.send_message(chat_id, f"سرور شلوغ است؛ درخواست شما در صف قرار گرفت (نوبت {position}) ⏳")
+
     # --- Handlers (Welcome, Help, Product Search) ---
     # These handlers are already correct and do not need changes.
     @bot.message_handler(commands=['start'])
     def send_welcome(message):
-        user_states[message.chat.id] = {}
+        user_states.clear(message.chat.id)
         bot.send_message(message.chat.id, "سلام! من ربات مشاور لباس هستم. چگونه می‌توانم کمکتان کنم؟", reply_markup=generate_main_menu())
 
     @bot.message_handler(func=lambda msg: msg.text == '❓ راهنما')
@@ -49,13 +121,12 @@ def run_bot(llm_model, tokenizer, db):
 
     @bot.message_handler(func=lambda msg: msg.text == '🔍 جستجوی محصولات')
     def handle_search_products(message):
-        user_states[message.chat.id] = {"step": "awaiting_search_gender"}
+        user_states.set(message.chat.id, {"step": "awaiting_search_gender"})
         bot.send_message(message.chat.id, "لطفاً جنسیت را انتخاب کنید:", reply_markup=generate_gender_menu())
         
-    @bot.message_handler(func=lambda msg: user_states.get(msg.chat.id, {}).get("step") == "awaiting_search_gender")
+    @bot.message_handler(func=lambda msg: user_states.step(msg.chat.id) == "awaiting_search_gender")
     def process_search_gender(message):
-        user_states[message.chat.id]["gender"] = message.text
-        user_states[message.chat.id]["step"] = "awaiting_search_description"
+        user_states.update(message.chat.id, gender=message.text, step="awaiting_search_description")
         prompt_text = (
             "عالی! حالا لطفاً *توضیحاتی از یک لباس* را وارد کنید تا موارد مشابه را برایتان پیدا کنم.\n\n"
             "✅ *مثال‌های خوب:*\n"
@@ -67,35 +138,48 @@ def run_bot(llm_model, tokenizer, db):
         )
         bot.send_message(message.chat.id, prompt_text, reply_markup=types.ReplyKeyboardRemove())
 
-    @bot.message_handler(func=lambda msg: user_states.get(msg.chat.id, {}).get("step") == "awaiting_search_description")
+    @bot.message_handler(func=lambda msg: user_states.step(msg.chat.id) == "awaiting_search_description")
     def process_product_description(message):
         chat_id = message.chat.id
         description = message.text
-        persian_gender = user_states[chat_id].get("gender", "زن")
+        persian_gender = user_states.get(chat_id).get("gender", "زن")
         gender_filter = "Women" if persian_gender == "زن" else "Men"
-        bot.send_message(chat_id, "در حال جستجو... لطفاً صبر کنید ⏳")
-        search_prompt = translator.translate(description, dest='en').text
-        final_img, final_txt = search_for_products(prompt=search_prompt, gender_filter=gender_filter, db=db)
-        if final_img and final_txt:
-            img_io = BytesIO()
-            final_img.save(img_io, 'PNG')
-            img_io.seek(0)
-            bot.send_photo(chat_id, photo=img_io, caption=final_txt)
-        else:
-            bot.send_message(chat_id, "متاسفانه محصولی با این مشخصات پیدا نشد. لطفاً دوباره تلاش کنید.")
-        user_states[chat_id] = {}
-        bot.send_message(chat_id, "چه کار دیگری می‌توانم برایتان انجام دهم؟", reply_markup=generate_main_menu())
+        user_states.clear(chat_id)
+
+        def job():
+            bot.send_message(chat_id, "در حال جستجو... لطفاً صبر کنید ⏳")
+            search_prompt = translator.translate(description, dest='en')
+            documents = find_products(search_prompt, gender_filter, db)
+            key = composite_key(documents) if documents else None
+            # The same products in the same order were sent before: reuse that upload.
+            file_id = photo_file_ids.get(key) if key else None
+            if file_id is not None:
+                bot.send_photo(chat_id, photo=file_id, caption=format_results(documents))
+            else:
+                final_img, complete = build_composite(documents) if documents else (None, False)
+                if final_img:
+                    with metrics.span("encode"):
+                        photo = BytesIO(encode_image(final_img))
+                    with metrics.span("telegram_upload"):
+                        sent = bot.send_photo(chat_id, photo=photo, caption=format_results(documents))
+                    if complete and key:
+                        photo_file_ids.put(key, sent.photo[-1].file_id)
+                else:
+                    bot.send_message(chat_id, "متاسفانه محصولی با این مشخصات پیدا نشد. لطفاً دوباره تلاش کنید.")
+            report_first_search()
+            bot.send_message(chat_id, "چه کار دیگری می‌توانم برایتان انجام دهم؟", reply_markup=generate_main_menu())
+
+        run_heavy(chat_id, job, pool="search", kind="search")
 
     # --- Outfit Recommendation Handlers (WITH IMPROVEMENTS) ---
     @bot.message_handler(func=lambda msg: msg.text == '👕 پیشنهاد لباس')
     def handle_outfit_recommendation(message):
-        user_states[message.chat.id] = {"step": "awaiting_outfit_gender"}
+        user_states.set(message.chat.id, {"step": "awaiting_outfit_gender"})
         bot.send_message(message.chat.id, "برای پیشنهاد لباس، لطفاً جنسیت را انتخاب کنید:", reply_markup=generate_gender_menu())
         
-    @bot.message_handler(func=lambda msg: user_states.get(msg.chat.id, {}).get("step") == "awaiting_outfit_gender")
+    @bot.message_handler(func=lambda msg: user_states.step(msg.chat.id) == "awaiting_outfit_gender")
     def process_outfit_gender(message):
-        user_states[message.chat.id]["gender"] = message.text
-        user_states[message.chat.id]["step"] = "awaiting_outfit_details"
+        user_states.update(message.chat.id, gender=message.text, step="awaiting_outfit_details")
         
         # --- IMPROVEMENT 1: A more helpful and readable prompt ---
         prompt_text = (
@@ -107,84 +191,130 @@ def run_bot(llm_model, tokenizer, db):
         )
         bot.send_message(message.chat.id, prompt_text, reply_markup=types.ReplyKeyboardRemove())
 
-    @bot.message_handler(func=lambda msg: user_states.get(msg.chat.id, {}).get("step") == "awaiting_outfit_details")
+    @bot.message_handler(func=lambda msg: user_states.step(msg.chat.id) == "awaiting_outfit_details")
     def process_outfit_details(message):
-        user_states[message.chat.id]["details"] = message.text
-        user_states[message.chat.id]["step"] = "awaiting_outfit_event"
+        user_states.update(message.chat.id, details=message.text, step="awaiting_outfit_event")
         
         # --- IMPROVEMENT 2: A clearer prompt with suggested event buttons ---
         markup = types.ReplyKeyboardMarkup(row_width=2, resize_keyboard=True, one_time_keyboard=True)
-        markup.add(
-            types.KeyboardButton('محیط کاری'),
-            types.KeyboardButton('مهمانی دوستانه'),
-            types.KeyboardButton('استفاده روزمره'),
-            types.KeyboardButton('قرار رسمی')
-        )
+        markup.add(*(types.KeyboardButton(event) for event in config.OUTFIT_EVENTS))
         bot.send_message(message.chat.id, "بسیار خب. حالا *نوع رویداد یا موقعیت* مورد نظر را انتخاب کنید یا تایپ کنید:", reply_markup=markup)
 
-    @bot.message_handler(func=lambda msg: user_states.get(msg.chat.id, {}).get("step") == "awaiting_outfit_event")
+    @bot.message_handler(func=lambda msg: user_states.step(msg.chat.id) == "awaiting_outfit_event")
     def process_outfit_event(message):
         chat_id = message.chat.id
         event = message.text
-        details = user_states[chat_id].get("details", "a person")
-        bot.send_message(chat_id, "در حال آماده کردن پیشنهادات... این فرآیند ممکن است کمی طول بکشد 🧠", reply_markup=types.ReplyKeyboardRemove())
-        try:
-            outfits = get_outfit_recommendation(details, event, llm_model, tokenizer)
-            if not outfits:
-                bot.send_message(chat_id, "متاسفانه در تولید پیشنهاد مشکلی پیش آمد. لطفاً دوباره تلاش کنید.", reply_markup=generate_main_menu())
-                user_states[chat_id] = {}
-                return
-            
-            user_states[chat_id]['outfits'] = outfits
-            user_states[chat_id]['step'] = "awaiting_outfit_selection"
-
-            # --- IMPROVEMENT 3: Translate the preview text BEFORE creating the button ---
-            markup = types.ReplyKeyboardMarkup(row_width=1, resize_keyboard=True, one_time_keyboard=True)
-            for i, outfit in enumerate(outfits[:4]):
-                preview_en = outfit.get('Top', 'پیشنهاد بدون عنوان')
-                # Translate the English preview to Farsi
-                preview_fa = translator.translate(preview_en, dest='fa').text
-                # Use the Farsi preview in the button text for correct rendering
-                markup.add(types.KeyboardButton(f"گزینه {i+1}: {preview_fa[:40]}..."))
-            markup.add(types.KeyboardButton("بازگشت به منوی اصلی"))
-            
-            bot.send_message(chat_id, "چند پیشنهاد برای شما آماده شد. لطفاً یکی را برای دیدن جزئیات انتخاب کنید:", reply_markup=markup)
-        except Exception as e:
-            print(f"Error during outfit generation or parsing: {e}")
-            bot.send_message(chat_id, "متاسفانه در پردازش درخواست شما خطایی رخ داد.", reply_markup=generate_main_menu())
-            user_states[chat_id] = {}
-    
-    @bot.message_handler(func=lambda msg: user_states.get(msg.chat.id, {}).get("step") == "awaiting_outfit_selection")
+        state = user_states.get(chat_id)
+        details = state.get("details", "a person")
+        gender = state.get("gender", "زن")
+        user_states.update(chat_id, step="generating_outfits")
+
+        def job():
+            bot.send_message(chat_id, "در حال آماده کردن پیشنهادات... این فرآیند ممکن است کمی طول بکشد 🧠", reply_markup=types.ReplyKeyboardRemove())
+            streamed = []
+
+            def on_outfit(outfit):
+                # Show each option as soon as the model finishes writing it.
+                streamed.append(outfit)
+                preview_fa = translator.translate(outfit.get('Top', 'پیشنهاد بدون عنوان'), dest='fa')
+                bot.send_message(chat_id, f"✨ گزینه {len(streamed)}: {preview_fa}")
+
+            try:
+                # The LLM, the English-only cache embedder and the prewarmed entries all use English details.
+                details_en = translator.translate(details, dest='en')
+                # Similar earlier requests are answered from the cache without the LLM.
+                cache = get_outfit_cache()
+                outfits = cache.get(gender, details_en, event) if cache is not None else None
+                if outfits is not None:
+                    for outfit in outfits:
+                        on_outfit(outfit)
+                else:
+                    llm_model, tokenizer = wait_for_llm(chat_id)
+                    # Imported here so torch/transformers load in the background at startup.
+                    from src.llm import get_outfit_recommendation
+                    outfits = get_outfit_recommendation(details_en, event, llm_model, tokenizer, on_outfit=on_outfit)
+                    if outfits and cache is not None:
+                        cache.put(gender, details_en, event, outfits)
+                if not outfits:
+                    bot.send_message(chat_id, "متاسفانه در تولید پیشنهاد مشکلی پیش آمد. لطفاً دوباره تلاش کنید.", reply_markup=generate_main_menu())
+                    user_states.clear(chat_id)
+                    return
+
+                # --- IMPROVEMENT 3: Translate the preview text BEFORE creating the button ---
+                markup = types.ReplyKeyboardMarkup(row_width=1, resize_keyboard=True, one_time_keyboard=True)
+                # Translate all English previews to Farsi in a single batch
+                previews_en = [outfit.get('Top', 'پیشنهاد بدون عنوان') for outfit in outfits[:4]]
+                previews_fa = translator.translate_many(previews_en, dest='fa')
+                for i, preview_fa in enumerate(previews_fa):
+                    # Use the Farsi preview in the button text for correct rendering
+                    markup.add(types.KeyboardButton(f"گزینه {i+1}: {preview_fa[:40]}..."))
+                markup.add(types.KeyboardButton("بازگشت به منوی اصلی"))
+
+                # Only move on if the user has not restarted in the meantime.
+                user_states.set_if_step(chat_id, "generating_outfits", {'outfits': outfits, 'gender': gender, 'step': "awaiting_outfit_selection"})
+                bot.send_message(chat_id, "چند پیشنهاد برای شما آماده شد. لطفاً یکی را برای دیدن جزئیات انتخاب کنید:", reply_markup=markup)
+            except Exception as e:
+                print(f"Error during outfit generation or parsing: {e}")
+                bot.send_message(chat_id, "متاسفانه در پردازش درخواست شما خطایی رخ داد.", reply_markup=generate_main_menu())
+                user_states.clear(chat_id)
+
+        run_heavy(chat_id, job, pool="llm", kind="outfits")
+
+    @bot.message_handler(func=lambda msg: user_states.step(msg.chat.id) == "generating_outfits")
+    def process_while_generating(message):
+        bot.send_message(message.chat.id, "پیشنهادات شما در حال آماده شدن است. لطفاً کمی صبر کنید 🧠")
+
+    @bot.message_handler(func=lambda msg: user_states.step(msg.chat.id) == "awaiting_outfit_selection")
     def process_outfit_selection(message):
         chat_id = message.chat.id
         if message.text == "بازگشت به منوی اصلی":
-            user_states[chat_id] = {}
+            user_states.clear(chat_id)
             bot.send_message(chat_id, "چه کار دیگری می‌توانم برایتان انجام دهم؟", reply_markup=generate_main_menu())
             return
         match = re.match(r'گزینه (\d+):', message.text)
         if not match:
             bot.send_message(chat_id, "لطفاً یکی از گزینه‌های منو را انتخاب کنید.", reply_markup=generate_main_menu())
             return
-        try:
-            index = int(match.group(1)) - 1
-            outfits = user_states[chat_id].get('outfits', [])
-            if 0 <= index < len(outfits):
-                chosen_outfit = outfits[index]
-                key_map = {'Top':'👕 *بالا:*','Bottom':'👖 *پایین:*','Shoe':'👟 *کفش:*','Shoes':'👟 *کفش:*','Accessories':'👜 *اکسسوری:*'}
-                response_parts = [f"✨ *جزئیات گزینه {index + 1}* ✨"]
-                for key_en, value_en in chosen_outfit.items():
-                    key_fa_formatted = key_map.get(key_en.capitalize(), f"*{key_en.capitalize()}:*")
-                    value_fa = translator.translate(value_en, dest='fa').text
-                    response_parts.append(f"{key_fa_formatted}\n{value_fa}")
-                final_response = "\n\n".join(response_parts)
-                bot.send_message(chat_id, final_response)
-            else:
-                bot.send_message(chat_id, "گزینه انتخاب شده نامعتبر است.")
-        except (KeyError, IndexError, ValueError) as e:
-            print(f"Error processing selection: {e}")
-            bot.send_message(chat_id, "خطایی در نمایش جزئیات رخ داد.")
-        user_states[chat_id] = {}
-        bot.send_message(chat_id, "امیدوارم مفید بوده باشد! برای ادامه از منو استفاده کنید.", reply_markup=generate_main_menu())
+        index = int(match.group(1)) - 1
+        state = user_states.get(chat_id)
+        outfits = state.get('outfits', [])
+        gender_filter = "Women" if state.get("gender", "زن") == "زن" else "Men"
+        user_states.clear(chat_id)
+
+        def job():
+            try:
+                if 0 <= index < len(outfits):
+                    chosen_outfit = outfits[index]
+                    key_map = {'Top':'👕 *بالا:*','Bottom':'👖 *پایین:*','Shoe':'👟 *کفش:*','Shoes':'👟 *کفش:*','Accessories':'👜 *اکسسوری:*'}
+                    response_parts = [f"✨ *جزئیات گزینه {index + 1}* ✨"]
+                    values_fa = translator.translate_many(list(chosen_outfit.values()), dest='fa')
+                    for key_en, value_fa in zip(chosen_outfit.keys(), values_fa):
+                        key_fa_formatted = key_map.get(key_en.capitalize(), f"*{key_en.capitalize()}:*")
+                        response_parts.append(f"{key_fa_formatted}\n{value_fa}")
+                    final_response = "\n\n".join(response_parts)
+                    bot.send_message(chat_id, final_response)
+
+                    # Matching catalog products for every item, found in one batched search.
+                    linked = link_outfit_products([chosen_outfit], gender_filter, db)[0]
+                    product_lines = []
+                    for key_en, documents in linked.items():
+                        key_fa_formatted = key_map.get(key_en.capitalize(), f"*{key_en.capitalize()}:*")
+                        for doc in documents:
+                            metadata = doc.metadata
+                            product_lines.append(
+                                f"{key_fa_formatted} {metadata.get('name', 'N/A')} "
+                                f"(قیمت: {metadata.get('price', 'N/A')}، شناسه: {metadata.get('index_in_db', 'N/A')})"
+                            )
+                    if product_lines:
+                        bot.send_message(chat_id, "🛍️ *محصولات مشابه در فروشگاه:*\n\n" + "\n".join(product_lines))
+                else:
+                    bot.send_message(chat_id, "گزینه انتخاب شده نامعتبر است.")
+            except (KeyError, IndexError, ValueError) as e:
+                print(f"Error processing selection: {e}")
+                bot.send_message(chat_id, "خطایی در نمایش جزئیات رخ داد.")
+            bot.send_message(chat_id, "امیدوارم مفید بوده باشد! برای ادامه از منو استفاده کنید.", reply_markup=generate_main_menu())
+
+        run_heavy(chat_id, job, pool="search", kind="selection")
 
     @bot.message_handler(func=lambda message: True)
     def handle_unknown(message):
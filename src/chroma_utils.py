@@ -0,0 +1,28 @@
+# Chroma operations that the LangChain wrapper does not expose publicly. Every
+# access to the wrapper's private `_collection` lives here, so a LangChain or
+# chromadb upgrade only has to be checked against this module.
+#
+# Written against langchain-community 0.2.16 and chromadb 0.5: the wrapper's
+# `update_documents` always re-embeds the texts, and its searches take a
+# single query, so these go through the underlying collection.
+
+from langchain_core.documents import Document
+
+
+def update_metadatas(db, ids: list[str], metadatas: list[dict]):
+    """Replaces the metadata of existing rows without re-embedding them."""
+    db._collection.update(ids=ids, metadatas=metadatas)
+
+
+def similarity_search_by_vectors(db, vectors: list, k: int = 4, filter: dict | None = None) -> list[list]:
+    """
+    Top-k documents for each of several query embeddings, answered by the
+    collection in one request (the wrapper's searches take one vector each).
+    """
+    results = db._collection.query(
+        query_embeddings=vectors, n_results=k, where=filter, include=["documents", "metadatas"],
+    )
+    return [
+        [Document(page_content=text, metadata=meta or {}) for text, meta in zip(texts, metas)]
+        for texts, metas in zip(results["documents"], results["metadatas"])
+    ]
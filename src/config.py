@@ -10,7 +10,107 @@ HUGGING_FACE_TOKEN = os.getenv("HUGGING_FACE_TOKEN")
 # Model and Data Paths
 DATA_PATH = "data/raw/Myntra_fashion_products_fixed.csv" 
 DB_PERSIST_DIRECTORY = "data/db"
+CATALOG_ID_COLUMN = "p_id"      # Stable product id column; the row index is used if it is missing
+EMBED_BATCH_SIZE = 256          # Rows embedded and written per batch during database builds
+
+# Retrieval backend: "chroma" (default), "numpy" (exact search over an exported matrix)
+# or "hybrid" (the NumPy index plus BM25 keyword search, fused by rank)
+RETRIEVAL_BACKEND = os.getenv("RETRIEVAL_BACKEND", "chroma")
+NUMPY_INDEX_DIR = "data/numpy_index"
+NUMPY_INDEX_DTYPE = "float32"   # "float16" halves the index size
+HYBRID_CANDIDATES = 50          # Rows taken from each of the dense and BM25 rankings before fusion
+HYBRID_RRF_K = 60               # Reciprocal rank fusion constant
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# Search caches (query text -> embedding, and (query, gender, k) -> products)
+SEARCH_CACHE_ENABLED = True
+QUERY_EMBEDDING_CACHE_SIZE = 4096
+SEARCH_RESULT_CACHE_SIZE = 2048
+SEARCH_CACHE_TTL = 6 * 3600     # Seconds
 
 # Hugging Face model identifiers
 LLM_MODEL_NAME = "neuralwork/mistral-7b-style-instruct"
-EMBEDDING_MODEL_NAME = "sentence-transformers/all-mpnet-base-v2"
\ No newline at end of file
+EMBEDDING_MODEL_NAME = "sentence-transformers/all-mpnet-base-v2"
+
+# Local merged LLM snapshot written by `python export_model.py`
+LLM_SNAPSHOT_DIR = "models/stylist-merged"
+LLM_LOAD_IN_4BIT = True
+
+# Inference backend: "peft" (GPU, 4-bit bitsandbytes), "cpu-int8" (merged snapshot
+# with int8 dynamic quantization on CPU) or "tiny" (offline deterministic test model)
+INFERENCE_BACKEND = os.getenv("INFERENCE_BACKEND", "peft")
+LLM_CPU_THREADS = int(os.getenv("LLM_CPU_THREADS", os.cpu_count() or 1))   # Torch threads for "cpu-int8"
+TINY_LM_SEED = 0
+
+# Conversation state ("memory" for this process only, "sqlite" to share it between bot processes)
+STATE_BACKEND = os.getenv("STATE_BACKEND", "memory")
+STATE_DB_PATH = "data/chat_states.sqlite"
+STATE_MAX_ENTRIES = 10000       # Least recently active chats are dropped beyond this
+STATE_IDLE_TTL = 6 * 3600       # Seconds of inactivity before a chat's state is forgotten
+
+# Instrumentation: Prometheus-style /metrics endpoint and optional per-request trace log
+METRICS_ENABLED = True          # False turns every span and counter into a no-op
+METRICS_HOST = "127.0.0.1"
+METRICS_PORT = int(os.getenv("METRICS_PORT", 9108))   # Per process; 0 disables the HTTP endpoint
+TRACE_LOG_PATH = None           # e.g. "data/traces.jsonl": one JSON line per bot request
+
+# Bot dispatch: worker threads and max queued jobs per pool
+SEARCH_WORKERS = 4              # Product search, image composition and translation
+SEARCH_MAX_PENDING = 64
+LLM_MAX_PENDING = 16
+
+# Reuse the attention cache of the fixed stylist instruction across requests
+PREFIX_CACHE_ENABLED = True
+
+# Outfit generation stops once this many outfits have been parsed
+NUM_OUTFITS = 5
+
+# Catalog products shown for each field of a chosen outfit
+OUTFIT_PRODUCTS_PER_FIELD = 1
+
+# Preset event buttons offered for outfit recommendations
+OUTFIT_EVENTS = ['محیط کاری', 'مهمانی دوستانه', 'استفاده روزمره', 'قرار رسمی']
+
+# Semantic outfit cache: reuse outfits generated for similar details, same gender and event
+OUTFIT_CACHE_ENABLED = True
+OUTFIT_CACHE_THRESHOLD = 0.92   # Minimum cosine similarity of the details embeddings
+OUTFIT_CACHE_SIZE = 2048
+OUTFIT_CACHE_TTL = 24 * 3600    # Seconds
+OUTFIT_CACHE_PATH = "data/outfit_cache.json"   # Prewarmed entries, written by prewarm_outfit_cache.py
+
+# Batched LLM generation: concurrent outfit requests share one generate() call
+GENERATION_BATCHING = True
+GENERATION_MAX_BATCH_SIZE = 4
+GENERATION_MAX_WAIT = 0.05      # Seconds to wait for more requests before starting a batch
+LLM_WORKERS = GENERATION_MAX_BATCH_SIZE if GENERATION_BATCHING else 1   # Outfit generation threads
+
+# Translation ("google" for googletrans, "identity" for an offline stand-in)
+TRANSLATION_BACKEND = os.getenv("TRANSLATION_BACKEND", "google")
+TRANSLATION_CACHE_PATH = "data/translations.sqlite"
+
+# Product image fetching
+IMAGES_PER_PRODUCT = 3
+THUMBNAIL_SIZE = (256, 256)
+IMAGE_FETCH_WORKERS = 9          # Max concurrent image downloads (and pooled connections)
+IMAGE_FETCH_TIMEOUT = 4.0        # Seconds allowed for a single image download
+IMAGE_FETCH_DEADLINE = 6.0       # Seconds allowed for all images of one search
+
+# Thumbnail cache (resized product images)
+THUMBNAIL_CACHE_ENABLED = True
+THUMBNAIL_CACHE_DIR = "data/thumbnails"
+THUMBNAIL_CACHE_MEMORY_BYTES = 64 * 1024 * 1024     # Decoded thumbnails kept in RAM
+THUMBNAIL_CACHE_DISK_BYTES = 1024 * 1024 * 1024     # Encoded thumbnails kept on disk
+THUMBNAIL_CACHE_MAX_AGE = 7 * 24 * 3600             # Seconds before a conditional revalidation
+THUMBNAIL_CACHE_JPEG_QUALITY = 90
+
+# Product-grid image sent to Telegram
+COMPOSITE_FORMAT = "JPEG"                # Or "WEBP"
+COMPOSITE_QUALITIES = (85, 75, 65, 50)   # Tried in order until the image fits the byte budget
+COMPOSITE_MAX_BYTES = 150 * 1024
+PHOTO_FILE_ID_CACHE_SIZE = 10000         # Telegram file_ids of sent grids, keyed by product ids
+PHOTO_FILE_ID_TTL = 30 * 24 * 3600       # Seconds
+
+# Precomputed thumbnail sprite store (built by `python build_database.py --sprites`)
+SPRITE_STORE_ENABLED = True
+SPRITE_STORE_DIR = "data/sprites"
@@ -0,0 +1,89 @@
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+
+class Dispatcher:
+    """
+    Runs bot work off the polling thread while keeping each chat's messages in order.
+
+    Jobs go to named, bounded thread pools (e.g. "llm", "search"). Each chat
+    runs at most one job at a time, so replies never overtake each other; a
+    job waits behind its chat's earlier jobs.
+    """
+
+    def __init__(self, pools: dict[str, tuple[int, int]]):
+        """`pools` maps a pool name to `(max_workers, max_pending)`."""
+        self._executors = {}
+        self._limits = {}
+        self._pending = {}
+        self._started = {}  # Jobs handed to each pool's executor and not finished yet
+        for name, (workers, max_pending) in pools.items():
+            self._executors[name] = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=f"dispatch-{name}")
+            self._limits[name] = (workers, max_pending)
+            self._pending[name] = 0
+            self._started[name] = 0
+        self._chats = {}  # chat_id -> deque of (pool, fn)
+        self._lock = threading.Lock()
+
+    def queue_depths(self) -> dict:
+        """Number of submitted but unfinished jobs per pool."""
+        with self._lock:
+            return dict(self._pending)
+
+    def submit(self, chat_id, fn, pool: str) -> int | None:
+        """
+        Schedules `fn()` for `chat_id` on `pool`. Returns 0 if it can start now,
+        its queue position (1, 2, ...) if it has to wait for a worker or for the
+        chat's earlier jobs, or None if the pool is full and the job was rejected.
+        """
+        with self._lock:
+            workers, max_pending = self._limits[pool]
+            if self._pending[pool] >= max_pending:
+                return None
+            jobs = self._chats.setdefault(chat_id, deque())
+            position = max(0, self._started[pool] - workers + 1) + len(jobs)
+            self._pending[pool] += 1
+            jobs.append((pool, fn))
+            start_now = len(jobs) == 1
+        if start_now:
+            self._start_next(chat_id)
+        return position
+
+    def _start_next(self, chat_id):
+        """Hands the job at the head of the chat's queue to its pool."""
+        with self._lock:
+            pool, fn = self._chats[chat_id][0]
+            self._started[pool] += 1
+        self._executors[pool].submit(self._run, chat_id, pool, fn)
+
+    def _finish_head(self, chat_id) -> bool:
+        """Drops the finished head job; returns True if the chat has more queued."""
+        with self._lock:
+            jobs = self._chats[chat_id]
+            jobs.popleft()
+            if not jobs:
+                del self._chats[chat_id]
+                return False
+            return True
+
+    def _run(self, chat_id, pool: str, fn):
+        try:
+            self._call(fn)
+        finally:
+            with self._lock:
+                self._pending[pool] -= 1
+                self._started[pool] -= 1
+            if self._finish_head(chat_id):
+                self._start_next(chat_id)
+
+    @staticmethod
+    def _call(fn):
+        try:
+            fn()
+        except Exception as e:
+            print(f"Error in dispatched job: {e}")
+
+    def shutdown(self, wait: bool = True):
+        for executor in self._executors.values():
+            executor.shutdown(wait=wait)
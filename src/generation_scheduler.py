@@ -0,0 +1,141 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+import torch
+
+from src import config
+from src import metrics
+
+generated_tokens = metrics.counter("llm_generated_tokens", "Tokens generated by the LLM.")
+tokens_per_second = metrics.histogram(
+    "llm_tokens_per_second", "Generation speed of each generate() call, in new tokens per second.",
+    buckets=(1, 2, 5, 10, 20, 50, 100, 200, 500, 1000),
+)
+
+
+class GenerationScheduler:
+    """
+    Groups concurrent generation requests into batched `model.generate` calls.
+
+    A background thread takes the first waiting request, keeps collecting more
+    for up to `max_wait` seconds (or until `max_batch_size` are waiting), then
+    left-pads them into one batch. Each caller gets its own decoded completion
+    through a Future, optionally passed through `postprocess` first.
+
+    `prepare_inputs(prompts)` may return ready-made generate() inputs (e.g.
+    reusing a cached prompt prefix) or None to fall back to plain tokenization.
+    `make_stopping_criteria(input_length, options)` may return a
+    StoppingCriteriaList for a batch, given the per-request `options` that were
+    passed to `submit`; it lets rows finish early.
+    """
+
+    def __init__(self, model, tokenizer, max_batch_size: int | None = None, max_wait: float | None = None,
+                 generate_kwargs: dict | None = None, postprocess=None, max_input_length: int = 512,
+                 make_stopping_criteria=None, prepare_inputs=None):
+        self.model = model
+        self.tokenizer = tokenizer
+        self.max_batch_size = max_batch_size or config.GENERATION_MAX_BATCH_SIZE
+        self.max_wait = config.GENERATION_MAX_WAIT if max_wait is None else max_wait
+        self.generate_kwargs = generate_kwargs or {}
+        self.postprocess = postprocess
+        self.make_stopping_criteria = make_stopping_criteria
+        self.prepare_inputs = prepare_inputs
+        self.max_input_length = max_input_length
+        self.stats = {"requests": 0, "batches": 0, "generated_tokens": 0}
+        self._requests = queue.Queue()
+        self._closed = False
+        if self.tokenizer.pad_token_id is None:
+            self.tokenizer.pad_token = self.tokenizer.eos_token
+        self._worker = threading.Thread(target=self._loop, name="generation-scheduler", daemon=True)
+        self._worker.start()
+
+    def submit(self, prompt: str, **options) -> Future:
+        """Queues a prompt; the Future resolves to the (post-processed) completion text."""
+        if self._closed:
+            raise RuntimeError("GenerationScheduler is closed.")
+        future = Future()
+        self._requests.put((prompt, future, dict(options, traces=metrics.current_traces())))
+        return future
+
+    def generate(self, prompt: str, timeout: float | None = None):
+        """Blocking helper: submits a prompt and waits for its result."""
+        return self.submit(prompt).result(timeout=timeout)
+
+    def close(self):
+        self._closed = True
+        self._requests.put(None)
+        self._worker.join()
+
+    def _collect_batch(self) -> list:
+        first = self._requests.get()
+        if first is None:
+            return []
+        batch = [first]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                item = self._requests.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if item is None:
+                self._requests.put(None)
+                break
+            batch.append(item)
+        return batch
+
+    def _loop(self):
+        while True:
+            batch = self._collect_batch()
+            if not batch:
+                return
+            batch = [request for request in batch if request[1].set_running_or_notify_cancel()]
+            if not batch:
+                continue
+            try:
+                completions = self._run_batch([prompt for prompt, _, _ in batch], [options for _, _, options in batch])
+            except Exception as e:
+                for _, future, _ in batch:
+                    future.set_exception(e)
+                continue
+            for (_, future, _), text in zip(batch, completions):
+                try:
+                    future.set_result(self.postprocess(text) if self.postprocess else text)
+                except Exception as e:
+                    future.set_exception(e)
+
+    def _run_batch(self, prompts: list[str], options: list[dict]) -> list[str]:
+        inputs = self.prepare_inputs(prompts) if self.prepare_inputs is not None else None
+        if inputs is None:
+            # Left padding keeps every prompt's last token adjacent to its first generated token.
+            self.tokenizer.padding_side = "left"
+            inputs = self.tokenizer(
+                prompts, return_tensors="pt", padding=True, truncation=True, max_length=self.max_input_length
+            ).to(self.model.device)
+        input_length = inputs["input_ids"].shape[1]
+        extra = {}
+        if self.make_stopping_criteria is not None:
+            stopping_criteria = self.make_stopping_criteria(input_length, options)
+            if stopping_criteria is not None:
+                extra["stopping_criteria"] = stopping_criteria
+        start = time.perf_counter()
+        # The batch serves every request in it, so its spans go into each request's trace.
+        traces = [trace for o in options for trace in o.get("traces", ())]
+        with metrics.attach_traces(traces), metrics.span("llm_generate", batch_size=len(prompts)):
+            with torch.inference_mode():
+                outputs = self.model.generate(
+                    **inputs, pad_token_id=self.tokenizer.pad_token_id, **self.generate_kwargs, **extra
+                )
+        seconds = time.perf_counter() - start
+        new_tokens = outputs[:, input_length:]
+        num_tokens = int((new_tokens != self.tokenizer.pad_token_id).sum())
+        self.stats["requests"] += len(prompts)
+        self.stats["batches"] += 1
+        self.stats["generated_tokens"] += num_tokens
+        generated_tokens.inc(num_tokens)
+        tokens_per_second.observe(num_tokens / max(seconds, 1e-9))
+        return self.tokenizer.batch_decode(new_tokens, skip_special_tokens=True)
@@ -0,0 +1,171 @@
+import hashlib
+import json
+import os
+import re
+from collections import Counter
+
+import numpy as np
+
+from src import config
+from src.numpy_index import COLUMNS_FILE, EMBEDDINGS_FILE, NumpyIndex
+
+BM25_FILE = "bm25.npz"
+VOCAB_FILE = "bm25_vocab.json"
+
+_TOKEN = re.compile(r"\w+")
+
+
+def export_signature(columns) -> str:
+    """Fingerprint of an exported NumPy index's row order and texts."""
+    digest = hashlib.blake2b(digest_size=16)
+    for name in ("ids", "documents"):
+        digest.update(np.ascontiguousarray(columns[name]).tobytes())
+    return digest.hexdigest()
+
+
+def tokenize(text: str) -> list[str]:
+    """Lowercased word tokens; brand names, colors and product codes stay whole."""
+    return _TOKEN.findall(text.lower())
+
+
+def build_bm25_index(directory: str | None = None, k1: float | None = None, b: float | None = None):
+    """
+    Builds an inverted BM25 index over the documents of an exported NumPy
+    index, so posting row numbers are the index's own rows. Each document is
+    indexed together with its product id. BM25 term weights only depend on the
+    catalog, so they are computed here and a query just sums them.
+    """
+    directory = directory or config.NUMPY_INDEX_DIR
+    k1 = config.BM25_K1 if k1 is None else k1
+    b = config.BM25_B if b is None else b
+    with np.load(os.path.join(directory, COLUMNS_FILE)) as columns:
+        ids, documents = columns["ids"], columns["documents"]
+    signature = export_signature({"ids": ids, "documents": documents})
+
+    vocab = {}
+    term_ids, rows, tfs = [], [], []
+    doc_lengths = np.zeros(len(documents), dtype=np.float32)
+    for row, (doc_id, text) in enumerate(zip(ids, documents)):
+        counts = Counter(tokenize(f"{text} {doc_id}"))
+        doc_lengths[row] = sum(counts.values())
+        for term, tf in counts.items():
+            term_ids.append(vocab.setdefault(term, len(vocab)))
+            rows.append(row)
+            tfs.append(tf)
+
+    term_ids = np.asarray(term_ids, dtype=np.int64)
+    # A stable sort keeps each term's postings in ascending row order.
+    order = np.argsort(term_ids, kind="stable")
+    term_ids = term_ids[order]
+    rows = np.asarray(rows, dtype=np.int32)[order]
+    tfs = np.asarray(tfs, dtype=np.float32)[order]
+
+    doc_freq = np.bincount(term_ids, minlength=len(vocab))
+    offsets = np.concatenate([[0], np.cumsum(doc_freq)]).astype(np.int64)
+    idf = np.log1p((len(documents) - doc_freq + 0.5) / (doc_freq + 0.5))
+    norm = k1 * (1 - b + b * doc_lengths[rows] / max(float(doc_lengths.mean()), 1.0))
+    weights = (idf[term_ids] * tfs * (k1 + 1) / (tfs + norm)).astype(np.float32)
+
+    np.savez(os.path.join(directory, BM25_FILE), offsets=offsets, rows=rows, weights=weights,
+             signature=np.asarray(signature))
+    with open(os.path.join(directory, VOCAB_FILE), "w", encoding="utf-8") as f:
+        json.dump(vocab, f, ensure_ascii=False)
+    print(f"Built BM25 index: {len(vocab)} terms, {len(rows)} postings.")
+
+
+def reciprocal_rank_fusion(rankings, limit: int, rrf_k: int | None = None) -> np.ndarray:
+    """Merges rankings of row numbers by summing 1 / (rrf_k + rank) per row."""
+    rrf_k = config.HYBRID_RRF_K if rrf_k is None else rrf_k
+    scores = {}
+    for ranking in rankings:
+        for rank, row in enumerate(ranking.tolist(), start=1):
+            scores[row] = scores.get(row, 0.0) + 1.0 / (rrf_k + rank)
+    fused = sorted(scores, key=scores.get, reverse=True)
+    return np.asarray(fused[:limit], dtype=np.int64)
+
+
+class HybridIndex(NumpyIndex):
+    """
+    NumpyIndex plus a BM25 inverted index over the same rows.
+
+    The gender and price filter first narrows the search to one contiguous row
+    range; inside it the query is ranked both by vector distance and by BM25,
+    and the two rankings are merged with reciprocal rank fusion.
+    """
+
+    def __init__(self, directory: str, embedding_function):
+        super().__init__(directory, embedding_function)
+        with np.load(os.path.join(directory, BM25_FILE)) as bm25:
+            # Postings are row numbers, so they are only valid for the export they were built from.
+            built_for = str(bm25["signature"]) if "signature" in bm25.files else None
+            if built_for != export_signature(self.columns):
+                raise ValueError(
+                    f"The BM25 index in {directory} was built for a different NumPy index export. "
+                    "Rebuild it with 'python build_database.py --hybrid-index'."
+                )
+            self.offsets = bm25["offsets"]
+            self.posting_rows = bm25["rows"]
+            self.posting_weights = bm25["weights"]
+        with open(os.path.join(directory, VOCAB_FILE), "r", encoding="utf-8") as f:
+            self.vocab = json.load(f)
+
+    def _lexical_rows(self, query: str, n: int, start: int, stop: int) -> np.ndarray:
+        rows, weights = [], []
+        for term in dict.fromkeys(tokenize(query)):
+            term_id = self.vocab.get(term)
+            if term_id is None:
+                continue
+            lo, hi = self.offsets[term_id], self.offsets[term_id + 1]
+            postings = self.posting_rows[lo:hi]
+            # Postings are sorted by row, so the filter range is two binary searches.
+            first, last = np.searchsorted(postings, (start, stop))
+            rows.append(postings[first:last])
+            weights.append(self.posting_weights[lo + first:lo + last])
+        if not rows:
+            return np.empty(0, dtype=np.int64)
+        matched, inverse = np.unique(np.concatenate(rows), return_inverse=True)
+        if len(matched) == 0:
+            return np.empty(0, dtype=np.int64)
+        scores = np.bincount(inverse, weights=np.concatenate(weights))
+        n = min(n, len(matched))
+        top = np.argpartition(-scores, n - 1)[:n]
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return matched[top].astype(np.int64)
+
+    def lexical_rows(self, query: str, n: int = 4, filter: dict | None = None) -> np.ndarray:
+        """Returns the global row numbers of the top-n BM25 matches, best first."""
+        start, stop = self._rows_for(filter)
+        return self._lexical_rows(query, n, start, stop)
+
+    def search_rows_hybrid(self, query: str, query_vector, k: int = 4, filter: dict | None = None) -> np.ndarray:
+        """Returns the top-k rows of the fused dense and BM25 rankings, best first."""
+        candidates = max(k, config.HYBRID_CANDIDATES)
+        start, stop = self._rows_for(filter)
+        dense = self.search_rows(query_vector, k=candidates, filter=filter)
+        lexical = self._lexical_rows(query, candidates, start, stop)
+        return reciprocal_rank_fusion((dense, lexical), limit=k)
+
+    def hybrid_search_many(self, queries: list[str], query_vectors, k: int = 4, filter: dict | None = None):
+        """Like `similarity_search` for many queries; the dense rankings come from one matrix product."""
+        candidates = max(k, config.HYBRID_CANDIDATES)
+        start, stop = self._rows_for(filter)
+        dense = self.search_rows_batch(query_vectors, k=candidates, filter=filter)
+        return [
+            [self._document(row) for row in reciprocal_rank_fusion(
+                (rows, self._lexical_rows(query, candidates, start, stop)), limit=k)]
+            for query, rows in zip(queries, dense)
+        ]
+
+    def similarity_search(self, query: str, k: int = 4, filter: dict | None = None, **kwargs):
+        query_vector = self.embedding_function.embed_query(query)
+        return [self._document(row) for row in self.search_rows_hybrid(query, query_vector, k=k, filter=filter)]
+
+
+def load_hybrid_index(embedding_function, directory: str | None = None) -> HybridIndex:
+    directory = directory or config.NUMPY_INDEX_DIR
+    if not all(os.path.exists(os.path.join(directory, name)) for name in (EMBEDDINGS_FILE, BM25_FILE)):
+        raise FileNotFoundError(
+            f"Hybrid index not found at {directory}. "
+            "Please run 'python build_database.py --hybrid-index' first to build it."
+        )
+    return HybridIndex(directory, embedding_function)
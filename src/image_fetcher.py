@@ -0,0 +1,181 @@
+import contextvars
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from io import BytesIO
+
+import requests
+from requests.adapters import HTTPAdapter
+from PIL import Image
+
+from src import config
+
+# --- Shared HTTP session and worker pool ---
+# One pooled session is reused for every download so connections to the
+# image CDN stay alive between searches.
+_session = None
+_executor = None
+_init_lock = threading.Lock()
+
+
+class FetchDeadlineExceeded(Exception):
+    """Raised inside a worker when the overall fetch deadline has passed."""
+
+
+def get_session() -> requests.Session:
+    """Returns the shared, connection-pooled HTTP session."""
+    global _session
+    if _session is None:
+        with _init_lock:
+            if _session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(
+                    pool_connections=config.IMAGE_FETCH_WORKERS,
+                    pool_maxsize=config.IMAGE_FETCH_WORKERS,
+                )
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+                _session = session
+    return _session
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        with _init_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=config.IMAGE_FETCH_WORKERS,
+                    thread_name_prefix="image-fetch",
+                )
+    return _executor
+
+
+def fetch_url(url: str, timeout: float | None = None, deadline: float | None = None,
+              session: requests.Session | None = None, headers: dict | None = None):
+    """
+    Performs a GET through the pooled session and returns `(status_code, body, headers)`.
+    `timeout` bounds the whole download; `deadline` is an absolute time.monotonic()
+    value after which the download is abandoned. A 304 response is returned as-is
+    so callers can use conditional request headers.
+    """
+    session = session or get_session()
+    timeout = config.IMAGE_FETCH_TIMEOUT if timeout is None else timeout
+    cutoff = time.monotonic() + timeout
+    if deadline is not None:
+        cutoff = min(cutoff, deadline)
+
+    remaining = cutoff - time.monotonic()
+    if remaining <= 0:
+        raise FetchDeadlineExceeded(url)
+
+    # requests' timeout only bounds connect and each socket read, so the body is
+    # streamed and the total elapsed time is checked between chunks.
+    with session.get(url, timeout=remaining, stream=True, headers=headers) as response:
+        if response.status_code == 304:
+            return 304, b"", response.headers
+        response.raise_for_status()
+        buffer = BytesIO()
+        for chunk in response.iter_content(chunk_size=64 * 1024):
+            if time.monotonic() > cutoff:
+                raise FetchDeadlineExceeded(url)
+            buffer.write(chunk)
+        return response.status_code, buffer.getvalue(), response.headers
+
+
+def download_image(url: str, timeout: float | None = None, deadline: float | None = None,
+                   session: requests.Session | None = None) -> Image.Image:
+    """Downloads a single image through the pooled session and returns a PIL Image."""
+    _, body, _ = fetch_url(url, timeout=timeout, deadline=deadline, session=session)
+    img = Image.open(BytesIO(body))
+    img.load()
+    return img
+
+
+def _fetch_one(url: str, size: tuple[int, int] | None, timeout: float, deadline: float,
+               session: requests.Session | None) -> Image.Image:
+    img = download_image(url, timeout=timeout, deadline=deadline, session=session)
+    if size is not None:
+        img = img.convert("RGB").resize(size)
+    return img
+
+
+def fetch_images(urls: list[str], size: tuple[int, int] | None = None, timeout: float | None = None,
+                 deadline: float | None = None, session: requests.Session | None = None, loader=None):
+    """
+    Fetches all `urls` concurrently on the bounded worker pool.
+
+    Returns `(images, stats)` where `images` has one entry per URL in the same
+    order (None for a fetch that failed or timed out) and `stats` counts how many
+    fetches were served, timed out or failed. `deadline` is the overall budget in
+    seconds for the whole batch. `loader` replaces the default download-and-resize
+    step and is called as `loader(url, size, timeout, deadline, session)`.
+    """
+    timeout = config.IMAGE_FETCH_TIMEOUT if timeout is None else timeout
+    deadline = config.IMAGE_FETCH_DEADLINE if deadline is None else deadline
+    stats = {"served": 0, "timed_out": 0, "failed": 0}
+    images = [None] * len(urls)
+    if not urls:
+        return images, stats
+
+    absolute_deadline = time.monotonic() + deadline
+    executor = _get_executor()
+    loader = loader or _fetch_one
+    # Each fetch runs in a copy of the caller's context, so its spans join the request's trace.
+    futures = [
+        executor.submit(contextvars.copy_context().run, loader, url, size, timeout, absolute_deadline, session)
+        for url in urls
+    ]
+    wait(futures, timeout=max(0.0, absolute_deadline - time.monotonic()))
+
+    for i, (url, future) in enumerate(zip(urls, futures)):
+        if not future.done():
+            # The worker notices the deadline on its own; don't wait for it here.
+            future.cancel()
+            stats["timed_out"] += 1
+            print(f"Warning: Timed out fetching image from {url}.")
+            continue
+        try:
+            images[i] = future.result()
+            stats["served"] += 1
+        except (FetchDeadlineExceeded, requests.Timeout):
+            stats["timed_out"] += 1
+            print(f"Warning: Timed out fetching image from {url}.")
+        except Exception as e:
+            stats["failed"] += 1
+            print(f"Warning: Could not fetch image from {url}. Error: {e}")
+
+    return images, stats
+
+
+def fetch_image_rows(urls_per_row: list[list[str]], per_row: int, size: tuple[int, int] | None = None,
+                     deadline: float | None = None, loader=None):
+    """
+    Fetches up to `per_row` images from each list of candidate URLs.
+
+    The first `per_row` URLs of every row are fetched in one concurrent batch;
+    slots whose image failed fall back to the row's next URLs in a follow-up
+    batch, until the row is full, its URLs run out or `deadline` (seconds for
+    all batches) passes. Returns `(rows, stats)` with each row's images in URL
+    order and the `fetch_images` counts summed over the batches.
+    """
+    deadline = config.IMAGE_FETCH_DEADLINE if deadline is None else deadline
+    cutoff = time.monotonic() + deadline
+    rows = [[] for _ in urls_per_row]
+    next_url = [0] * len(urls_per_row)
+    totals = {"served": 0, "timed_out": 0, "failed": 0}
+    while True:
+        batch = []
+        for i, urls in enumerate(urls_per_row):
+            take = urls[next_url[i]:next_url[i] + per_row - len(rows[i])]
+            next_url[i] += len(take)
+            batch += [(i, url) for url in take]
+        remaining = cutoff - time.monotonic()
+        if not batch or remaining <= 0:
+            return rows, totals
+        images, stats = fetch_images([url for _, url in batch], size=size, deadline=remaining, loader=loader)
+        for (i, _), img in zip(batch, images):
+            if img is not None:
+                rows[i].append(img)
+        for result, count in stats.items():
+            totals[result] += count
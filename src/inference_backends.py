@@ -0,0 +1,209 @@
+import os
+import time
+from contextlib import contextmanager
+
+import torch
+
+from src import config
+
+
+@contextmanager
+def _stage(name: str, timings: dict):
+    """Records how long one startup stage takes."""
+    start = time.perf_counter()
+    yield
+    timings[name] = time.perf_counter() - start
+
+
+def _report_stages(timings: dict, label: str = "LLM startup"):
+    total = sum(timings.values())
+    stages = ", ".join(f"{name}: {seconds:.1f}s" for name, seconds in timings.items())
+    print(f"{label} took {total:.1f}s ({stages}).")
+
+
+def snapshot_exists(path: str | None = None) -> bool:
+    return os.path.exists(os.path.join(path or config.LLM_SNAPSHOT_DIR, "config.json"))
+
+
+def _require_hub_token():
+    """Raises a clear error before logging into the Hub without a token."""
+    if not config.HUGGING_FACE_TOKEN:
+        raise RuntimeError(
+            f"No merged snapshot in {config.LLM_SNAPSHOT_DIR} and HUGGING_FACE_TOKEN is not set. "
+            "Set the token to load the model from the Hub, or run 'python export_model.py' once."
+        )
+
+
+# Sampling settings of the fine-tuned stylist model
+GENERATION_KWARGS = dict(max_new_tokens=1024, do_sample=True, top_p=0.9, temperature=0.7)
+
+
+class InferenceBackend:
+    """
+    One way of loading the stylist LLM. `load(timings)` returns a (model,
+    tokenizer) pair usable with `model.generate`, recording its startup stages
+    in `timings`; `generate_kwargs` are the decoding settings used with it.
+    """
+
+    name = None
+    generate_kwargs = GENERATION_KWARGS
+
+    def load(self, timings: dict):
+        raise NotImplementedError
+
+
+class PeftBackend(InferenceBackend):
+    """
+    The fine-tuned model on GPU, quantized to 4 bits with bitsandbytes. Uses the
+    local merged snapshot written by `python export_model.py` when it exists;
+    otherwise loads the model with its LoRA adapter from the Hub.
+    """
+
+    name = "peft"
+
+    def load(self, timings: dict):
+        from huggingface_hub import login
+        from peft import AutoPeftModelForCausalLM
+        from transformers import AutoModelForCausalLM, AutoTokenizer, BitsAndBytesConfig
+
+        if snapshot_exists():
+            print(f"Loading merged LLM snapshot from {config.LLM_SNAPSHOT_DIR}...")
+            with _stage("model", timings):
+                # safetensors weights are memory-mapped; no login or adapter work needed.
+                model = AutoModelForCausalLM.from_pretrained(
+                    config.LLM_SNAPSHOT_DIR,
+                    low_cpu_mem_usage=True,
+                    torch_dtype=torch.float16,
+                    quantization_config=BitsAndBytesConfig(load_in_4bit=True) if config.LLM_LOAD_IN_4BIT else None,
+                )
+            with _stage("tokenizer", timings):
+                tokenizer = AutoTokenizer.from_pretrained(config.LLM_SNAPSHOT_DIR)
+            return model, tokenizer
+
+        _require_hub_token()
+        print("Logging into Hugging Face...")
+        with _stage("login", timings):
+            login(token=config.HUGGING_FACE_TOKEN)
+
+        print("Loading fine-tuned LLM with LoRA adapter (this may take a while)...")
+        print("Tip: run 'python export_model.py' once to make future startups much faster.")
+
+        # Correctly load the fine-tuned model using AutoPeftModelForCausalLM
+        with _stage("model", timings):
+            model = AutoPeftModelForCausalLM.from_pretrained(
+                config.LLM_MODEL_NAME,
+                low_cpu_mem_usage=True,
+                torch_dtype=torch.float16,
+                load_in_4bit=config.LLM_LOAD_IN_4BIT,
+            )
+
+        with _stage("tokenizer", timings):
+            tokenizer = AutoTokenizer.from_pretrained(config.LLM_MODEL_NAME)
+        return model, tokenizer
+
+
+def quantize_int8(model):
+    """
+    Replaces every nn.Linear with a dynamically quantized int8 version: weights
+    are stored as int8 and activations are quantized on the fly per batch.
+    """
+    return torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+
+class CpuInt8Backend(InferenceBackend):
+    """
+    The merged snapshot on CPU, in float32 with int8 dynamically quantized
+    linear layers. Needs neither a GPU nor bitsandbytes, but does need the
+    snapshot written by `python export_model.py`.
+    """
+
+    name = "cpu-int8"
+
+    def __init__(self, model_path: str | None = None, num_threads: int | None = None):
+        self.model_path = model_path or config.LLM_SNAPSHOT_DIR
+        self.num_threads = num_threads or config.LLM_CPU_THREADS
+
+    def load(self, timings: dict):
+        from transformers import AutoModelForCausalLM, AutoTokenizer
+
+        if not snapshot_exists(self.model_path):
+            raise FileNotFoundError(
+                f"No merged snapshot in {self.model_path}. Run 'python export_model.py' first."
+            )
+        torch.set_num_threads(self.num_threads)
+        print(f"Loading {self.model_path} on CPU with {self.num_threads} threads...")
+        with _stage("model", timings):
+            model = AutoModelForCausalLM.from_pretrained(
+                self.model_path, low_cpu_mem_usage=True, torch_dtype=torch.float32
+            ).eval()
+        with _stage("quantize", timings):
+            model = quantize_int8(model)
+        with _stage("tokenizer", timings):
+            tokenizer = AutoTokenizer.from_pretrained(self.model_path)
+        return model, tokenizer
+
+
+class TinyBackend(InferenceBackend):
+    """
+    The offline tiny GPT-2 from `src.tiny_lm` with greedy decoding, so output
+    depends only on TINY_LM_SEED and the prompt. Meant for tests and benchmarks.
+    """
+
+    name = "tiny"
+    generate_kwargs = dict(max_new_tokens=128, do_sample=False)
+
+    def load(self, timings: dict):
+        from src.tiny_lm import build_tiny_lm
+
+        with _stage("model", timings):
+            model, tokenizer = build_tiny_lm(seed=config.TINY_LM_SEED)
+        return model, tokenizer
+
+
+BACKENDS = {backend.name: backend for backend in (PeftBackend, CpuInt8Backend, TinyBackend)}
+
+
+def get_backend(name: str | None = None) -> InferenceBackend:
+    """Returns the inference backend called `name` (default: config.INFERENCE_BACKEND)."""
+    name = name or config.INFERENCE_BACKEND
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown inference backend '{name}'. Choose one of: {', '.join(BACKENDS)}.")
+    return BACKENDS[name]()
+
+
+def export_merged_snapshot(output_dir: str | None = None):
+    """
+    Merges the LoRA adapter into the base model and saves the result, with its
+    tokenizer, as a local safetensors snapshot for fast startups.
+    """
+    from huggingface_hub import login
+    from peft import AutoPeftModelForCausalLM
+    from transformers import AutoTokenizer
+
+    output_dir = output_dir or config.LLM_SNAPSHOT_DIR
+    timings = {}
+    _require_hub_token()
+    print("Logging into Hugging Face...")
+    with _stage("login", timings):
+        login(token=config.HUGGING_FACE_TOKEN)
+
+    print("Loading base model and LoRA adapter in float16 for merging...")
+    with _stage("load", timings):
+        # Merging needs unquantized weights; quantization happens at load time instead.
+        model = AutoPeftModelForCausalLM.from_pretrained(
+            config.LLM_MODEL_NAME,
+            low_cpu_mem_usage=True,
+            torch_dtype=torch.float16,
+        )
+        tokenizer = AutoTokenizer.from_pretrained(config.LLM_MODEL_NAME)
+
+    print("Merging LoRA weights into the base model...")
+    with _stage("merge", timings):
+        model = model.merge_and_unload()
+
+    print(f"Saving merged snapshot to {output_dir}...")
+    with _stage("save", timings):
+        model.save_pretrained(output_dir, safe_serialization=True)
+        tokenizer.save_pretrained(output_dir)
+
+    _report_stages(timings, "Export")
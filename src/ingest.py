@@ -0,0 +1,159 @@
+import os
+import queue
+import threading
+from typing import Iterator, NamedTuple
+
+import numpy as np
+import pandas as pd
+
+from src import config
+
+
+class CatalogBatch(NamedTuple):
+    """One prepared slice of the catalog, ready to be embedded and stored."""
+    ids: list[str]
+    docs: list[str]
+    metadatas: list[dict]
+
+
+# --- Reading ---
+def iter_catalog_chunks(path: str, chunk_size: int | None = None) -> Iterator[pd.DataFrame]:
+    """
+    Streams the catalog as DataFrames of at most `chunk_size` rows. CSV files are
+    read with pandas; Parquet and Arrow/Feather files need `pyarrow`.
+    """
+    chunk_size = chunk_size or config.EMBED_BATCH_SIZE
+    ext = os.path.splitext(path)[1].lower()
+
+    if ext == ".csv":
+        yield from pd.read_csv(path, chunksize=chunk_size)
+        return
+
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError as e:
+        raise ImportError(f"Reading '{ext}' catalogs requires pyarrow. Install it with 'pip install pyarrow'.") from e
+
+    if ext == ".parquet":
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=chunk_size):
+            yield batch.to_pandas()
+    elif ext in (".arrow", ".feather", ".ipc"):
+        with pa.memory_map(path, "r") as source:
+            reader = pa.ipc.open_file(source)
+            for i in range(reader.num_record_batches):
+                batch = reader.get_batch(i)
+                for start in range(0, batch.num_rows, chunk_size):
+                    yield batch.slice(start, chunk_size).to_pandas()
+    else:
+        raise ValueError(f"Unsupported catalog format '{ext}'. Use .csv, .parquet or .arrow/.feather.")
+
+
+# --- Preparing ---
+def _text_column(df: pd.DataFrame, name: str) -> pd.Series:
+    if name not in df.columns:
+        return pd.Series("", index=df.index)
+    return df[name].fillna("").astype(str)
+
+
+def _id_column(df: pd.DataFrame, positions: np.ndarray) -> pd.Series:
+    """
+    Product ids as strings, or the catalog position if there is no id column.
+    Missing ids are left as NaN.
+    """
+    if config.CATALOG_ID_COLUMN not in df.columns:
+        return pd.Series(positions, index=df.index).astype(str)
+    ids = df[config.CATALOG_ID_COLUMN]
+    if pd.api.types.is_float_dtype(ids):
+        # Integer ids are read as floats when the column has gaps; keep "123", not "123.0".
+        return ids.map(lambda v: v if pd.isna(v) else str(int(v)) if float(v).is_integer() else str(v))
+    return ids.where(ids.isna(), ids.astype(str).str.strip()).replace("", np.nan)
+
+
+def prepare_chunk(df: pd.DataFrame, start_index: int) -> CatalogBatch:
+    """
+    Builds ids, document texts and metadata for a chunk using column-wise
+    operations. `start_index` is the catalog position of the chunk's first row
+    and becomes its `index_in_db`. Rows without a product id or a price are
+    skipped, since they could neither be told apart nor price-filtered.
+    """
+    positions = np.arange(start_index, start_index + len(df), dtype=np.int64)
+    ids = _id_column(df, positions)
+    price = pd.to_numeric(df["price"], errors="coerce")
+    keep = (ids.notna() & price.notna()).to_numpy()
+    if not keep.all():
+        print(f"Skipping {int((~keep).sum())} catalog rows from position {start_index} without a product id or price.")
+        df, ids, price, positions = df[keep], ids[keep], price[keep], positions[keep]
+
+    name = _text_column(df, "name")
+    gender = _text_column(df, "gender")
+    docs = (
+        "Product Name: " + name
+        + ". Description: " + _text_column(df, "description")
+        + ". Gender: " + gender + "."
+    )
+
+    frame = pd.DataFrame({
+        "index_in_db": positions,
+        "images": _text_column(df, "images").to_numpy(),
+        "price": price.astype(float).to_numpy(),
+        "name": name.to_numpy(),
+        "gender": gender.to_numpy(),
+    })
+    # Hash of everything that affects the embedding or stored metadata, except the
+    # row position, so incremental builds can tell changed rows from moved ones.
+    hashed = frame.drop(columns=["index_in_db"]).assign(document=docs.to_numpy())
+    frame["row_hash"] = pd.util.hash_pandas_object(hashed, index=False).map("{:016x}".format).to_numpy()
+
+    ids = ids.tolist()
+    # The stable id, unlike index_in_db, survives rows being inserted or removed.
+    frame["product_id"] = ids
+
+    return CatalogBatch(ids=ids, docs=docs.tolist(), metadatas=frame.to_dict("records"))
+
+
+def iter_catalog_batches(path: str, batch_size: int | None = None, prefetch: int = 2) -> Iterator[CatalogBatch]:
+    """
+    Yields prepared batches of the catalog. Reading and preparing run on a
+    background producer thread that stays at most `prefetch` batches ahead of the
+    consumer (which embeds and stores them), so peak memory does not depend on
+    the catalog size.
+    """
+    batch_size = batch_size or config.EMBED_BATCH_SIZE
+    batches = queue.Queue(maxsize=prefetch)
+    stop = threading.Event()
+    done = object()
+
+    def _put(item) -> bool:
+        while not stop.is_set():
+            try:
+                batches.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _produce():
+        try:
+            position = 0
+            for chunk in iter_catalog_chunks(path, chunk_size=batch_size):
+                if not _put(prepare_chunk(chunk, position)):
+                    return
+                position += len(chunk)
+            _put(done)
+        except BaseException as e:  # Forward reader errors to the consumer.
+            _put(e)
+
+    producer = threading.Thread(target=_produce, name="catalog-ingest", daemon=True)
+    producer.start()
+    try:
+        while True:
+            item = batches.get()
+            if item is done:
+                return
+            if isinstance(item, BaseException):
+                raise item
+            yield item
+    finally:
+        stop.set()
+        producer.join(timeout=1.0)
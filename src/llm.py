@@ -1,43 +1,64 @@
 import torch
-from peft import AutoPeftModelForCausalLM
-from transformers import AutoTokenizer, BitsAndBytesConfig
-from huggingface_hub import login
+from transformers import StoppingCriteria, StoppingCriteriaList
 from src import config
+from src import metrics
+from src.generation_scheduler import GenerationScheduler, generated_tokens, tokens_per_second
+from src.inference_backends import InferenceBackend, _report_stages, _stage, get_backend
+from src.prefix_cache import PrefixCache
+from concurrent.futures import Future
+import contextvars
+import threading
+import time
+import queue
 import json
 import re
 
-def load_llm_and_tokenizer():
+_parse_failures = metrics.counter("llm_parse_failures", "LLM outputs from which no outfit could be parsed.")
+
+# Backend the current model was loaded with; decides the decoding settings
+_backend = None
+
+
+def load_llm_and_tokenizer(backend: str | None = None):
     """
-    Loads the fine-tuned LLM with LoRA parameters and its tokenizer,
-    as specified by the model's documentation.
+    Loads the stylist LLM and its tokenizer through the configured inference
+    backend (see src/inference_backends.py), then precomputes the prefix cache.
     """
-    print("Logging into Hugging Face...")
-    login(token=config.HUGGING_FACE_TOKEN)
+    global _backend
+    _backend = get_backend(backend)
+    timings = {}
+    print(f"Loading the LLM with the '{_backend.name}' inference backend...")
+    model, tokenizer = _backend.load(timings)
 
-    print("Loading fine-tuned LLM with LoRA adapter (this may take a while)...")
-    
-    # Correctly load the fine-tuned model using AutoPeftModelForCausalLM
-    model = AutoPeftModelForCausalLM.from_pretrained(
-        config.LLM_MODEL_NAME,
-        low_cpu_mem_usage=True,
-        torch_dtype=torch.float16,
-        load_in_4bit=True,
-    )
-    
-    tokenizer = AutoTokenizer.from_pretrained(config.LLM_MODEL_NAME)
+    if config.PREFIX_CACHE_ENABLED:
+        print("Precomputing the attention cache for the fixed stylist instruction...")
+        with _stage("prefix_cache", timings):
+            get_prefix_cache(model, tokenizer)
     
     print("LLM loaded successfully.")
+    _report_stages(timings)
     return model, tokenizer
 
 
+def get_active_backend() -> InferenceBackend:
+    """Returns the backend the LLM was loaded with, or the configured one."""
+    global _backend
+    if _backend is None:
+        _backend = get_backend()
+    return _backend
+
+
+# Fixed leading part of every prompt; its attention state is computed once and reused.
+STYLIST_INSTRUCTION = """You are a personal stylist recommending fashion advice and clothing combinations. Use the self body and style description below, combined with the event described in the context to generate 5 self-contained and complete outfit combinations.
+        ### Input:
+"""
+
 
 def format_instruction(input_details: str, event: str) -> str:
     """
     Creates the prompt for the LLM.
     """
-    return f"""You are a personal stylist recommending fashion advice and clothing combinations. Use the self body and style description below, combined with the event described in the context to generate 5 self-contained and complete outfit combinations.
-        ### Input:
-        {input_details}
+    return STYLIST_INSTRUCTION + f"""        {input_details}
 
         ### Context:
         I'm going to a {event}.
@@ -46,6 +67,26 @@ def format_instruction(input_details: str, event: str) -> str:
     """
 
 
+# "N. Outfit:" at the start of a line; splits the generation into outfit blocks
+_OUTFIT_HEADER = re.compile(r'(?:^|\n)\s*\d+\.\s*Outfit:')
+
+
+def _parse_outfit_block(chunk: str) -> dict:
+    """Collects the "- Key: Value" lines of one outfit block."""
+    outfit_dict = {}
+    for line in chunk.strip().split('\n'):
+        line = line.strip()
+        if line.startswith('-'):
+            # Split the line at the first colon
+            parts = line[1:].split(':', 1)
+            if len(parts) == 2:
+                key = parts[0].strip()
+                value = parts[1].strip()
+                # Capitalize the key for consistency (e.g., 'top' -> 'Top')
+                outfit_dict[key.capitalize()] = value
+    return outfit_dict
+
+
 def parse_outfit_recommendation(text: str) -> list | None:
     """
     Parses the model's markdown list output into a structured list of dictionaries.
@@ -53,26 +94,13 @@ def parse_outfit_recommendation(text: str) -> list | None:
     try:
         outfits = []
         # Split the text into chunks for each outfit, using the numbering (1., 2., etc.) as a delimiter
-        outfit_chunks = re.split(r'\n\d+\.\s*Outfit:', text)
+        outfit_chunks = _OUTFIT_HEADER.split(text)
         
         for chunk in outfit_chunks:
             if not chunk.strip():
                 continue
             
-            outfit_dict = {}
-            # Find all the "- Key: Value" lines
-            lines = chunk.strip().split('\n')
-            for line in lines:
-                line = line.strip()
-                if line.startswith('-'):
-                    # Split the line at the first colon
-                    parts = line[1:].split(':', 1)
-                    if len(parts) == 2:
-                        key = parts[0].strip()
-                        value = parts[1].strip()
-                        # Capitalize the key for consistency (e.g., 'top' -> 'Top')
-                        outfit_dict[key.capitalize()] = value
-            
+            outfit_dict = _parse_outfit_block(chunk)
             if outfit_dict:
                 outfits.append(outfit_dict)
                 
@@ -84,24 +112,205 @@ def parse_outfit_recommendation(text: str) -> list | None:
 
     except Exception as e:
         print(f"Error parsing LLM markdown output: {e}")
+        _parse_failures.inc()
+        return None
+
+
+# --- Streaming: incremental parsing and early stopping ---
+_REQUIRED_OUTFIT_KEYS = ("Top", "Bottom", "Accessories")
+_LOOP_WINDOW = 120  # Characters; a tail seen before means the model is repeating itself
+
+
+class OutfitStreamParser:
+    """
+    Finds complete "N. Outfit:" blocks in a growing generation. A block is
+    complete once the next header starts or the generation ends; the block that
+    reaches `num_outfits` also completes once its last line has ended and it has
+    the required fields plus every field seen in earlier blocks, so generation
+    can stop without waiting for another header. Blocks without fields are
+    skipped. Completed outfits are passed to `on_outfit`.
+    """
+
+    def __init__(self, num_outfits: int = 5, on_outfit=None):
+        self.num_outfits = num_outfits
+        self.on_outfit = on_outfit
+        self.outfits = []
+        self.repeating = False
+        self._blocks = 0  # Headers whose blocks have been handled
+        self._fields = set(_REQUIRED_OUTFIT_KEYS)
+
+    @property
+    def done(self) -> bool:
+        return self.repeating or len(self.outfits) >= self.num_outfits
+
+    def update(self, text: str, finished: bool = False):
+        """Feeds the full text generated so far; `finished` once generation has ended."""
+        if len(text) > 3 * _LOOP_WINDOW and text[-_LOOP_WINDOW:] in text[:-_LOOP_WINDOW]:
+            self.repeating = True
+            return
+        headers = list(_OUTFIT_HEADER.finditer(text))
+        while self._blocks < len(headers) and not self.done:
+            k = self._blocks
+            has_next = k + 1 < len(headers)
+            body = text[headers[k].end():headers[k + 1].start() if has_next else len(text)]
+            outfit = _parse_outfit_block(body)
+            complete = has_next or finished or (
+                len(self.outfits) + 1 == self.num_outfits
+                and body.endswith('\n') and self._fields <= outfit.keys()
+            )
+            if not complete:
+                return
+            self._blocks += 1
+            if not outfit:
+                continue
+            if outfit in self.outfits:
+                self.repeating = True
+                return
+            self._fields.update(outfit)
+            self.outfits.append(outfit)
+            if self.on_outfit is not None:
+                self.on_outfit(outfit)
+
+
+class OutfitStoppingCriteria(StoppingCriteria):
+    """Stops each row of a generate() call once its parser has enough outfits."""
+
+    def __init__(self, tokenizer, input_length: int, parsers: list[OutfitStreamParser]):
+        self.tokenizer = tokenizer
+        self.input_length = input_length
+        self.parsers = parsers
+        self.finished = [False] * len(parsers)
+
+    def __call__(self, input_ids, scores, **kwargs):
+        done = []
+        for row, parser in enumerate(self.parsers):
+            # Blocks only complete at line ends or at EOS, so only re-parse then.
+            at_eos = not self.finished[row] and int(input_ids[row, -1]) == self.tokenizer.eos_token_id
+            if not parser.done and (at_eos or '\n' in self.tokenizer.decode(input_ids[row, -1:])):
+                text = self.tokenizer.decode(input_ids[row, self.input_length:], skip_special_tokens=True)
+                parser.update(text, finished=at_eos)
+            self.finished[row] = self.finished[row] or at_eos
+            done.append(parser.done)
+        return torch.tensor(done, dtype=torch.bool, device=input_ids.device)
+
+
+def _make_stopping_criteria(tokenizer):
+    def make(input_length: int, options: list[dict]):
+        parsers = [
+            OutfitStreamParser(config.NUM_OUTFITS, on_outfit=o.get("on_outfit")) for o in options
+        ]
+        return StoppingCriteriaList([OutfitStoppingCriteria(tokenizer, input_length, parsers)])
+    return make
+
+
+def _finalize_outfits(text: str) -> list | None:
+    """Parses the full generation, dropping repeats and anything past NUM_OUTFITS."""
+    with metrics.span("parse"):
+        outfits = parse_outfit_recommendation(text.strip())
+    if not outfits:
+        return outfits
+    unique = []
+    for outfit in outfits:
+        if outfit not in unique:
+            unique.append(outfit)
+    return unique[:config.NUM_OUTFITS]
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+_prefix_cache = None
+_prefix_cache_lock = threading.Lock()
+
+
+def get_prefix_cache(model, tokenizer) -> PrefixCache | None:
+    """Returns the KV cache of STYLIST_INSTRUCTION for `model`, or None if disabled."""
+    global _prefix_cache
+    if not config.PREFIX_CACHE_ENABLED:
         return None
+    if _prefix_cache is None or _prefix_cache.model is not model:
+        with _prefix_cache_lock:
+            if _prefix_cache is None or _prefix_cache.model is not model:
+                _prefix_cache = PrefixCache(model, tokenizer, STYLIST_INSTRUCTION)
+    return _prefix_cache
 
-def get_outfit_recommendation(details: str, event: str, model, tokenizer) -> list | None:
+
+def _prepare_inputs(model, tokenizer, prompts: list[str]) -> dict | None:
+    prefix_cache = get_prefix_cache(model, tokenizer)
+    return prefix_cache.prepare_inputs(prompts) if prefix_cache is not None else None
+
+
+def get_generation_scheduler(model, tokenizer) -> GenerationScheduler:
+    """Returns the shared batching scheduler for `model`, creating it on first use."""
+    global _scheduler
+    if _scheduler is None or _scheduler.model is not model:
+        with _scheduler_lock:
+            if _scheduler is None or _scheduler.model is not model:
+                _scheduler = GenerationScheduler(
+                    model, tokenizer,
+                    generate_kwargs=get_active_backend().generate_kwargs,
+                    postprocess=_finalize_outfits,
+                    make_stopping_criteria=_make_stopping_criteria(tokenizer),
+                    prepare_inputs=lambda prompts: _prepare_inputs(model, tokenizer, prompts),
+                )
+    return _scheduler
+
+
+def _generate_single(prompt: str, model, tokenizer, on_outfit=None) -> Future:
+    """Runs one unbatched generation on a helper thread; resolves to the parsed outfits."""
+    future = Future()
+
+    def run():
+        try:
+            inputs = _prepare_inputs(model, tokenizer, [prompt])
+            if inputs is None:
+                inputs = tokenizer(prompt, return_tensors="pt", truncation=True, max_length=512).to(model.device)
+            input_ids = inputs["input_ids"]
+            stopping_criteria = _make_stopping_criteria(tokenizer)(input_ids.shape[1], [{"on_outfit": on_outfit}])
+            start = time.perf_counter()
+            with metrics.span("llm_generate", batch_size=1), torch.inference_mode():
+                outputs = model.generate(
+                    **inputs, pad_token_id=tokenizer.eos_token_id,
+                    stopping_criteria=stopping_criteria, **get_active_backend().generate_kwargs
+                )
+            num_tokens = outputs.shape[1] - input_ids.shape[1]
+            generated_tokens.inc(num_tokens)
+            tokens_per_second.observe(num_tokens / max(time.perf_counter() - start, 1e-9))
+            # Decode only the newly generated tokens
+            raw_output = tokenizer.decode(outputs[0][input_ids.shape[1]:], skip_special_tokens=True)
+            # --- USE THE NEW REGEX PARSER ---
+            future.set_result(_finalize_outfits(raw_output))
+        except Exception as e:
+            future.set_exception(e)
+
+    # Run in the caller's context so the generation spans join its trace.
+    threading.Thread(target=contextvars.copy_context().run, args=(run,), name="outfit-generation", daemon=True).start()
+    return future
+
+
+def get_outfit_recommendation(details: str, event: str, model, tokenizer, on_outfit=None) -> list | None:
     """
     Generates outfit recommendations and parses the markdown output.
+    Generation stops as soon as NUM_OUTFITS outfits are parsed or the model starts
+    repeating itself. `on_outfit(outfit)` is called on the caller's thread for each
+    outfit as soon as it is complete. With GENERATION_BATCHING enabled, concurrent
+    calls share batched generate() runs.
     """
     prompt = format_instruction(details, event)
-    input_ids = tokenizer(prompt, return_tensors="pt", truncation=True, max_length=512).input_ids.to(model.device)
-    
-    print("Generating recommendation...")
-    with torch.inference_mode():
-        outputs = model.generate(
-            input_ids=input_ids, max_new_tokens=1024, do_sample=True, top_p=0.9, temperature=0.7,
-            pad_token_id=tokenizer.eos_token_id
-        )
-    
-    response_text = tokenizer.decode(outputs[0], skip_special_tokens=True)
-    raw_output = response_text[len(prompt):].strip()
+    ready = queue.Queue()
+    stream = ready.put if on_outfit is not None else None
+
+    if config.GENERATION_BATCHING:
+        print("Generating recommendation (batched)...")
+        future = get_generation_scheduler(model, tokenizer).submit(prompt, on_outfit=stream)
+    else:
+        print("Generating recommendation...")
+        future = _generate_single(prompt, model, tokenizer, on_outfit=stream)
 
-    # --- USE THE NEW REGEX PARSER ---
-    return parse_outfit_recommendation(raw_output)
\ No newline at end of file
+    # Hand outfits to the caller while generation continues in the background.
+    with metrics.span("generation", batched=config.GENERATION_BATCHING):
+        while on_outfit is not None and not (future.done() and ready.empty()):
+            try:
+                on_outfit(ready.get(timeout=0.05))
+            except queue.Empty:
+                continue
+        return future.result()
@@ -0,0 +1,268 @@
+import contextvars
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from src import config
+
+# Upper bounds (seconds) of the latency histogram buckets
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _label_key(labels: dict) -> tuple:
+    return tuple(sorted(labels.items()))
+
+
+def _format_labels(key: tuple, extra: str = "") -> str:
+    parts = [f'{name}="{value}"' for name, value in key]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class Counter:
+    """Monotonic count per label set."""
+
+    def __init__(self, name: str, help_text: str):
+        self.name = name
+        self.help_text = help_text
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels):
+        if not config.METRICS_ENABLED:
+            return
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            lines += [f"{self.name}{_format_labels(key)} {value:g}" for key, value in self._values.items()]
+        return lines
+
+
+class Histogram:
+    """Bucketed distribution per label set (Prometheus histogram semantics)."""
+
+    def __init__(self, name: str, help_text: str, buckets: tuple = LATENCY_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = buckets
+        self._values = {}  # label key -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        if not config.METRICS_ENABLED:
+            return
+        key = _label_key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[i] += 1
+                    break
+            state[-2] += value
+            state[-1] += 1
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            items = [(key, list(state)) for key, state in self._values.items()]
+        for key, state in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets, state):
+                cumulative += count
+                bucket_labels = _format_labels(key, f'le="{bound:g}"')
+                lines.append(f"{self.name}_bucket{bucket_labels} {cumulative}")
+            bucket_labels = _format_labels(key, 'le="+Inf"')
+            lines.append(f"{self.name}_bucket{bucket_labels} {state[-1]}")
+            lines.append(f"{self.name}_sum{_format_labels(key)} {state[-2]:g}")
+            lines.append(f"{self.name}_count{_format_labels(key)} {state[-1]}")
+        return lines
+
+
+class CallbackGauge:
+    """Values read from `fn()` ({label value: number}) only when metrics are scraped."""
+
+    def __init__(self, name: str, help_text: str, fn, label: str):
+        self.name = name
+        self.help_text = help_text
+        self.fn = fn
+        self.label = label
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} gauge"]
+        try:
+            values = self.fn()
+        except Exception as e:
+            print(f"Metric {self.name} could not be read: {e}")
+            return lines
+        for label_value, value in values.items():
+            lines.append(f'{self.name}{{{self.label}="{label_value}"}} {float(value):g}')
+        return lines
+
+
+# --- Registry ---
+_registry = {}
+_registry_lock = threading.Lock()
+
+
+def _register(metric):
+    with _registry_lock:
+        return _registry.setdefault(metric.name, metric)
+
+
+def counter(name: str, help_text: str) -> Counter:
+    return _register(Counter(f"stylist_{name}_total", help_text))
+
+
+def histogram(name: str, help_text: str, buckets: tuple = LATENCY_BUCKETS) -> Histogram:
+    return _register(Histogram(f"stylist_{name}", help_text, buckets))
+
+
+def gauge_callback(name: str, help_text: str, fn, label: str = "name"):
+    """Registers (or replaces) a gauge computed from `fn()` at scrape time."""
+    with _registry_lock:
+        _registry[f"stylist_{name}"] = CallbackGauge(f"stylist_{name}", help_text, fn, label)
+
+
+def render() -> str:
+    """All registered metrics in the Prometheus text exposition format."""
+    with _registry_lock:
+        metrics = list(_registry.values())
+    lines = []
+    for metric in metrics:
+        lines += metric.render()
+    return "\n".join(lines) + "\n"
+
+
+# --- Spans and per-request traces ---
+span_seconds = histogram("span_seconds", "Duration of instrumented hot-path stages.")
+# Traces the current spans belong to. A context variable, so work handed to
+# other threads with contextvars.copy_context() (see src/image_fetcher.py)
+# still records into the request's trace.
+_traces = contextvars.ContextVar("traces", default=())
+_trace_file = None
+_trace_lock = threading.Lock()
+
+
+_NULL_SPAN = nullcontext()
+
+
+class _Span:
+    __slots__ = ("name", "labels", "start")
+
+    def __init__(self, name: str, labels: dict):
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc_info):
+        seconds = time.perf_counter() - self.start
+        span_seconds.observe(seconds, stage=self.name, **self.labels)
+        for trace in _traces.get():
+            trace["spans"].append({"stage": self.name, "ms": round(seconds * 1000, 3), **self.labels})
+
+
+def span(name: str, **labels):
+    """Times a block into `stylist_span_seconds{stage=name}` and the current trace."""
+    if not config.METRICS_ENABLED:
+        return _NULL_SPAN
+    return _Span(name, labels)
+
+
+def _write_trace(record: dict):
+    global _trace_file
+    with _trace_lock:
+        if _trace_file is None:
+            os.makedirs(os.path.dirname(config.TRACE_LOG_PATH) or ".", exist_ok=True)
+            _trace_file = open(config.TRACE_LOG_PATH, "a", encoding="utf-8")
+        _trace_file.write(json.dumps(record, ensure_ascii=False) + "\n")
+        _trace_file.flush()
+
+
+@contextmanager
+def trace(kind: str, chat_id=None):
+    """
+    Groups the spans of one bot request: those in this context and in work it
+    hands to other threads along with its context. Its total time is recorded
+    as a span; with TRACE_LOG_PATH set, the request is also written to that
+    file as one JSON line.
+    """
+    if not config.METRICS_ENABLED:
+        yield
+        return
+    record = {"kind": kind, "chat_id": chat_id, "started_at": time.time(), "spans": []}
+    token = _traces.set((record,))
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        _traces.reset(token)
+        seconds = time.perf_counter() - start
+        span_seconds.observe(seconds, stage=f"request_{kind}")
+        if config.TRACE_LOG_PATH:
+            record["total_ms"] = round(seconds * 1000, 3)
+            _write_trace(record)
+
+
+def current_traces() -> tuple:
+    """The traces of the current context, to pass along with work done for several requests."""
+    return _traces.get()
+
+
+@contextmanager
+def attach_traces(traces):
+    """Records the spans of the block into every trace in `traces`, e.g. one batch serving several requests."""
+    token = _traces.set(tuple(traces))
+    try:
+        yield
+    finally:
+        _traces.reset(token)
+
+
+# --- HTTP endpoint ---
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def start_metrics_server(port: int | None = None, host: str | None = None) -> ThreadingHTTPServer | None:
+    """
+    Serves /metrics on a background thread. Returns None if metrics are disabled
+    or the port cannot be bound (e.g. another bot process on the host uses it).
+    """
+    port = config.METRICS_PORT if port is None else port
+    if not config.METRICS_ENABLED or not port:
+        return None
+    host = host or config.METRICS_HOST
+    try:
+        server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    except OSError as e:
+        print(f"Warning: Could not serve metrics on {host}:{port} ({e}); the metrics endpoint is disabled. "
+              "Set METRICS_PORT to a free port (or 0) for this process.")
+        return None
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+    print(f"📈 Metrics available at http://{server.server_address[0]}:{server.server_port}/metrics")
+    return server
@@ -0,0 +1,207 @@
+import json
+import os
+
+import numpy as np
+from langchain_core.documents import Document
+
+from src import config
+
+EMBEDDINGS_FILE = "embeddings.npy"
+NORMS_FILE = "norms.npy"
+COLUMNS_FILE = "columns.npz"
+PARTITIONS_FILE = "partitions.json"
+METADATA_COLUMNS = ("index_in_db", "images", "price", "name", "gender")
+
+
+def export_numpy_index(db, directory: str | None = None, dtype: str | None = None, batch_size: int = 1024):
+    """
+    Exports the embeddings of a Chroma store into a memory-mappable `.npy`
+    matrix with columnar metadata. Rows are sorted by gender, then price, so a
+    gender filter maps to one contiguous slice and a price range to a
+    contiguous sub-slice of it.
+    """
+    directory = directory or config.NUMPY_INDEX_DIR
+    dtype = np.dtype(dtype or config.NUMPY_INDEX_DTYPE)
+    os.makedirs(directory, exist_ok=True)
+
+    # Pass 1: ids, genders and prices only, to decide the row order.
+    existing = db.get(include=["metadatas"])
+    ids = existing["ids"]
+    genders = [str((m or {}).get("gender", "")) for m in existing["metadatas"]]
+    prices = [float((m or {}).get("price") or 0.0) for m in existing["metadatas"]]
+    order = sorted(range(len(ids)), key=lambda i: (genders[i], prices[i], i))
+    ordered_ids = [ids[i] for i in order]
+
+    partitions = {}
+    for row, i in enumerate(order):
+        start, _ = partitions.get(genders[i], (row, row))
+        partitions[genders[i]] = (start, row + 1)
+
+    # Pass 2: stream embeddings, documents and metadata into the final layout.
+    embeddings = None
+    norms = np.zeros(len(ordered_ids), dtype=np.float32)
+    columns = {name: [] for name in METADATA_COLUMNS}
+    documents = []
+    tmp_path = os.path.join(directory, f"{EMBEDDINGS_FILE}.tmp")
+    for start in range(0, len(ordered_ids), batch_size):
+        batch_ids = ordered_ids[start:start + batch_size]
+        got = db.get(ids=batch_ids, include=["embeddings", "metadatas", "documents"])
+        by_id = {doc_id: k for k, doc_id in enumerate(got["ids"])}
+        vectors = np.asarray([got["embeddings"][by_id[d]] for d in batch_ids], dtype=np.float32)
+        if embeddings is None:
+            embeddings = np.lib.format.open_memmap(
+                tmp_path, mode="w+", dtype=dtype, shape=(len(ordered_ids), vectors.shape[1])
+            )
+        embeddings[start:start + len(batch_ids)] = vectors.astype(dtype)
+        # Norms of the stored (possibly float16) vectors keep L2 ranking consistent.
+        stored = vectors.astype(dtype).astype(np.float32)
+        norms[start:start + len(batch_ids)] = np.einsum("ij,ij->i", stored, stored)
+        for d in batch_ids:
+            meta = got["metadatas"][by_id[d]] or {}
+            for name in METADATA_COLUMNS:
+                columns[name].append(meta.get(name))
+            documents.append(got["documents"][by_id[d]] or "")
+
+    if embeddings is None:
+        raise ValueError("The database is empty; nothing to export.")
+    embeddings.flush()
+    del embeddings
+    os.replace(tmp_path, os.path.join(directory, EMBEDDINGS_FILE))
+    np.save(os.path.join(directory, NORMS_FILE), norms)
+    np.savez(
+        os.path.join(directory, COLUMNS_FILE),
+        ids=np.asarray(ordered_ids, dtype=str),
+        documents=np.asarray(documents, dtype=str),
+        index_in_db=np.asarray(columns["index_in_db"], dtype=np.int64),
+        price=np.asarray(columns["price"], dtype=np.float64),
+        images=np.asarray(columns["images"], dtype=str),
+        name=np.asarray(columns["name"], dtype=str),
+        gender=np.asarray(columns["gender"], dtype=str),
+    )
+    with open(os.path.join(directory, PARTITIONS_FILE), "w", encoding="utf-8") as f:
+        json.dump(partitions, f, indent=2)
+    print(f"Exported {len(ordered_ids)} embeddings ({dtype.name}) to {directory}.")
+
+
+class NumpyIndex:
+    """
+    Exact nearest-neighbour search over a memory-mapped embedding matrix.
+
+    Provides the `similarity_search` subset of the Chroma API that
+    `search_for_products` uses, ranking by the same squared L2 distance as
+    Chroma's default collection. Filters use Chroma's `where` syntax: a gender
+    selects a precomputed row partition and a price range (`$gte`, `$gt`,
+    `$lte`, `$lt`) a sub-slice of it, instead of post-filtering.
+    """
+
+    def __init__(self, directory: str, embedding_function):
+        self.embedding_function = embedding_function
+        self.embeddings = np.load(os.path.join(directory, EMBEDDINGS_FILE), mmap_mode="r")
+        self.norms = np.load(os.path.join(directory, NORMS_FILE))
+        with np.load(os.path.join(directory, COLUMNS_FILE)) as columns:
+            self.columns = {name: columns[name] for name in columns.files}
+        with open(os.path.join(directory, PARTITIONS_FILE), "r", encoding="utf-8") as f:
+            self.partitions = {gender: tuple(bounds) for gender, bounds in json.load(f).items()}
+        # Exports made before rows were also sorted by price cannot serve price ranges.
+        price = self.columns.get("price")
+        self.price_sorted = price is not None and all(
+            np.all(np.diff(price[start:stop]) >= 0) for start, stop in self.partitions.values()
+        )
+
+    def __len__(self) -> int:
+        return self.embeddings.shape[0]
+
+    def _rows_for(self, filter: dict | None) -> tuple[int, int]:
+        if not filter:
+            return 0, len(self)
+        conditions = filter["$and"] if set(filter) == {"$and"} else [{key: value} for key, value in filter.items()]
+        gender, price_ops = None, {}
+        for condition in conditions:
+            for key, value in condition.items():
+                if key == "gender":
+                    gender = value
+                elif key == "price" and isinstance(value, dict):
+                    price_ops.update(value)
+                else:
+                    raise ValueError(f"NumpyIndex only supports gender and price filters, got: {key}")
+        if gender is None:
+            raise ValueError("NumpyIndex filters must include a gender.")
+        start, stop = self.partitions.get(gender, (0, 0))
+        if not price_ops:
+            return start, stop
+        if not self.price_sorted:
+            raise ValueError("This index cannot filter by price. Re-export it with 'python build_database.py --numpy-index'.")
+        # Prices are sorted within the partition, so each bound is one binary search.
+        prices = self.columns["price"][start:stop]
+        lo, hi = 0, len(prices)
+        for op, bound in price_ops.items():
+            if op == "$gte":
+                lo = max(lo, int(np.searchsorted(prices, bound, side="left")))
+            elif op == "$gt":
+                lo = max(lo, int(np.searchsorted(prices, bound, side="right")))
+            elif op == "$lte":
+                hi = min(hi, int(np.searchsorted(prices, bound, side="right")))
+            elif op == "$lt":
+                hi = min(hi, int(np.searchsorted(prices, bound, side="left")))
+            else:
+                raise ValueError(f"Unsupported price operator: {op}")
+        return start + lo, start + max(lo, hi)
+
+    def _document(self, row: int) -> Document:
+        c = self.columns
+        return Document(
+            page_content=str(c["documents"][row]),
+            metadata={
+                "index_in_db": int(c["index_in_db"][row]),
+                "images": str(c["images"][row]),
+                "price": float(c["price"][row]),
+                "name": str(c["name"][row]),
+                "gender": str(c["gender"][row]),
+                "product_id": str(c["ids"][row]),
+            },
+        )
+
+    def search_rows(self, query_vector, k: int = 4, filter: dict | None = None) -> np.ndarray:
+        """Returns the global row numbers of the top-k matches, best first."""
+        start, stop = self._rows_for(filter)
+        if stop <= start:
+            return np.empty(0, dtype=np.int64)
+        q = np.asarray(query_vector, dtype=np.float32)
+        # ||x - q||^2 = ||x||^2 - 2 x.q + ||q||^2; the last term does not change the ranking.
+        scores = self.norms[start:stop] - 2.0 * (self.embeddings[start:stop] @ q)
+        k = min(k, stop - start)
+        top = np.argpartition(scores, k - 1)[:k]
+        top = top[np.argsort(scores[top], kind="stable")]
+        return top + start
+
+    def search_rows_batch(self, query_vectors, k: int = 4, filter: dict | None = None) -> list[np.ndarray]:
+        """Like `search_rows` for many queries at once, scored with one matrix product."""
+        start, stop = self._rows_for(filter)
+        if stop <= start:
+            return [np.empty(0, dtype=np.int64) for _ in query_vectors]
+        q = np.asarray(query_vectors, dtype=np.float32)
+        scores = self.norms[start:stop] - 2.0 * (q @ self.embeddings[start:stop].T)
+        k = min(k, stop - start)
+        top = np.argpartition(scores, k - 1, axis=1)[:, :k]
+        order = np.argsort(np.take_along_axis(scores, top, axis=1), axis=1, kind="stable")
+        return list(np.take_along_axis(top, order, axis=1) + start)
+
+    def similarity_search_by_vectors(self, embeddings, k: int = 4, filter: dict | None = None) -> list[list[Document]]:
+        return [[self._document(row) for row in rows] for rows in self.search_rows_batch(embeddings, k=k, filter=filter)]
+
+    def similarity_search_by_vector(self, embedding, k: int = 4, filter: dict | None = None, **kwargs) -> list[Document]:
+        return [self._document(row) for row in self.search_rows(embedding, k=k, filter=filter)]
+
+    def similarity_search(self, query: str, k: int = 4, filter: dict | None = None, **kwargs) -> list[Document]:
+        query_vector = self.embedding_function.embed_query(query)
+        return self.similarity_search_by_vector(query_vector, k=k, filter=filter)
+
+
+def load_numpy_index(embedding_function, directory: str | None = None) -> NumpyIndex:
+    directory = directory or config.NUMPY_INDEX_DIR
+    if not os.path.exists(os.path.join(directory, EMBEDDINGS_FILE)):
+        raise FileNotFoundError(
+            f"NumPy index not found at {directory}. "
+            "Please run 'python build_database.py --numpy-index' first to export it."
+        )
+    return NumpyIndex(directory, embedding_function)
@@ -0,0 +1,149 @@
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from src import config
+from src.search_cache import normalize_query
+
+
+class SemanticOutfitCache:
+    """
+    Reuses parsed outfits across similar requests.
+
+    Entries are grouped by (gender, event); within a group, a request hits when
+    the cosine similarity between its details embedding and a stored one is at
+    least `threshold`. The cache holds at most `max_entries` entries, evicting
+    the least recently used, and each entry expires `ttl` seconds after it was
+    stored.
+    """
+
+    def __init__(self, embeddings, threshold: float | None = None, max_entries: int | None = None,
+                 ttl: float | None = None):
+        self.embeddings = embeddings
+        self.threshold = config.OUTFIT_CACHE_THRESHOLD if threshold is None else threshold
+        self.max_entries = max_entries or config.OUTFIT_CACHE_SIZE
+        self.ttl = config.OUTFIT_CACHE_TTL if ttl is None else ttl
+        self._entries = OrderedDict()  # entry id -> (group, details, vector, outfits, expires_at)
+        self._groups = {}  # (gender, event) -> {entry id: vector}
+        self._next_id = 0
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "stores": 0, "evictions": 0, "expired": 0}
+
+    @staticmethod
+    def _group(gender: str, event: str) -> tuple:
+        return normalize_query(gender), normalize_query(event)
+
+    def embed(self, details: str) -> np.ndarray:
+        vector = np.asarray(self.embeddings.embed_query(normalize_query(details)), dtype=np.float32)
+        return vector / max(float(np.linalg.norm(vector)), 1e-12)
+
+    def _remove(self, entry_id: int):
+        group = self._entries.pop(entry_id)[0]
+        members = self._groups[group]
+        del members[entry_id]
+        if not members:
+            del self._groups[group]
+
+    def get(self, gender: str, details: str, event: str) -> list | None:
+        """Returns the stored outfits of the most similar earlier request, or None."""
+        vector = self.embed(details)
+        group = self._group(gender, event)
+        now = time.monotonic()
+        with self._lock:
+            members = self._groups.get(group, {})
+            for entry_id in [i for i in members if self._entries[i][4] < now]:
+                self._remove(entry_id)
+                self.stats["expired"] += 1
+            members = self._groups.get(group)
+            if members:
+                ids = list(members)
+                scores = np.stack([members[i] for i in ids]) @ vector
+                best = int(np.argmax(scores))
+                if scores[best] >= self.threshold:
+                    entry_id = ids[best]
+                    self._entries.move_to_end(entry_id)
+                    self.stats["hits"] += 1
+                    print(f"Outfit cache hit (similarity {scores[best]:.3f}).")
+                    return [dict(outfit) for outfit in self._entries[entry_id][3]]
+            self.stats["misses"] += 1
+            return None
+
+    def put(self, gender: str, details: str, event: str, outfits: list, vector: np.ndarray | None = None):
+        """Stores the parsed outfits generated for a request."""
+        if vector is None:
+            vector = self.embed(details)
+        group = self._group(gender, event)
+        with self._lock:
+            entry_id = self._next_id
+            self._next_id += 1
+            self._entries[entry_id] = (group, details, vector, [dict(o) for o in outfits], time.monotonic() + self.ttl)
+            self._groups.setdefault(group, {})[entry_id] = vector
+            self.stats["stores"] += 1
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+                self.stats["evictions"] += 1
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def hit_rate(self) -> float:
+        total = self.stats["hits"] + self.stats["misses"]
+        return self.stats["hits"] / total if total else 0.0
+
+    def save(self, path: str):
+        """Writes every live entry, with its embedding, to a JSON file."""
+        now = time.monotonic()
+        with self._lock:
+            entries = [
+                {"gender": group[0], "event": group[1], "details": details,
+                 "embedding": vector.tolist(), "outfits": outfits}
+                for group, details, vector, outfits, expires_at in self._entries.values()
+                if expires_at >= now
+            ]
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"embedding_model": config.EMBEDDING_MODEL_NAME, "entries": entries}, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    def load(self, path: str) -> int:
+        """Adds the entries of a file written by `save`; returns how many were loaded."""
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        if data.get("embedding_model") != config.EMBEDDING_MODEL_NAME:
+            print(f"Skipping {path}: it was built with a different embedding model.")
+            return 0
+        for entry in data["entries"]:
+            vector = np.asarray(entry["embedding"], dtype=np.float32)
+            self.put(entry["gender"], entry["details"], entry["event"], entry["outfits"], vector=vector)
+        return len(data["entries"])
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_outfit_cache() -> SemanticOutfitCache | None:
+    """Returns the shared outfit cache (prewarmed from OUTFIT_CACHE_PATH), or None if disabled."""
+    global _cache
+    if not config.OUTFIT_CACHE_ENABLED:
+        return None
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                from src.retriever import get_embeddings
+                cache = SemanticOutfitCache(get_embeddings())
+                if os.path.exists(config.OUTFIT_CACHE_PATH):
+                    count = cache.load(config.OUTFIT_CACHE_PATH)
+                    print(f"Loaded {count} prewarmed outfit recommendations.")
+                _cache = cache
+    return _cache
+
+
+def cache_stats() -> dict:
+    """Counters of the shared cache if it exists; never creates it (that loads the embedder)."""
+    return dict(_cache.stats) if _cache is not None else {}
@@ -0,0 +1,66 @@
+import copy
+import threading
+
+import torch
+from transformers import DynamicCache
+
+
+class PrefixCache:
+    """
+    Holds the key/value attention state of a fixed prompt prefix.
+
+    The prefix is run through the model once. Each generation then gets its
+    own deep copy of that state (generate() appends to the cache in place), so
+    only the request-specific suffix has to be prefilled and concurrent
+    requests never share a mutable cache.
+    """
+
+    def __init__(self, model, tokenizer, prefix: str):
+        self.model = model
+        self.tokenizer = tokenizer
+        self.prefix = prefix
+        prefix_ids = tokenizer(prefix, return_tensors="pt").input_ids
+        # Leave out the last prefix token: it may merge with the first
+        # characters of the suffix when the full prompt is tokenized.
+        self.prefix_ids = prefix_ids[:, :-1].to(model.device)
+        self.prefix_length = self.prefix_ids.shape[1]
+        self._lock = threading.Lock()
+        with torch.inference_mode():
+            outputs = model(input_ids=self.prefix_ids, past_key_values=DynamicCache(), use_cache=True)
+        self.past_key_values = outputs.past_key_values
+
+    def _suffix_ids(self, prompt: str, max_length: int) -> list[int] | None:
+        ids = self.tokenizer(prompt, truncation=True, max_length=max_length).input_ids
+        if ids[:self.prefix_length] != self.prefix_ids[0].tolist():
+            return None
+        return ids[self.prefix_length:]
+
+    def prepare_inputs(self, prompts: list[str], max_length: int = 512) -> dict | None:
+        """
+        Builds generate() inputs that reuse the cached prefix, or returns None if
+        any prompt does not start with the prefix tokens. Suffixes are padded
+        between the prefix and the suffix, so every row's prefix sits at the
+        same cache positions; the attention mask hides the padding.
+        """
+        suffixes = [self._suffix_ids(p, max_length) for p in prompts]
+        if any(s is None or not s for s in suffixes):
+            return None
+        pad_id = self.tokenizer.pad_token_id if self.tokenizer.pad_token_id is not None else self.tokenizer.eos_token_id
+        width = max(len(s) for s in suffixes)
+        prefix = self.prefix_ids[0].tolist()
+        input_ids, attention_mask = [], []
+        for suffix in suffixes:
+            padding = width - len(suffix)
+            input_ids.append(prefix + [pad_id] * padding + suffix)
+            attention_mask.append([1] * self.prefix_length + [0] * padding + [1] * len(suffix))
+
+        with self._lock, torch.inference_mode():
+            past_key_values = copy.deepcopy(self.past_key_values)
+        if len(prompts) > 1:
+            past_key_values.batch_repeat_interleave(len(prompts))
+        device = self.model.device
+        return {
+            "input_ids": torch.tensor(input_ids, device=device),
+            "attention_mask": torch.tensor(attention_mask, device=device),
+            "past_key_values": past_key_values,
+        }
@@ -1,21 +1,26 @@
 import os
-import pandas as pd
+import threading
 from chromadb.config import Settings
 from langchain_community.vectorstores import Chroma
 from langchain_community.embeddings import HuggingFaceEmbeddings
 from src import config
-from PIL import Image
-import requests
+from src.ingest import iter_catalog_batches
+from src.numpy_index import load_numpy_index
+from src.hybrid_index import load_hybrid_index
+from src import chroma_utils
+from src import search_cache
+from src import metrics
+from src.image_fetcher import download_image, fetch_image_rows
+from src.thumbnail_cache import get_thumbnail_cache
+from src.sprite_store import get_sprite_store
 from io import BytesIO
+from PIL import Image
 
 # (The image helper functions like get_image_by_url, etc., remain the same. No changes needed there.)
 # --- Image helper functions from your notebook ---
 def get_image_by_url(url: str) -> Image.Image:
     """Downloads an image from a URL and returns a PIL Image object."""
-    response = requests.get(url)
-    response.raise_for_status()  
-    img = Image.open(BytesIO(response.content))
-    return img
+    return download_image(url)
 
 def concat_images_h(images: list[Image.Image]) -> Image.Image:
     """Concatenates a list of PIL Images horizontally."""
@@ -51,6 +56,38 @@ def concat_images_v(images: list[Image.Image]) -> Image.Image:
     return new_im
 
 
+def compose_grid(rows: list[list[Image.Image]]) -> Image.Image | None:
+    """
+    Pastes rows of equally sized images into one preallocated canvas; same
+    layout as concat_images_h per row followed by concat_images_v.
+    """
+    if not rows:
+        return None
+    width, height = rows[0][0].size
+    canvas = Image.new('RGB', (width * max(len(row) for row in rows), height * len(rows)))
+    for r, row in enumerate(rows):
+        for c, im in enumerate(row):
+            canvas.paste(im, (c * width, r * height))
+    return canvas
+
+
+def encode_image(image: Image.Image, fmt: str | None = None, max_bytes: int | None = None) -> bytes:
+    """
+    Encodes an image as JPEG or WebP, lowering the quality step by step until
+    it fits in `max_bytes` (the last attempt is returned even if it does not).
+    """
+    fmt = fmt or config.COMPOSITE_FORMAT
+    max_bytes = max_bytes or config.COMPOSITE_MAX_BYTES
+    data = b""
+    for quality in config.COMPOSITE_QUALITIES:
+        buffer = BytesIO()
+        image.save(buffer, fmt, quality=quality)
+        data = buffer.getvalue()
+        if len(data) <= max_bytes:
+            break
+    return data
+
+
 def _build_and_persist_db(embedding_function):
     """Private helper to build the DB from scratch."""
     print("Database not found. Creating and persisting a new one...")
@@ -58,35 +95,49 @@ def _build_and_persist_db(embedding_function):
     if not os.path.exists(config.DATA_PATH):
         raise FileNotFoundError(f"Data file not found at {config.DATA_PATH}. Please upload it.")
 
-    df = pd.read_csv(config.DATA_PATH)
-    
-    print(f"Processing {len(df)} rows from the dataset...")
-    docs, m_data = [], []
-    for index, row in df.iterrows():
-        # Ensure all data is a string to prevent errors
-        docs.append(f"For {row['gender']} - {row['name']} - {row.get('description', '')}")
-        m_data.append({
-            "index_in_db": index,
-            "images": str(row.get('images', '')),
-            "price": float(row['price']), # Ensure price is a number
-            "name": str(row['name'])
-        })
-
-    db = Chroma.from_texts(
-        texts=docs,
-        metadatas=m_data,
-        embedding=embedding_function,
-        persist_directory=config.DB_PERSIST_DIRECTORY,
-    )
-    print("Database created and saved successfully.")
+    # Same streaming pipeline and document format as build_database.py.
+    db = Chroma(persist_directory=config.DB_PERSIST_DIRECTORY, embedding_function=embedding_function)
+    num_rows = 0
+    for batch in iter_catalog_batches(config.DATA_PATH):
+        db.add_texts(texts=batch.docs, metadatas=batch.metadatas, ids=batch.ids)
+        num_rows += len(batch.ids)
+    print(f"Database created and saved successfully with {num_rows} rows.")
     return db
 
+_embeddings = None
+_embeddings_lock = threading.Lock()
+
+
+def get_embeddings() -> search_cache.CachedEmbeddings:
+    """Returns the shared (query-cached) sentence embedder, loading it on first use."""
+    global _embeddings
+    if _embeddings is None:
+        with _embeddings_lock:
+            if _embeddings is None:
+                _embeddings = search_cache.CachedEmbeddings(HuggingFaceEmbeddings(model_name=config.EMBEDDING_MODEL_NAME))
+    return _embeddings
+
 # In src/retriever.py
 
 def load_database():
     """
     Loads the ChromaDB vector database from disk. Assumes it has already been built.
+    With RETRIEVAL_BACKEND = "numpy", loads the exported NumPy index instead;
+    with "hybrid", the NumPy index together with its BM25 index.
     """
+    if config.RETRIEVAL_BACKEND == "hybrid":
+        print("Loading hybrid (vector + BM25) index from disk...")
+        db = load_hybrid_index(get_embeddings())
+        print(f"Hybrid index is ready with {len(db)} products and {len(db.vocab)} terms.")
+        return db
+
+    if config.RETRIEVAL_BACKEND == "numpy":
+        print("Loading NumPy vector index from disk...")
+        embedding_function = get_embeddings()
+        db = load_numpy_index(embedding_function)
+        print(f"NumPy index is ready with {len(db)} products.")
+        return db
+
     if not os.path.exists(config.DB_PERSIST_DIRECTORY):
         raise FileNotFoundError(
             f"Database not found at {config.DB_PERSIST_DIRECTORY}. "
@@ -94,7 +145,7 @@ def load_database():
         )
     
     print("Loading existing vector database from disk...")
-    embedding_function = HuggingFaceEmbeddings(model_name=config.EMBEDDING_MODEL_NAME)
+    embedding_function = get_embeddings()
     db = Chroma(
         persist_directory=config.DB_PERSIST_DIRECTORY, 
         embedding_function=embedding_function
@@ -104,49 +155,185 @@ def load_database():
 
 
 
+_image_fetches = metrics.counter("image_fetches", "Product images requested for composites, by result.")
+_composites = metrics.counter("composites", "Product composites built, by image source.")
+
+
+def search_filter(gender_filter: str, price_range: tuple | None = None) -> dict:
+    """
+    The `where` filter for a gender and an optional (min, max) price range,
+    in Chroma's syntax (the NumPy and hybrid indexes accept the same). Either
+    price bound may be None.
+    """
+    conditions = [{"gender": gender_filter}]
+    min_price, max_price = price_range or (None, None)
+    if min_price is not None:
+        conditions.append({"price": {"$gte": float(min_price)}})
+    if max_price is not None:
+        conditions.append({"price": {"$lte": float(max_price)}})
+    return {"$and": conditions} if len(conditions) > 1 else conditions[0]
+
+
+def _similarity_search(db, prompt: str, where: dict, k: int):
+    with metrics.span("similarity_search", backend=config.RETRIEVAL_BACKEND):
+        return db.similarity_search(prompt, k=k, filter=where)
+
+
+def _cached_similarity_search(db, prompt: str, gender_filter: str, k: int, price_range: tuple | None = None):
+    """Runs the filtered similarity search, reusing results for repeated queries."""
+    where = search_filter(gender_filter, price_range)
+    if not config.SEARCH_CACHE_ENABLED:
+        return _similarity_search(db, prompt, where, k)
+    search_cache.check_db_version()
+    key = (search_cache.normalize_query(prompt), gender_filter, k, price_range)
+    documents = search_cache.search_results.get(key)
+    if documents is None:
+        documents = _similarity_search(db, prompt, where, k)
+        search_cache.search_results.put(key, documents)
+    return documents
+
+
+def find_products(prompt: str, gender_filter: str, db: Chroma, k: int = 3, price_range: tuple | None = None):
+    """
+    Returns the `k` products most similar to `prompt` for the given gender,
+    optionally limited to a (min, max) price range.
+    """
+    print(f"Searching for '{prompt}' with gender filter: '{gender_filter}'")
+    documents = _cached_similarity_search(db, prompt, gender_filter, k=k, price_range=price_range)
+    if not documents:
+        print("No relevant documents found.")
+    return documents
+
+
+def _similarity_search_many(db, queries: list[str], vectors: list, gender_filter: str, k: int) -> list[list]:
+    """Top-k lookups for many query vectors in one call to the vector store."""
+    with metrics.span("similarity_search_batch", backend=config.RETRIEVAL_BACKEND):
+        if hasattr(db, "hybrid_search_many"):
+            return db.hybrid_search_many(queries, vectors, k=k, filter={"gender": gender_filter})
+        if hasattr(db, "similarity_search_by_vectors"):
+            return db.similarity_search_by_vectors(vectors, k=k, filter={"gender": gender_filter})
+        # Chroma's collection answers several query embeddings per request.
+        return chroma_utils.similarity_search_by_vectors(db, vectors, k=k, filter={"gender": gender_filter})
+
+
+def find_products_many(queries: list[str], gender_filter: str, db: Chroma, k: int = 3) -> list[list]:
+    """
+    Like `find_products` for many queries at once: repeated queries are merged,
+    cached results are reused, and the remaining queries are embedded in one
+    batch and looked up together. Returns one result list per query.
+    """
+    keys = [search_cache.normalize_query(q) for q in queries]
+    results = {}
+    if config.SEARCH_CACHE_ENABLED:
+        search_cache.check_db_version()
+        for key in dict.fromkeys(keys):
+            documents = search_cache.search_results.get((key, gender_filter, k, None))
+            if documents is not None:
+                results[key] = documents
+    missing = [key for key in dict.fromkeys(keys) if key not in results]
+    if missing:
+        vectors = get_embeddings().embed_queries(missing)
+        for key, documents in zip(missing, _similarity_search_many(db, missing, vectors, gender_filter, k)):
+            results[key] = documents
+            if config.SEARCH_CACHE_ENABLED:
+                search_cache.search_results.put((key, gender_filter, k, None), documents)
+    print(f"Batched search: {len(queries)} queries, {len(missing)} looked up, gender filter: '{gender_filter}'")
+    return [results[key] for key in keys]
+
+
+def link_outfit_products(outfits: list[dict], gender_filter: str, db: Chroma, per_field: int | None = None) -> list[dict]:
+    """
+    Finds catalog products for every field (Top, Bottom, ...) of every outfit
+    in one batched search. Returns, per outfit, {field: [Document, ...]} with up
+    to `per_field` products each; a product is used for at most one field of
+    the same outfit.
+    """
+    per_field = per_field or config.OUTFIT_PRODUCTS_PER_FIELD
+    fields = [(i, field, value) for i, outfit in enumerate(outfits) for field, value in outfit.items() if value]
+    # Extra candidates leave room to skip products already used by another field.
+    candidates = find_products_many([value for _, _, value in fields], gender_filter, db, k=per_field * 3)
+
+    linked = [{} for _ in outfits]
+    used = [set() for _ in outfits]
+    for (i, field, _), documents in zip(fields, candidates):
+        picks = []
+        for doc in documents:
+            product_id = doc.metadata.get("index_in_db")
+            if product_id not in used[i]:
+                used[i].add(product_id)
+                picks.append(doc)
+                if len(picks) == per_field:
+                    break
+        linked[i][field] = picks
+    return linked
+
+
+def composite_key(documents) -> tuple | None:
+    """
+    Identifies the composite image of a result: the stable product ids and
+    image URLs, in order. None for documents stored before product ids were
+    kept in the metadata, which cannot be identified safely.
+    """
+    key = tuple((doc.metadata.get("product_id"), doc.metadata.get("images", "")) for doc in documents)
+    return key if all(product_id for product_id, _ in key) else None
+
+
+def build_composite(documents) -> tuple[Image.Image | None, bool]:
+    """
+    Builds the product grid (one row of images per product) and reports whether
+    every image was available, i.e. whether the composite is safe to reuse.
+    """
+    # Fast path: every product has precomputed tiles in the sprite store, so the
+    # composite is assembled from memory-mapped slices without any HTTP calls.
+    store = get_sprite_store()
+    if store is not None:
+        rows = [store.lookup(doc.metadata.get("product_id"), doc.metadata.get("images", "")) for doc in documents]
+        if None not in rows:
+            _composites.inc(source="sprites")
+            with metrics.span("compose", source="sprites"):
+                return store.compose(rows), True
+
+    # Fetch the first few image URLs of every document in one concurrent batch;
+    # failed slots fall back to the product's later URLs.
+    urls_per_doc = [
+        [u.strip() for u in doc.metadata.get("images", "").split("~") if u.strip()]
+        for doc in documents
+    ]
+    loader = get_thumbnail_cache().get if config.THUMBNAIL_CACHE_ENABLED else None
+    with metrics.span("image_fetch"):
+        fetched_rows, stats = fetch_image_rows(
+            urls_per_doc, config.IMAGES_PER_PRODUCT, size=config.THUMBNAIL_SIZE, loader=loader
+        )
+    print(f"Image fetch: {stats['served']} served, {stats['timed_out']} timed out, {stats['failed']} failed.")
+    for result, count in stats.items():
+        _image_fetches.inc(count, result=result)
+
+    rows = [row for row in fetched_rows if row]
+    complete = all(
+        len(row) == min(config.IMAGES_PER_PRODUCT, len(urls)) for row, urls in zip(fetched_rows, urls_per_doc)
+    )
+    _composites.inc(source="fetched")
+    with metrics.span("compose", source="fetched"):
+        return compose_grid(rows), complete
+
+
 def search_for_products(prompt: str, gender_filter: str, db: Chroma):
     """
     Takes a user prompt and a database instance, searches for relevant products,
     and returns a composite image and a formatted text description.
     """
-    print(f"Searching for '{prompt}' with gender filter: '{gender_filter}'")
-    documents = db.similarity_search(prompt,
-                                    k=3,
-                                    filter={"gender": gender_filter})
-
+    documents = find_products(prompt, gender_filter, db)
     if not documents:
-        print("No relevant documents found.")
         return None, None
+    final_img, _ = build_composite(documents)
+    return final_img, format_results(documents)
 
-    tmp_imgs_v = []
-    tmp_imgs_info = []
 
+def format_results(documents) -> str:
+    """Formats the caption listing price, name and id of each found product."""
+    tmp_imgs_info = []
     for cnt, doc in enumerate(documents):
         metadata = doc.metadata
-        images_urls = metadata.get("images", "").split("~")
-        
-        tmp_imgs_h = []
-        num_valid_img = 0
-
-        for url in images_urls:
-            url = url.strip()
-            if not url:
-                continue
-            
-            try:
-                img = get_image_by_url(url)
-                img = img.resize((256, 256))
-                tmp_imgs_h.append(img)
-                num_valid_img += 1
-                if num_valid_img >= 3:
-                    break
-            except Exception as e:
-                print(f"Warning: Could not fetch image from {url}. Error: {e}")
-
-        if tmp_imgs_h:
-            h_concat_img = concat_images_h(tmp_imgs_h)
-            tmp_imgs_v.append(h_concat_img)
-
         info = (
             f"ردیف {cnt + 1}:\n"
             f"قیمت: {metadata.get('price', 'N/A')}\n"
@@ -156,11 +343,6 @@ def search_for_products(prompt: str, gender_filter: str, db: Chroma):
         )
         tmp_imgs_info.append(info)
 
-    # Concatenate the row images vertically
-    final_img = concat_images_v(tmp_imgs_v) if tmp_imgs_v else None
-
-    # Prepare final text
     final_txt = "محصولات پیشنهادی ما برای این سؤال است:\n\n"
     final_txt += "\n".join(tmp_imgs_info)
-    
-    return final_img, final_txt
\ No newline at end of file
+    return final_txt
@@ -0,0 +1,141 @@
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+
+from langchain_core.embeddings import Embeddings
+
+from src import config
+
+
+def normalize_query(text: str) -> str:
+    """Canonical form of a search query: lowercase, single spaces, no edge punctuation."""
+    return re.sub(r"\s+", " ", text).strip(" \t\n.,;:!?\"'").lower()
+
+
+class LRUCache:
+    """Thread-safe LRU cache with a per-entry time-to-live and hit/miss counters."""
+
+    def __init__(self, max_entries: int, ttl: float):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()  # key -> (expires_at, value)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < now:
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
+
+
+# --- Database version tracking ---
+def _db_version() -> tuple:
+    """Changes whenever a database build (or NumPy or BM25 index export) finishes."""
+    version = []
+    for path in (
+        os.path.join(config.DB_PERSIST_DIRECTORY, "ingest_checkpoint.json"),
+        os.path.join(config.NUMPY_INDEX_DIR, "partitions.json"),
+        os.path.join(config.NUMPY_INDEX_DIR, "bm25.npz"),
+    ):
+        try:
+            version.append(os.stat(path).st_mtime_ns)
+        except OSError:
+            version.append(None)
+    return tuple(version)
+
+
+query_embeddings = LRUCache(config.QUERY_EMBEDDING_CACHE_SIZE, config.SEARCH_CACHE_TTL)
+search_results = LRUCache(config.SEARCH_RESULT_CACHE_SIZE, config.SEARCH_CACHE_TTL)
+_version = _db_version()
+_version_lock = threading.Lock()
+
+
+def check_db_version():
+    """Clears both cache levels if the database was rebuilt since the last check."""
+    global _version
+    current = _db_version()
+    if current != _version:
+        with _version_lock:
+            if current != _version:
+                print("Database build changed. Clearing search caches.")
+                query_embeddings.clear()
+                search_results.clear()
+                _version = current
+
+
+def cache_stats() -> dict:
+    return {"query_embeddings": query_embeddings.stats(), "search_results": search_results.stats()}
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    Wraps a LangChain embeddings object so repeated queries skip the
+    transformer forward pass. Document embedding is passed through unchanged.
+    """
+
+    def __init__(self, embedding_function):
+        self.embedding_function = embedding_function
+
+    def embed_query(self, text: str) -> list[float]:
+        if not config.SEARCH_CACHE_ENABLED:
+            return self.embedding_function.embed_query(text)
+        key = normalize_query(text)
+        vector = query_embeddings.get(key)
+        if vector is None:
+            vector = self.embedding_function.embed_query(text)
+            query_embeddings.put(key, vector)
+        return vector
+
+    def embed_queries(self, texts: list[str]) -> list[list[float]]:
+        """Embeds many queries, computing all cache misses in one batched forward pass."""
+        if not config.SEARCH_CACHE_ENABLED:
+            return self.embedding_function.embed_documents(texts)
+        keys = [normalize_query(text) for text in texts]
+        vectors = {key: query_embeddings.get(key) for key in dict.fromkeys(keys)}
+        missing = [key for key, vector in vectors.items() if vector is None]
+        if missing:
+            # Same model call as embed_query, which embeds a one-text batch.
+            for key, vector in zip(missing, self.embedding_function.embed_documents(missing)):
+                query_embeddings.put(key, vector)
+                vectors[key] = vector
+        return [vectors[key] for key in keys]
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        return self.embedding_function.embed_documents(texts)
+
+    def __getattr__(self, name):
+        return getattr(self.embedding_function, name)
@@ -0,0 +1,169 @@
+import hashlib
+import os
+import shutil
+import threading
+import time
+
+import numpy as np
+from PIL import Image
+
+from src import config
+from src.image_fetcher import fetch_images
+from src.thumbnail_cache import get_thumbnail_cache
+
+TILES_FILE = "tiles.npy"
+COUNTS_FILE = "counts.npy"
+IDS_FILE = "ids.npy"
+IMAGE_HASHES_FILE = "image_hashes.npy"
+CURRENT_FILE = "CURRENT"        # Names the generation directory readers should use
+
+
+def images_hash(image_field: str) -> int:
+    """Stable 64-bit hash of a product's `images` field (its '~'-joined URLs)."""
+    return int.from_bytes(hashlib.blake2b(str(image_field).encode("utf-8"), digest_size=8).digest(), "little")
+
+
+class SpriteStore:
+    """
+    Read-only, memory-mapped store of precomputed product thumbnails.
+
+    `tiles` has shape (num_products, IMAGES_PER_PRODUCT, height, width, 3);
+    `counts[i]` is how many tiles of row i are valid. Rows are looked up by the
+    stable product id, and a row is only used while the product's image URLs
+    still hash to what they were at build time.
+    """
+
+    def __init__(self, directory: str):
+        self.tiles = np.load(os.path.join(directory, TILES_FILE), mmap_mode="r")
+        self.counts = np.load(os.path.join(directory, COUNTS_FILE), mmap_mode="r")
+        self.image_hashes = np.load(os.path.join(directory, IMAGE_HASHES_FILE))
+        self.rows = {product_id: row for row, product_id in enumerate(np.load(os.path.join(directory, IDS_FILE)).tolist())}
+        self.tile_height, self.tile_width = self.tiles.shape[2], self.tiles.shape[3]
+
+    def __len__(self) -> int:
+        return self.tiles.shape[0]
+
+    def lookup(self, product_id: str | None, image_field: str) -> int | None:
+        """Row of a product's tiles, or None if it has none or its image URLs changed since the build."""
+        row = self.rows.get(product_id)
+        if row is None or self.counts[row] == 0 or int(self.image_hashes[row]) != images_hash(image_field):
+            return None
+        return row
+
+    def compose(self, rows: list[int]) -> Image.Image | None:
+        """
+        Builds the search composite (one row of tiles per product, rows as
+        returned by `lookup`) directly from the memory-mapped tiles, with the
+        same layout as compose_grid.
+        """
+        if not rows:
+            return None
+        tiles_per_row = [self.tiles[row, :self.counts[row]] for row in rows]
+        h, w = self.tile_height, self.tile_width
+        canvas = np.zeros((h * len(rows), w * max(len(tiles) for tiles in tiles_per_row), 3), dtype=np.uint8)
+        for r, tiles in enumerate(tiles_per_row):
+            for c, tile in enumerate(tiles):
+                canvas[r * h:(r + 1) * h, c * w:(c + 1) * w] = tile
+        return Image.fromarray(canvas)
+
+
+def _current_generation(directory: str) -> str | None:
+    """Directory of the store generation that CURRENT_FILE points to, if any."""
+    try:
+        with open(os.path.join(directory, CURRENT_FILE), "r", encoding="utf-8") as f:
+            return os.path.join(directory, f.read().strip())
+    except OSError:
+        return None
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_sprite_store() -> SpriteStore | None:
+    """Returns the shared sprite store, or None if it has not been built."""
+    global _store
+    if _store is None and config.SPRITE_STORE_ENABLED:
+        with _store_lock:
+            if _store is None:
+                generation = _current_generation(config.SPRITE_STORE_DIR)
+                if generation is None:
+                    if os.path.exists(os.path.join(config.SPRITE_STORE_DIR, TILES_FILE)):
+                        # Older stores kept their files side by side and could be read half-swapped.
+                        print("Sprite store uses an old layout and is ignored. "
+                              "Rebuild it with 'python build_database.py --sprites'.")
+                    return None
+                _store = SpriteStore(generation)
+                print(f"Sprite store loaded with {len(_store)} products.")
+    return _store
+
+
+def build_sprite_store(product_ids: list[str], image_fields: list[str], directory: str = None, batch_size: int = 64):
+    """
+    Fetches and resizes the first IMAGES_PER_PRODUCT images of every product and
+    packs them into a memory-mapped tile array. `image_fields[i]` is the `images`
+    column (URLs joined with '~') of the product with id `product_ids[i]`.
+    """
+    directory = directory or config.SPRITE_STORE_DIR
+    width, height = config.THUMBNAIL_SIZE
+    num_products = len(image_fields)
+    per_product = config.IMAGES_PER_PRODUCT
+
+    # Every build writes a new generation directory; CURRENT_FILE is switched to
+    # it in one atomic rename, so readers never mix files of two builds.
+    generation = f"generation-{time.time_ns()}"
+    generation_dir = os.path.join(directory, generation)
+    os.makedirs(generation_dir)
+    tiles = np.lib.format.open_memmap(
+        os.path.join(generation_dir, TILES_FILE), mode="w+", dtype=np.uint8,
+        shape=(num_products, per_product, height, width, 3),
+    )
+    counts = np.zeros(num_products, dtype=np.uint8)
+    loader = get_thumbnail_cache().get if config.THUMBNAIL_CACHE_ENABLED else None
+    totals = {"served": 0, "timed_out": 0, "failed": 0}
+
+    for start in range(0, num_products, batch_size):
+        stop = min(start + batch_size, num_products)
+        urls, owners = [], []
+        for i in range(start, stop):
+            product_urls = [u.strip() for u in str(image_fields[i]).split("~") if u.strip()]
+            for url in product_urls[:per_product]:
+                urls.append(url)
+                owners.append(i)
+
+        # Building is offline, so the overall deadline scales with the batch.
+        images, stats = fetch_images(
+            urls, size=config.THUMBNAIL_SIZE, loader=loader,
+            deadline=config.IMAGE_FETCH_TIMEOUT * max(1, len(urls) // config.IMAGE_FETCH_WORKERS + 1),
+        )
+        for key in totals:
+            totals[key] += stats[key]
+        for owner, img in zip(owners, images):
+            if img is None:
+                continue
+            tiles[owner, counts[owner]] = np.asarray(img.convert("RGB"), dtype=np.uint8)
+            counts[owner] += 1
+        print(f"Sprite store: {stop}/{num_products} products processed...")
+
+    tiles.flush()
+    del tiles
+    np.save(os.path.join(generation_dir, COUNTS_FILE), counts)
+    np.save(os.path.join(generation_dir, IDS_FILE), np.asarray(product_ids, dtype=str))
+    np.save(os.path.join(generation_dir, IMAGE_HASHES_FILE),
+            np.asarray([images_hash(field) for field in image_fields], dtype=np.uint64))
+
+    current_tmp = os.path.join(directory, f"{CURRENT_FILE}.tmp")
+    with open(current_tmp, "w", encoding="utf-8") as f:
+        f.write(generation)
+    os.replace(current_tmp, os.path.join(directory, CURRENT_FILE))
+
+    # Older generations and files of the old flat layout are no longer referenced.
+    # A running bot that still maps them keeps its open files until it restarts.
+    for name in os.listdir(directory):
+        path = os.path.join(directory, name)
+        if name.startswith("generation-") and name != generation:
+            shutil.rmtree(path, ignore_errors=True)
+        elif name in (TILES_FILE, COUNTS_FILE, IDS_FILE, IMAGE_HASHES_FILE):
+            os.remove(path)
+    print(f"Sprite store built: {totals['served']} images stored, "
+          f"{totals['timed_out']} timed out, {totals['failed']} failed.")
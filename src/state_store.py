@@ -0,0 +1,264 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from src import config
+
+
+def _encode(state: dict) -> tuple[str | None, str]:
+    """Splits a state into its step and the rest as compact JSON."""
+    fields = {key: value for key, value in state.items() if key != "step" and value is not None}
+    return state.get("step"), json.dumps(fields, ensure_ascii=False, separators=(",", ":")) if fields else ""
+
+
+def _decode(step: str | None, data: str) -> dict:
+    state = json.loads(data) if data else {}
+    if step is not None:
+        state["step"] = step
+    return state
+
+
+class StateStore:
+    """
+    Per-chat conversation state. A state is a small dict ("step" plus fields
+    such as "gender", "details" or "outfits"); an empty state is not stored.
+    Chats idle for longer than `ttl` seconds are forgotten, and at most
+    `max_entries` chats are kept (least recently used first out).
+    """
+
+    def get(self, chat_id: int) -> dict:
+        """Returns a copy of the chat's state ({} if none) and marks the chat as active."""
+        raise NotImplementedError
+
+    def step(self, chat_id: int) -> str | None:
+        """Returns just the chat's current step; cheap enough for handler filters."""
+        raise NotImplementedError
+
+    def set(self, chat_id: int, state: dict):
+        raise NotImplementedError
+
+    def set_if_step(self, chat_id: int, step: str, state: dict) -> bool:
+        """Replaces the state only if the chat is still at `step`; returns whether it did."""
+        raise NotImplementedError
+
+    def update(self, chat_id: int, **fields):
+        """Merges `fields` into the chat's state."""
+        raise NotImplementedError
+
+    def clear(self, chat_id: int):
+        self.set(chat_id, {})
+
+
+class MemoryStateStore(StateStore):
+    """Keeps states in this process, each encoded as one compact JSON string."""
+
+    def __init__(self, max_entries: int | None = None, ttl: float | None = None):
+        self.max_entries = max_entries or config.STATE_MAX_ENTRIES
+        self.ttl = config.STATE_IDLE_TTL if ttl is None else ttl
+        self._entries = OrderedDict()  # chat_id -> (last_active, step, data)
+        self._lock = threading.Lock()
+        self.stats = {"expired": 0, "evicted": 0}
+
+    def _live(self, chat_id: int, now: float):
+        entry = self._entries.get(chat_id)
+        if entry is not None and entry[0] + self.ttl < now:
+            del self._entries[chat_id]
+            self.stats["expired"] += 1
+            return None
+        return entry
+
+    def _store(self, chat_id: int, step: str | None, data: str, now: float):
+        if step is None and not data:
+            self._entries.pop(chat_id, None)
+            return
+        self._entries[chat_id] = (now, step, data)
+        self._entries.move_to_end(chat_id)
+        # Entries are ordered by last activity, so idle ones are at the front.
+        while self._entries:
+            oldest_id, (last_active, _, _) = next(iter(self._entries.items()))
+            if last_active + self.ttl < now:
+                self.stats["expired"] += 1
+            elif len(self._entries) > self.max_entries:
+                self.stats["evicted"] += 1
+            else:
+                break
+            del self._entries[oldest_id]
+
+    def get(self, chat_id: int) -> dict:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._live(chat_id, now)
+            if entry is None:
+                return {}
+            self._entries[chat_id] = (now, entry[1], entry[2])
+            self._entries.move_to_end(chat_id)
+        return _decode(entry[1], entry[2])
+
+    def step(self, chat_id: int) -> str | None:
+        with self._lock:
+            entry = self._live(chat_id, time.monotonic())
+        return entry[1] if entry is not None else None
+
+    def set(self, chat_id: int, state: dict):
+        step, data = _encode(state)
+        with self._lock:
+            self._store(chat_id, step, data, time.monotonic())
+
+    def set_if_step(self, chat_id: int, step: str, state: dict) -> bool:
+        new_step, data = _encode(state)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._live(chat_id, now)
+            if entry is None or entry[1] != step:
+                return False
+            self._store(chat_id, new_step, data, now)
+            return True
+
+    def update(self, chat_id: int, **fields):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._live(chat_id, now)
+            state = _decode(entry[1], entry[2]) if entry is not None else {}
+            state.update(fields)
+            self._store(chat_id, *_encode(state), now)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class SQLiteStateStore(StateStore):
+    """
+    Keeps states in a SQLite database in WAL mode, so several bot processes
+    can share them. Expired and surplus rows are pruned every `prune_every`
+    writes.
+    """
+
+    def __init__(self, path: str | None = None, max_entries: int | None = None, ttl: float | None = None,
+                 prune_every: int = 256):
+        self.max_entries = max_entries or config.STATE_MAX_ENTRIES
+        self.ttl = config.STATE_IDLE_TTL if ttl is None else ttl
+        self.prune_every = prune_every
+        self._writes = 0
+        self._lock = threading.Lock()
+        self.stats = {"pruned": 0}
+        path = path or config.STATE_DB_PATH
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        # Autocommit mode; multi-statement changes use explicit BEGIN IMMEDIATE.
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=10)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS chat_states ("
+            " chat_id INTEGER PRIMARY KEY, step TEXT, data TEXT NOT NULL, last_active REAL NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS chat_states_last_active ON chat_states (last_active)")
+
+    def _row(self, chat_id: int, now: float):
+        return self._db.execute(
+            "SELECT step, data FROM chat_states WHERE chat_id = ? AND last_active >= ?", (chat_id, now - self.ttl)
+        ).fetchone()
+
+    def _write(self, chat_id: int, step: str | None, data: str, now: float):
+        if step is None and not data:
+            self._db.execute("DELETE FROM chat_states WHERE chat_id = ?", (chat_id,))
+        else:
+            self._db.execute(
+                "INSERT OR REPLACE INTO chat_states VALUES (?, ?, ?, ?)", (chat_id, step, data, now)
+            )
+        self._writes += 1
+
+    def _prune(self, now: float):
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                pruned = self._db.execute(
+                    "DELETE FROM chat_states WHERE last_active < ?", (now - self.ttl,)
+                ).rowcount
+                pruned += self._db.execute(
+                    "DELETE FROM chat_states WHERE chat_id IN ("
+                    " SELECT chat_id FROM chat_states ORDER BY last_active DESC LIMIT -1 OFFSET ?)",
+                    (self.max_entries,),
+                ).rowcount
+                self._db.execute("COMMIT")
+            except Exception:
+                self._db.execute("ROLLBACK")
+                raise
+        self.stats["pruned"] += pruned
+
+    def _transaction(self, chat_id: int, change) -> bool:
+        """Runs `change(current_row, now)` and its write atomically across processes."""
+        now = time.time()
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                changed = change(self._row(chat_id, now), now)
+                self._db.execute("COMMIT")
+            except Exception:
+                self._db.execute("ROLLBACK")
+                raise
+            prune = self._writes >= self.prune_every
+            if prune:
+                self._writes = 0
+        if prune:
+            self._prune(now)
+        return changed
+
+    def get(self, chat_id: int) -> dict:
+        def touch(row, now):
+            if row is not None:
+                self._db.execute("UPDATE chat_states SET last_active = ? WHERE chat_id = ?", (now, chat_id))
+            return row
+        row = self._transaction(chat_id, touch)
+        return _decode(*row) if row is not None else {}
+
+    def step(self, chat_id: int) -> str | None:
+        with self._lock:
+            row = self._row(chat_id, time.time())
+        return row[0] if row is not None else None
+
+    def set(self, chat_id: int, state: dict):
+        step, data = _encode(state)
+        self._transaction(chat_id, lambda row, now: self._write(chat_id, step, data, now))
+
+    def set_if_step(self, chat_id: int, step: str, state: dict) -> bool:
+        new_step, data = _encode(state)
+
+        def change(row, now):
+            if row is None or row[0] != step:
+                return False
+            self._write(chat_id, new_step, data, now)
+            return True
+        return self._transaction(chat_id, change)
+
+    def update(self, chat_id: int, **fields):
+        def change(row, now):
+            state = _decode(*row) if row is not None else {}
+            state.update(fields)
+            self._write(chat_id, *_encode(state), now)
+        self._transaction(chat_id, change)
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._db.execute(
+                "SELECT COUNT(*) FROM chat_states WHERE last_active >= ?", (time.time() - self.ttl,)
+            ).fetchone()[0]
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_state_store() -> StateStore:
+    """Returns the shared conversation-state store configured by STATE_BACKEND."""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                if config.STATE_BACKEND == "sqlite":
+                    _store = SQLiteStateStore()
+                else:
+                    _store = MemoryStateStore()
+    return _store
@@ -0,0 +1,222 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from io import BytesIO
+
+from PIL import Image
+
+from src import config
+from src.image_fetcher import fetch_url
+
+
+def cache_key(url: str, size: tuple[int, int]) -> str:
+    """Content address of a thumbnail: hash of the source URL and target size."""
+    return hashlib.sha256(f"{url}|{size[0]}x{size[1]}".encode("utf-8")).hexdigest()
+
+
+class ThumbnailCache:
+    """
+    Two-level cache of resized product thumbnails.
+
+    An in-memory LRU of decoded images sits in front of an on-disk store of
+    encoded thumbnails. Both levels are bounded by a byte budget. Disk entries
+    older than `max_age` seconds are revalidated with a conditional request
+    (ETag / Last-Modified) before being trusted again.
+    """
+
+    def __init__(self, directory: str, memory_bytes: int, disk_bytes: int, max_age: float):
+        self.directory = directory
+        self.memory_bytes = memory_bytes
+        self.disk_bytes = disk_bytes
+        self.max_age = max_age
+        self._memory = OrderedDict()   # key -> PIL Image
+        self._memory_used = 0
+        self._disk = OrderedDict()     # key -> file size in bytes, least recently used first
+        self._disk_used = 0
+        self._lock = threading.Lock()
+        self.stats = {"memory_hits": 0, "disk_hits": 0, "revalidated": 0, "misses": 0, "evictions": 0}
+        os.makedirs(directory, exist_ok=True)
+        self._load_disk_index()
+
+    # --- Paths ---
+    def _image_path(self, key: str) -> str:
+        return os.path.join(self.directory, key[:2], f"{key}.jpg")
+
+    def _meta_path(self, key: str) -> str:
+        return os.path.join(self.directory, key[:2], f"{key}.json")
+
+    def _load_disk_index(self):
+        entries = []
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                if name.endswith(".jpg"):
+                    st = os.stat(os.path.join(root, name))
+                    entries.append((st.st_mtime, name[:-4], st.st_size))
+        for _, key, nbytes in sorted(entries):
+            self._disk[key] = nbytes
+            self._disk_used += nbytes
+
+    # --- Memory level ---
+    def _memory_get(self, key: str):
+        img = self._memory.get(key)
+        if img is not None:
+            self._memory.move_to_end(key)
+        return img
+
+    def _memory_put(self, key: str, img: Image.Image):
+        nbytes = img.width * img.height * len(img.getbands())
+        if nbytes > self.memory_bytes:
+            return
+        if key in self._memory:
+            old = self._memory.pop(key)
+            self._memory_used -= old.width * old.height * len(old.getbands())
+        self._memory[key] = img
+        self._memory_used += nbytes
+        while self._memory_used > self.memory_bytes:
+            _, old = self._memory.popitem(last=False)
+            self._memory_used -= old.width * old.height * len(old.getbands())
+
+    # --- Disk level ---
+    def _read_meta(self, key: str) -> dict:
+        try:
+            with open(self._meta_path(key), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _disk_put(self, key: str, img: Image.Image, meta: dict):
+        path = self._image_path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        buffer = BytesIO()
+        img.save(buffer, "JPEG", quality=config.THUMBNAIL_CACHE_JPEG_QUALITY)
+        data = buffer.getvalue()
+        # Write to a temp file and rename so readers never see a partial thumbnail.
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        self._write_meta(key, meta)
+        with self._lock:
+            self._disk_used += len(data) - self._disk.pop(key, 0)
+            self._disk[key] = len(data)
+            self._evict_disk()
+
+    def _write_meta(self, key: str, meta: dict):
+        tmp_path = f"{self._meta_path(key)}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+        os.replace(tmp_path, self._meta_path(key))
+
+    def _evict_disk(self):
+        # Caller holds the lock.
+        while self._disk_used > self.disk_bytes and self._disk:
+            key, nbytes = self._disk.popitem(last=False)
+            self._disk_used -= nbytes
+            self.stats["evictions"] += 1
+            for path in (self._image_path(key), self._meta_path(key)):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+    def _disk_touch(self, key: str):
+        with self._lock:
+            if key in self._disk:
+                self._disk.move_to_end(key)
+        try:
+            os.utime(self._image_path(key))
+        except OSError:
+            pass
+
+    # --- Public API ---
+    def get(self, url: str, size: tuple[int, int], timeout: float | None = None,
+            deadline: float | None = None, session=None) -> Image.Image:
+        """
+        Returns the resized thumbnail for `url`, fetching and storing it on a miss.
+        The signature matches the `loader` hook of `image_fetcher.fetch_images`.
+        """
+        key = cache_key(url, size)
+        with self._lock:
+            img = self._memory_get(key)
+            on_disk = key in self._disk
+            if img is not None:
+                self.stats["memory_hits"] += 1
+                return img
+
+        meta = self._read_meta(key) if on_disk else {}
+        response = None
+        if on_disk and os.path.exists(self._image_path(key)):
+            fresh = time.time() - meta.get("validated_at", 0) < self.max_age
+            if not fresh:
+                response = self._revalidate(key, url, meta, timeout, deadline, session)
+            if fresh or response is None:
+                img = Image.open(self._image_path(key))
+                img.load()
+                self._disk_touch(key)
+                with self._lock:
+                    self.stats["disk_hits"] += 1
+                    self._memory_put(key, img)
+                return img
+
+        with self._lock:
+            self.stats["misses"] += 1
+        if response is None:
+            response = fetch_url(url, timeout=timeout, deadline=deadline, session=session)
+        _, body, headers = response
+        img = Image.open(BytesIO(body)).convert("RGB").resize(size)
+        self._disk_put(key, img, {
+            "url": url,
+            "size": list(size),
+            "etag": headers.get("ETag"),
+            "last_modified": headers.get("Last-Modified"),
+            "validated_at": time.time(),
+        })
+        with self._lock:
+            self._memory_put(key, img)
+        return img
+
+    def _revalidate(self, key: str, url: str, meta: dict, timeout, deadline, session):
+        """
+        Sends a conditional GET for a stale entry. Returns None if the stored
+        thumbnail is still usable, otherwise the full `fetch_url` response.
+        """
+        headers = {}
+        if meta.get("etag"):
+            headers["If-None-Match"] = meta["etag"]
+        if meta.get("last_modified"):
+            headers["If-Modified-Since"] = meta["last_modified"]
+        try:
+            response = fetch_url(url, timeout=timeout, deadline=deadline, session=session, headers=headers or None)
+        except Exception as e:
+            # The CDN is unreachable; a stale thumbnail beats no thumbnail.
+            print(f"Warning: Could not revalidate {url}, serving cached copy. Error: {e}")
+            return None
+        if response[0] != 304:
+            return response
+        meta["validated_at"] = time.time()
+        self._write_meta(key, meta)
+        with self._lock:
+            self.stats["revalidated"] += 1
+        return None
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_thumbnail_cache() -> ThumbnailCache:
+    """Returns the process-wide thumbnail cache configured from `src/config.py`."""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = ThumbnailCache(
+                    directory=config.THUMBNAIL_CACHE_DIR,
+                    memory_bytes=config.THUMBNAIL_CACHE_MEMORY_BYTES,
+                    disk_bytes=config.THUMBNAIL_CACHE_DISK_BYTES,
+                    max_age=config.THUMBNAIL_CACHE_MAX_AGE,
+                )
+    return _cache
@@ -0,0 +1,116 @@
+import re
+
+from src.llm import format_instruction
+
+# Words the tiny model can produce: the stylist prompt plus outfit vocabulary.
+_OUTFIT_WORDS = (
+    "1. 2. 3. 4. 5. Outfit: - Top: Bottom: Shoes: Accessories: white black navy beige grey "
+    "linen cotton silk wool shirt blouse t-shirt sweater blazer jeans trousers skirt chinos "
+    "sneakers loafers boots heels sandals watch belt scarf bag necklace sunglasses a with and"
+)
+
+
+# What the tiny model writes for every prompt: NUM_OUTFITS-style numbered
+# outfits in the stylist model's format. Tokens are words; line breaks are
+# fused into the token that starts the next line, since the word-level
+# tokenizer joins tokens with spaces.
+_SCRIPT = [
+    ("white linen shirt", "navy chinos", "white sneakers", "watch"),
+    ("black silk blouse", "beige trousers", "black loafers", "scarf"),
+    ("grey wool sweater", "black jeans", "grey boots", "belt"),
+    ("navy cotton blazer", "white trousers", "beige loafers", "sunglasses"),
+    ("beige t-shirt", "grey skirt", "white sandals", "bag"),
+]
+_FIELDS = ("Top:", "Bottom:", "Shoes:", "Accessories:")
+
+
+def _script_tokens() -> list[str]:
+    tokens = []
+    for number, outfit in enumerate(_SCRIPT, start=1):
+        tokens += [f"{number}." if number == 1 else f"\n{number}.", "Outfit:"]
+        for field, value in zip(_FIELDS, outfit):
+            tokens += ["\n-", field] + value.split()
+    return tokens + ["\n"]
+
+
+def _vocabulary() -> list[str]:
+    words = re.findall(r"\S+", format_instruction("details", "event")) + _OUTFIT_WORDS.split()
+    return list(dict.fromkeys(words + _script_tokens()))
+
+
+def _scripted_gpt2():
+    """
+    GPT2LMHeadModel whose generate() writes the outfit script: the forward
+    passes run as usual, but a logits processor forces the script's next token
+    at each step and EOS after it.
+    """
+    import torch
+    from transformers import GPT2LMHeadModel, LogitsProcessor, LogitsProcessorList
+
+    class ScriptLogitsProcessor(LogitsProcessor):
+        def __init__(self, script_ids: list[int], eos_token_id: int, input_length: int):
+            self.script_ids = script_ids
+            self.eos_token_id = eos_token_id
+            self.input_length = input_length
+
+        def __call__(self, input_ids, scores):
+            step = input_ids.shape[1] - self.input_length
+            if step < len(self.script_ids):
+                token = self.script_ids[step]
+            elif torch.isinf(scores[:, self.eos_token_id]).all():
+                # min_new_tokens forbids stopping yet; benchmarks asking for a fixed
+                # number of new tokens get the random model's own tokens after the script.
+                return scores
+            else:
+                token = self.eos_token_id
+            forced = torch.full_like(scores, float("-inf"))
+            forced[:, token] = 0.0
+            return forced
+
+    class ScriptedGPT2LMHeadModel(GPT2LMHeadModel):
+        script_ids = []
+
+        def generate(self, input_ids=None, logits_processor=None, **kwargs):
+            processors = LogitsProcessorList(logits_processor or [])
+            processors.append(ScriptLogitsProcessor(self.script_ids, self.config.eos_token_id, input_ids.shape[1]))
+            return super().generate(input_ids=input_ids, logits_processor=processors, **kwargs)
+
+    return ScriptedGPT2LMHeadModel
+
+
+def build_tiny_lm(seed: int = 0, n_layer: int = 2, n_embd: int = 64):
+    """
+    Builds a small, randomly initialised GPT-2 and a word-level tokenizer fully
+    offline. Weights depend only on `seed`, but whatever the prompt, generate()
+    writes the same five parseable outfits (see `_SCRIPT`), so the parsing and
+    streaming paths run too. Useful for benchmarks and smoke tests of the
+    generation code paths on CPU.
+    """
+    import torch
+    from tokenizers import Tokenizer, models, pre_tokenizers
+    from transformers import GPT2Config, PreTrainedTokenizerFast
+
+    specials = ["<pad>", "<unk>", "</s>"]
+    vocab = {token: i for i, token in enumerate(specials + _vocabulary())}
+    backend = Tokenizer(models.WordLevel(vocab=vocab, unk_token="<unk>"))
+    backend.pre_tokenizer = pre_tokenizers.WhitespaceSplit()
+    tokenizer = PreTrainedTokenizerFast(
+        tokenizer_object=backend, pad_token="<pad>", unk_token="<unk>", eos_token="</s>"
+    )
+
+    torch.manual_seed(seed)
+    model_config = GPT2Config(
+        vocab_size=len(vocab), n_positions=2048, n_embd=n_embd, n_layer=n_layer, n_head=2,
+        bos_token_id=vocab["</s>"], eos_token_id=vocab["</s>"], pad_token_id=vocab["<pad>"],
+    )
+    model = _scripted_gpt2()(model_config).eval()
+    model.script_ids = [vocab[token] for token in _script_tokens()]
+    return model, tokenizer
+
+
+def load_local_lm(model_path: str | None = None):
+    """Loads a causal LM from a local directory, or the offline tiny model if no path is given."""
+    if model_path is None:
+        return build_tiny_lm()
+    from transformers import AutoModelForCausalLM, AutoTokenizer
+    return AutoModelForCausalLM.from_pretrained(model_path).eval(), AutoTokenizer.from_pretrained(model_path)
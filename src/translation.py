@@ -0,0 +1,129 @@
+import os
+import sqlite3
+import threading
+
+from src import config
+from src import metrics
+
+# Joins a batch into one request; Google Translate keeps line breaks in place.
+_BATCH_SEPARATOR = "\n"
+
+
+# --- Backends ---
+class GoogleTranslateBackend:
+    """Translates through googletrans, sending a whole batch as one request."""
+
+    def __init__(self):
+        from googletrans import Translator
+        self.translator = Translator()
+
+    def translate_batch(self, texts: list[str], dest: str) -> list[tuple[str, str]]:
+        """Returns one `(translated_text, detected_source_language)` per input."""
+        cleaned = [" ".join(t.split()) for t in texts]
+        result = self.translator.translate(_BATCH_SEPARATOR.join(cleaned), dest=dest)
+        lines = result.text.split(_BATCH_SEPARATOR)
+        if len(lines) == len(cleaned):
+            return [(line.strip(), result.src) for line in lines]
+        # The service merged or split lines; fall back to one request per text.
+        print(f"Warning: Batched translation returned {len(lines)} lines for {len(cleaned)} texts. Retrying one by one.")
+        return [(r.text, r.src) for r in (self.translator.translate(t, dest=dest) for t in cleaned)]
+
+
+class IdentityBackend:
+    """Offline stand-in for tests: returns each text unchanged, or from a fixed table."""
+
+    def __init__(self, table: dict | None = None):
+        self.table = table or {}
+        self.calls = 0
+
+    def translate_batch(self, texts: list[str], dest: str) -> list[tuple[str, str]]:
+        self.calls += 1
+        return [(self.table.get((t, dest), t), "auto") for t in texts]
+
+
+# --- Service ---
+_translations = metrics.counter("translations", "Texts translated, by whether the cache or the backend answered.")
+
+class TranslationService:
+    """
+    Batches translations and remembers them in a persistent SQLite cache.
+
+    Every translation is stored in both directions: translating X into `dest`
+    also records that the result translates back to X in X's source language,
+    so round trips (e.g. a garment name shown in Farsi and typed back) are free.
+    """
+
+    def __init__(self, backend, cache_path: str | None = None):
+        self.backend = backend
+        self._lock = threading.Lock()
+        self.stats = {"requests": 0, "backend_calls": 0, "cache_hits": 0, "cache_misses": 0}
+        path = cache_path or ":memory:"
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS translations ("
+            " text TEXT NOT NULL, dest TEXT NOT NULL, translated TEXT NOT NULL,"
+            " PRIMARY KEY (text, dest))"
+        )
+        self._db.commit()
+
+    def _lookup(self, texts: list[str], dest: str) -> dict:
+        found = {}
+        with self._lock:
+            for text in texts:
+                row = self._db.execute(
+                    "SELECT translated FROM translations WHERE text = ? AND dest = ?", (text, dest)
+                ).fetchone()
+                if row is not None:
+                    found[text] = row[0]
+        return found
+
+    def _store(self, pairs: list[tuple[str, str, str, str]]):
+        rows = []
+        for text, dest, translated, src in pairs:
+            rows.append((text, dest, translated))
+            if src and src != "auto" and src != dest:
+                rows.append((translated, src, text))
+        with self._lock:
+            self._db.executemany("INSERT OR REPLACE INTO translations VALUES (?, ?, ?)", rows)
+            self._db.commit()
+
+    def translate_many(self, texts: list[str], dest: str) -> list[str]:
+        """Translates all `texts` into `dest` with at most one backend call."""
+        self.stats["requests"] += 1
+        unique = list(dict.fromkeys(t for t in texts if t and t.strip()))
+        found = self._lookup(unique, dest)
+        missing = [t for t in unique if t not in found]
+        self.stats["cache_hits"] += len(unique) - len(missing)
+        self.stats["cache_misses"] += len(missing)
+        _translations.inc(len(unique) - len(missing), source="cache")
+        _translations.inc(len(missing), source="backend")
+        if missing:
+            self.stats["backend_calls"] += 1
+            with metrics.span("translation_backend"):
+                results = self.backend.translate_batch(missing, dest)
+            self._store([(t, dest, tr, src) for t, (tr, src) in zip(missing, results)])
+            found.update({t: tr for t, (tr, _) in zip(missing, results)})
+        return [found.get(t, t) for t in texts]
+
+    def translate(self, text: str, dest: str) -> str:
+        return self.translate_many([text], dest)[0]
+
+
+_service = None
+_service_lock = threading.Lock()
+
+
+def get_translation_service() -> TranslationService:
+    """Returns the shared translation service configured from `src/config.py`."""
+    global _service
+    if _service is None:
+        with _service_lock:
+            if _service is None:
+                if config.TRANSLATION_BACKEND == "identity":
+                    backend = IdentityBackend()
+                else:
+                    backend = GoogleTranslateBackend()
+                _service = TranslationService(backend, config.TRANSLATION_CACHE_PATH)
+    return _service
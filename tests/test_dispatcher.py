@@ -0,0 +1,39 @@
+# Checks per-chat ordering and the queue positions the bot reports to users.
+
+import threading
+
+from src.dispatcher import Dispatcher
+
+
+def test_positions_count_pool_and_chat_backlog():
+    dispatcher = Dispatcher({"search": (2, 10)})
+    release, finished = threading.Event(), threading.Event()
+    order = []
+
+    def job(name):
+        def run():
+            release.wait(2.0)
+            order.append(name)
+            if name == "1c":
+                finished.set()
+        return run
+
+    # A free worker, but the chat's first job is still running.
+    assert dispatcher.submit(1, job("1a"), pool="search") == 0
+    assert dispatcher.submit(1, job("1b"), pool="search") == 1
+    # Another chat takes the second worker, so chat 1's next job also waits for a worker.
+    assert dispatcher.submit(2, job("2a"), pool="search") == 0
+    assert dispatcher.submit(1, job("1c"), pool="search") == 3
+    release.set()
+    assert finished.wait(2.0)
+    assert [name for name in order if name.startswith("1")] == ["1a", "1b", "1c"]
+    dispatcher.shutdown(wait=True)
+
+
+def test_full_pool_rejects():
+    dispatcher = Dispatcher({"llm": (1, 1)})
+    release = threading.Event()
+    assert dispatcher.submit(1, lambda: release.wait(2.0), pool="llm") == 0
+    assert dispatcher.submit(2, lambda: None, pool="llm") is None
+    release.set()
+    dispatcher.shutdown(wait=True)
@@ -0,0 +1,86 @@
+# Checks the concurrent image fetcher against a local HTTP server that delays
+# or fails selected images. Each image is i+1 pixels wide, so results can be
+# matched back to the URL they came from.
+
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import BytesIO
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+from PIL import Image
+
+from src.image_fetcher import fetch_image_rows, fetch_images
+
+
+class _ImageHandler(BaseHTTPRequestHandler):
+    """Serves /img/<i>?delay=<seconds>&status=<code> as an (i+1) x 1 PNG."""
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        params = parse_qs(url.query)
+        time.sleep(float(params.get("delay", ["0"])[0]))
+        status = int(params.get("status", ["200"])[0])
+        if status != 200:
+            self.send_error(status)
+            return
+        buffer = BytesIO()
+        Image.new("RGB", (int(url.path.rsplit("/", 1)[1]) + 1, 1)).save(buffer, "PNG")
+        body = buffer.getvalue()
+        self.send_response(200)
+        self.send_header("Content-Type", "image/png")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture(scope="module")
+def base_url():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _ImageHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_port}"
+    server.shutdown()
+
+
+def _widths(images):
+    return [img.size[0] - 1 if img is not None else None for img in images]
+
+
+def test_results_keep_url_order(base_url):
+    # Earlier URLs answer later, so completion order is the reverse of URL order.
+    urls = [f"{base_url}/img/{i}?delay={0.05 * (5 - i)}" for i in range(6)]
+    images, stats = fetch_images(urls, deadline=2.0)
+    assert _widths(images) == list(range(6))
+    assert stats == {"served": 6, "timed_out": 0, "failed": 0}
+
+
+def test_counts_served_timed_out_and_failed(base_url):
+    urls = [
+        f"{base_url}/img/0",
+        f"{base_url}/img/1?status=404",
+        f"{base_url}/img/2?delay=1.0",
+        f"{base_url}/img/3",
+    ]
+    start = time.monotonic()
+    images, stats = fetch_images(urls, deadline=0.3)
+    assert time.monotonic() - start < 0.9
+    assert _widths(images) == [0, None, None, 3]
+    assert stats == {"served": 2, "timed_out": 1, "failed": 1}
+
+
+def test_rows_fall_back_to_later_urls(base_url):
+    rows, stats = fetch_image_rows(
+        [
+            [f"{base_url}/img/0?status=404", f"{base_url}/img/1", f"{base_url}/img/2", f"{base_url}/img/3"],
+            [f"{base_url}/img/4", f"{base_url}/img/5?status=500"],
+        ],
+        per_row=3,
+        deadline=2.0,
+    )
+    assert [_widths(row) for row in rows] == [[1, 2, 3], [4]]
+    assert stats == {"served": 4, "timed_out": 0, "failed": 2}
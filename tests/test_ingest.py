@@ -0,0 +1,30 @@
+# Checks how catalog chunks are turned into ids and metadata.
+
+import numpy as np
+import pandas as pd
+
+from src.ingest import prepare_chunk
+
+
+def _chunk(**columns) -> pd.DataFrame:
+    rows = len(next(iter(columns.values())))
+    return pd.DataFrame({"name": [f"item {i}" for i in range(rows)], "gender": ["Women"] * rows, **columns})
+
+
+def test_float_ids_keep_their_integer_form():
+    batch = prepare_chunk(_chunk(p_id=[123.0, 4.0, np.nan], price=[10, 20, 30]), start_index=0)
+    assert batch.ids == ["123", "4"]
+    assert [m["product_id"] for m in batch.metadatas] == ["123", "4"]
+
+
+def test_rows_without_id_or_price_are_skipped():
+    batch = prepare_chunk(_chunk(p_id=["a", None, " ", "d", "e"], price=[1, 2, 3, None, "n/a"]), start_index=10)
+    assert batch.ids == ["a"]
+    # Kept rows keep their catalog position.
+    assert [m["index_in_db"] for m in batch.metadatas] == [10]
+
+
+def test_row_position_is_the_id_without_an_id_column():
+    batch = prepare_chunk(_chunk(price=[1.5, None, 3.0]), start_index=5)
+    assert batch.ids == ["5", "7"]
+    assert [m["price"] for m in batch.metadatas] == [1.5, 3.0]
@@ -0,0 +1,68 @@
+# Feeds model outputs to the streaming outfit parser the way generation does,
+# one line at a time and then once more at EOS, and checks that it yields the
+# same outfits as parsing the finished text.
+
+import pytest
+
+from src.llm import OutfitStreamParser, _finalize_outfits
+
+
+def _outfit_block(number: int, fields: list[tuple[str, str]]) -> str:
+    return f"{number}. Outfit:\n" + "".join(f"- {key}: {value}\n" for key, value in fields)
+
+
+def _fields(i: int, order=("Top", "Bottom", "Shoes", "Accessories")) -> list[tuple[str, str]]:
+    return [(key, f"{key.lower()} {i}") for key in order]
+
+
+def _stream(text: str, num_outfits: int = 5) -> list[dict]:
+    parser = OutfitStreamParser(num_outfits)
+    for end, char in enumerate(text, start=1):
+        if char == "\n" and not parser.done:
+            parser.update(text[:end])
+    if not parser.done:
+        parser.update(text, finished=True)
+    return parser.outfits
+
+
+WELL_FORMED = "Here are five outfits:\n" + "".join(_outfit_block(i, _fields(i)) for i in range(1, 6))
+# Shoes comes after the required fields, so the last outfit must wait for it.
+REORDERED = "".join(
+    _outfit_block(i, _fields(i, order=("Top", "Bottom", "Accessories", "Shoes"))) for i in range(1, 6)
+)
+EMPTY_BLOCK = (
+    _outfit_block(1, _fields(1)) + "2. Outfit:\n\n" + "".join(_outfit_block(i, _fields(i)) for i in range(3, 7))
+)
+REPEATING_TAIL = "".join(_outfit_block(i, _fields(i)) for i in (1, 2, 3, 1, 2, 3, 1))
+NO_FINAL_NEWLINE = (_outfit_block(1, _fields(1)) + _outfit_block(2, _fields(2))).rstrip("\n")
+EXTRA_FIELD_LATE = _outfit_block(1, _fields(1)) + _outfit_block(2, _fields(2) + [("Outerwear", "coat")])
+
+
+@pytest.mark.parametrize("text", [WELL_FORMED, REORDERED, EMPTY_BLOCK, REPEATING_TAIL, NO_FINAL_NEWLINE,
+                                  EXTRA_FIELD_LATE],
+                         ids=["well_formed", "reordered", "empty_block", "repeating_tail", "no_final_newline",
+                              "extra_field_late"])
+def test_streaming_matches_final_parse(text):
+    assert _stream(text) == _finalize_outfits(text)
+
+
+def test_last_outfit_keeps_fields_after_required_ones():
+    outfits = _stream(REORDERED)
+    assert len(outfits) == 5
+    assert outfits[-1]["Shoes"] == "shoes 5"
+
+
+def test_empty_block_does_not_stop_streaming():
+    assert [outfit["Top"] for outfit in _stream(EMPTY_BLOCK)] == [f"top {i}" for i in (1, 3, 4, 5, 6)]
+
+
+def test_repeating_tail_stops_at_the_first_repeat():
+    assert [outfit["Top"] for outfit in _stream(REPEATING_TAIL)] == ["top 1", "top 2", "top 3"]
+
+
+def test_last_outfit_completes_without_a_next_header():
+    # Generation can stop at the fifth outfit's last line without waiting for more text.
+    text = "".join(_outfit_block(i, _fields(i)) for i in range(1, 6))
+    parser = OutfitStreamParser(5)
+    parser.update(text)
+    assert parser.done and len(parser.outfits) == 5
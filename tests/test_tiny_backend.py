@@ -0,0 +1,34 @@
+# Runs outfit generation end to end through the offline "tiny" inference
+# backend: prompt formatting, the prefix cache, batched and unbatched
+# generate() calls, streaming with early stopping, and the final parse.
+
+import pytest
+
+from src import config
+from src.llm import get_outfit_recommendation, load_llm_and_tokenizer
+
+
+@pytest.fixture(scope="module")
+def tiny_llm():
+    return load_llm_and_tokenizer("tiny")
+
+
+@pytest.mark.parametrize("batching", [True, False])
+def test_tiny_backend_writes_parseable_outfits(tiny_llm, monkeypatch, batching):
+    monkeypatch.setattr(config, "GENERATION_BATCHING", batching)
+    model, tokenizer = tiny_llm
+    streamed = []
+    outfits = get_outfit_recommendation(
+        "Slim, 30 years old, likes neutral colors", "wedding", model, tokenizer, on_outfit=streamed.append
+    )
+    assert len(outfits) == config.NUM_OUTFITS
+    assert outfits[0] == {"Top": "white linen shirt", "Bottom": "navy chinos",
+                          "Shoes": "white sneakers", "Accessories": "watch"}
+    assert all(set(outfit) == {"Top", "Bottom", "Shoes", "Accessories"} for outfit in outfits)
+    assert streamed == outfits
+
+
+def test_tiny_backend_is_deterministic(tiny_llm):
+    model, tokenizer = tiny_llm
+    first = get_outfit_recommendation("Tall", "party", model, tokenizer)
+    assert get_outfit_recommendation("Short, prefers dark colors", "job interview", model, tokenizer) == first
@@ -0,0 +1,57 @@
+# Checks that spans recorded on worker threads end up in the request's trace.
+
+import json
+import threading
+
+import pytest
+
+from src import config, metrics
+from src.image_fetcher import fetch_images
+
+
+@pytest.fixture
+def trace_log(tmp_path, monkeypatch):
+    monkeypatch.setattr(config, "METRICS_ENABLED", True)
+    monkeypatch.setattr(config, "TRACE_LOG_PATH", str(tmp_path / "traces.jsonl"))
+    monkeypatch.setattr(metrics, "_trace_file", None)
+    return tmp_path / "traces.jsonl"
+
+
+def _spans(trace_log) -> list[list[str]]:
+    metrics._trace_file.close()
+    with open(trace_log, encoding="utf-8") as f:
+        return [[span["stage"] for span in json.loads(line)["spans"]] for line in f]
+
+
+def test_fetch_pool_spans_join_the_trace(trace_log):
+    def loader(url, size, timeout, deadline, session):
+        with metrics.span("loader"):
+            return url
+
+    with metrics.trace("search", chat_id=1):
+        fetch_images(["a", "b"], loader=loader)
+    with metrics.span("untraced"):
+        pass
+    assert _spans(trace_log) == [["loader", "loader"]]
+
+
+def test_batched_spans_join_every_request_trace(trace_log):
+    from src.generation_scheduler import GenerationScheduler
+    from src.tiny_lm import build_tiny_lm
+
+    model, tokenizer = build_tiny_lm()
+    scheduler = GenerationScheduler(model, tokenizer, max_batch_size=2, max_wait=5.0,
+                                    generate_kwargs=dict(max_new_tokens=4))
+
+    def request(chat_id):
+        with metrics.trace("outfits", chat_id=chat_id):
+            scheduler.generate("Outfit for a wedding", timeout=30)
+
+    # Both requests wait in their traces for the one batch that serves them.
+    threads = [threading.Thread(target=request, args=(chat_id,)) for chat_id in (1, 2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    scheduler.close()
+    assert _spans(trace_log) == [["llm_generate"], ["llm_generate"]]